@@ -85,6 +85,8 @@ class MyData(MyApp):
         parser.add_argument("-l", "--loglevel", help="set logging verbosity")
         parser.add_argument("--autoexit", action="store_true",
                             help="Exit upon completion of scans and uploads")
+        parser.add_argument("--full-rescan", action="store_true",
+                            help="Ignore the scan index for the first scan")
         args, _ = parser.parse_known_args(argv[1:])
         if args.version:
             sys.stdout.write("MyData %s (%s)\n" % (VERSION, LATEST_COMMIT))
@@ -99,6 +101,7 @@ class MyData(MyApp):
             elif args.loglevel.upper() == "ERROR":
                 logger.SetLevel(logging.ERROR)
         SETTINGS.miscellaneous.autoexit = args.autoexit
+        SETTINGS.miscellaneous.fullRescan = args.full_rescan
 
     def OnInit(self):
         """
@@ -19,24 +19,35 @@ import wx.dataview
 
 import mydata.views.messages
 from ..dataviewmodels.dataview import DATAVIEW_MODELS
+from ..dataviewmodels.dataview import UI_UPDATE_BUS
 from ..events import MYDATA_EVENTS
 from ..events import PostEvent
 from ..events.stop import CheckIfShouldAbort
 from ..events import MYDATA_THREADS
 from ..settings import SETTINGS
 from ..models.experiment import ExperimentModel
+from ..models.datafile import DATAFILE_CREATION_BATCHER
 from ..models.dataset import DatasetModel
 from ..logs import logger
 from ..logs.testrun import LogTestRunSummary
 from ..utils import EndBusyCursorIfRequired
 from ..utils import SafeStr
+from ..utils.checksums import CHECKSUM_CACHE
 from ..utils.exceptions import StorageBoxAttributeNotFound
 from ..utils.openssh import CleanUpScpAndSshProcesses
+from ..utils.openssh import OPENSSH
+from ..utils.openssh import PERMISSIONS_BATCHER
+from ..utils.openssh import StopControlMasters
+from ..utils.router import UPLOAD_ROUTER
+from ..utils.session import SESSION
+from ..utils.sshsessions import SSH_SESSION_POOL
+from ..utils.tarbatches import SMALL_FILE_BATCHER
 from ..threads.flags import FLAGS
 from ..threads.locks import LOCKS
 from .uploads import UploadMethod
 from .uploads import UploadDatafileRunnable
 from .verifications import VerifyDatafileRunnable
+from .watch import WatchController
 
 if sys.platform.startswith("linux"):
     from ..linuxsubprocesses import StartErrandBoy
@@ -66,6 +77,9 @@ class FoldersController(object):
         self.numVerificationsToBePerformed = 0
         self.uploadsAcknowledged = 0
         self.uploadMethod = UploadMethod.HTTP_POST
+        # Set to True if the MyTardis server won't create DataFile records
+        # without MD5 sums, so they can't be calculated while uploading:
+        self.checksumRequiredUpFront = False
 
         # These will get overwritten in InitForUploads, but we need
         # to initialize them here, so that ShutDownUploadThreads()
@@ -77,6 +91,9 @@ class FoldersController(object):
 
         self.countCompletedTimer = None
 
+        # Used with the "Watch" schedule type:
+        self.watchController = WatchController(self)
+
     @property
     def started(self):
         """
@@ -228,7 +245,34 @@ class FoldersController(object):
         self.numVerificationsToBePerformed = 0
         self.uploadsAcknowledged = 0
         self.finishedCountingVerifications = dict()
+        self.checksumRequiredUpFront = False
         SETTINGS.InitializeVerifiedDatafilesCache(True)
+        if SETTINGS.miscellaneous.useChecksumCache:
+            CHECKSUM_CACHE.Load(SETTINGS.checksumCachePath,
+                                SETTINGS.miscellaneous.checksumCacheSize)
+        SESSION.Configure()
+        SESSION.ResetConnectionCounts()
+        SSH_SESSION_POOL.idleTimeout = \
+            SETTINGS.miscellaneous.sshSessionIdleTimeout
+        # ControlMaster connections are started by the first upload to each
+        # staging host, so forget any from previous uploads (including
+        # failures to start them), in case the staging host has changed:
+        StopControlMasters()
+        OPENSSH.ClearRemoteDirs()
+        SMALL_FILE_BATCHER.Configure(
+            SETTINGS.miscellaneous.smallFileBatchThreshold,
+            SETTINGS.miscellaneous.smallFileBatchBytes)
+        DATAFILE_CREATION_BATCHER.Configure(
+            SETTINGS.miscellaneous.dataFileCreationBatchSize)
+        UPLOAD_ROUTER.Configure(
+            SETTINGS.miscellaneous.postUploadMaxSize,
+            SETTINGS.miscellaneous.chunkedUploadMinSize)
+        if SETTINGS.schedule.scheduleType == "Watch" and \
+                not FLAGS.testRunRunning:
+            # Start watching before scanning, so that files created during
+            # the scan aren't missed.  Files found by both the scan and the
+            # watcher will only be uploaded once.
+            self.watchController.StartWatching()
 
         if wx.PyApp.IsMainLoopRunning():
             for i in range(self.numVerificationWorkerThreads):
@@ -270,6 +314,16 @@ class FoldersController(object):
                 _ = uploadToStagingRequest.scpUsername
                 logger.info("Uploads to staging have been approved.")
                 self.uploadMethod = UploadMethod.VIA_STAGING
+                localStagingPath = SETTINGS.miscellaneous.localStagingPath
+                if localStagingPath and os.path.isdir(localStagingPath):
+                    logger.info("Copying files to staging via %s"
+                                % localStagingPath)
+                    self.uploadMethod = UploadMethod.LOCAL_COPY
+                elif localStagingPath:
+                    logger.warning(
+                        "The local staging path, %s, isn't accessible, so "
+                        "files will be uploaded to staging with SSH."
+                        % localStagingPath)
             except StorageBoxAttributeNotFound as err:
                 message = SafeStr(err)
                 logger.error(message)
@@ -287,8 +341,7 @@ class FoldersController(object):
                 "approval from your MyTardis administrator.\n\n" \
                 "A request has been sent, and you will be contacted " \
                 "once the request has been approved. Until then, " \
-                "MyData will upload files using HTTP POST, and will " \
-                "only upload one file at a time.\n\n" \
+                "MyData will upload files using HTTP POST.\n\n" \
                 "HTTP POST is generally only suitable for small " \
                 "files (up to 100 MB each)."
             logger.warning(message)
@@ -298,13 +351,6 @@ class FoldersController(object):
                     message=message,
                     icon=wx.ICON_WARNING))
             self.uploadMethod = UploadMethod.HTTP_POST
-        if self.uploadMethod == UploadMethod.HTTP_POST and \
-                self.numUploadWorkerThreads > 1:
-            logger.warning(
-                "Using HTTP POST, so setting "
-                "numUploadWorkerThreads to 1, "
-                "because urllib2 is not thread-safe.")
-            self.numUploadWorkerThreads = 1
 
         self.uploadWorkerThreads = []
         if wx.PyApp.IsMainLoopRunning():
@@ -334,6 +380,8 @@ class FoldersController(object):
             wx.CallAfter(self.countCompletedTimer.Start, 500)
             wx.CallAfter(self.parent.dataViews['verifications']
                          .updateCacheHitSummaryTimer.Start, 500)
+            wx.CallAfter(UI_UPDATE_BUS.Start, self.parent,
+                         SETTINGS.miscellaneous.uiRefreshRate)
 
     def StopTimers(self):
         """
@@ -352,6 +400,7 @@ class FoldersController(object):
                 .updateCacheHitSummaryTimer.Stop()
             self.parent.dataViews['verifications'].UpdateCacheHitSummary(None)
             self.countCompletedTimer.Stop()
+            UI_UPDATE_BUS.Stop()
 
     def ClearStatusFlags(self):
         """
@@ -417,8 +466,6 @@ class FoldersController(object):
                     threading.Event()
             if self.IsShuttingDown() or CheckIfShouldAbort():
                 return
-            with LOCKS.numVerificationsToBePerformed:
-                self.numVerificationsToBePerformed += folderModel.numFiles
             logger.debug(
                 "StartUploadsForFolder: Starting verifications "
                 "and uploads for folder: " + folderModel.folderName)
@@ -504,11 +551,13 @@ class FoldersController(object):
             with LOCKS.finishedCounting:
                 self.finishedCountingVerifications[folderModel].set()
             if DATAVIEW_MODELS['folders'].GetRowCount() == 0 or \
-                    self.numVerificationsToBePerformed == 0:
-                # For the case of zero folders or zero files, we
-                # can't use the usual triggers (e.g. datafile
-                # upload complete) to determine when to check if
-                # we have finished:
+                    self.numVerificationsToBePerformed == 0 or \
+                    wx.PyApp.IsMainLoopRunning():
+                # For the case of zero folders or zero files, or when all
+                # of this folder's verifications completed before its scan
+                # finished, we can't use the usual triggers (e.g. datafile
+                # upload complete) to determine when to check if we have
+                # finished:
                 wx.CallAfter(
                     self.CountCompletedUploadsAndVerifications, event=None)
         except:
@@ -602,10 +651,12 @@ class FoldersController(object):
                 DATAVIEW_MODELS['folders'].FolderStatusUpdated(folder)
             DATAVIEW_MODELS['folders'].foldersToUpdate.clear()
 
+        if self.watchController.pendingWatchedFiles:
+            self.watchController.AddWatchedFiles([])
+
         numVerificationsCompleted = \
             DATAVIEW_MODELS['verifications'].GetCompletedCount()
 
-
         uploadsToBePerformed = DATAVIEW_MODELS['verifications'].GetNotFoundCount() + \
             DATAVIEW_MODELS['verifications'].GetFoundUnverifiedNotFullSizeCount()
 
@@ -630,7 +681,7 @@ class FoldersController(object):
         # Use lock to avoid "dictionary changed size during iteration" error:
         with LOCKS.finishedCounting:
             for folder in self.finishedCountingVerifications:
-                if not self.finishedCountingVerifications[folder]:
+                if not self.finishedCountingVerifications[folder].isSet():
                     finishedVerificationCounting = False
                     break
 
@@ -639,6 +690,15 @@ class FoldersController(object):
                 and (uploadsProcessed == uploadsToBePerformed or
                      FLAGS.testRunRunning and
                      self.uploadsAcknowledged == uploadsToBePerformed):
+            if self.watcher:
+                # Keep the upload threads running until the user stops
+                # watching for new files:
+                if hasattr(wx.GetApp(), "frame"):
+                    wx.GetApp().frame.SetStatusMessage(
+                        "Uploaded %d of %d files.  Watching %s for new "
+                        "files..." % (uploadsCompleted, uploadsToBePerformed,
+                                      self.watcher.rootPath))
+                return
             logger.debug("All datafile verifications and uploads "
                          "have completed.")
             logger.debug("Shutting down upload and verification threads.")
@@ -671,10 +731,13 @@ class FoldersController(object):
         assert threading.current_thread().name == "MainThread"
 
         self.SetShuttingDown(True)
+        self.watchController.StopWatching()
         app = wx.GetApp()
         if SETTINGS.miscellaneous.cacheDataFileLookups:
             threading.Thread(
                 target=SETTINGS.SaveVerifiedDatafilesCache).start()
+        if SETTINGS.miscellaneous.useChecksumCache:
+            threading.Thread(target=CHECKSUM_CACHE.Save).start()
         # Reset self.started so that scheduled tasks know that's OK to start
         # new scan-and-upload tasks:
         self.started = False
@@ -722,6 +785,17 @@ class FoldersController(object):
             CleanUpScpAndSshProcesses()
         for thread in self.uploadWorkerThreads:
             thread.join()
+        if self.uploadMethod == UploadMethod.VIA_STAGING:
+            # Upload workers could have started new ControlMaster
+            # connections after the clean-up above, before they stopped:
+            StopControlMasters()
+        SESSION.CloseThreadSessions()
+        # Upload workers hand small files over to the batcher, so wait for
+        # their batches to be sent (or skipped, if canceled):
+        SMALL_FILE_BATCHER.Stop()
+        # Now that no upload can return a session to the pool, its sessions
+        # (and the remote directories they have created) can be forgotten:
+        threading.Thread(target=SSH_SESSION_POOL.CloseAll).start()
         logger.debug("Shutting down FoldersController verification "
                      "worker threads.")
         for _ in range(self.numVerificationWorkerThreads):
@@ -732,6 +806,10 @@ class FoldersController(object):
         logger.debug("Joining remaining threads...")
         MYDATA_THREADS.Join()
         logger.debug("Joined remaining threads.")
+        SESSION.LogConnectionCounts()
+        PERMISSIONS_BATCHER.LogCounts()
+        DATAFILE_CREATION_BATCHER.LogCounts()
+        UPLOAD_ROUTER.LogStats()
 
         if FLAGS.testRunRunning:
             LogTestRunSummary()
@@ -798,12 +876,25 @@ class FoldersController(object):
     def VerifyDatafiles(self, folderModel):
         """
         Verify datafiles in the specified folder
+
+        If the folder is still being scanned, its files are verified in
+        batches as they are found, so numVerificationsToBePerformed grows
+        until the scan has finished.
         """
-        for dfi in range(0, folderModel.numFiles):
-            if self.IsShuttingDown():
+        for batch in folderModel.DataFileBatches():
+            if self.IsShuttingDown() or CheckIfShouldAbort():
                 return
-            verifyDatafileRunnable = VerifyDatafileRunnable(folderModel, dfi)
-            if wx.PyApp.IsMainLoopRunning():
-                self.verificationsQueue.put(verifyDatafileRunnable)
-            else:
-                verifyDatafileRunnable.Run()
+            if not batch:
+                continue
+            with LOCKS.numVerificationsToBePerformed:
+                self.numVerificationsToBePerformed += len(batch)
+            DATAVIEW_MODELS['folders'].FolderStatusUpdated(folderModel)
+            for dfi in batch:
+                if self.IsShuttingDown():
+                    return
+                verifyDatafileRunnable = \
+                    VerifyDatafileRunnable(folderModel, dfi)
+                if wx.PyApp.IsMainLoopRunning():
+                    self.verificationsQueue.put(verifyDatafileRunnable)
+                else:
+                    verifyDatafileRunnable.Run()
@@ -12,6 +12,7 @@ import time
 import wx
 
 from ..dataviewmodels.dataview import DATAVIEW_MODELS
+from ..events import MYDATA_EVENTS
 from ..events.start import StartScansAndUploads
 from ..settings import SETTINGS
 from ..models.task import TaskModel
@@ -79,6 +80,8 @@ class ScheduleController(object):
                 ScheduleController.CreateWeeklyTask(event, needToValidateSettings)
             elif scheduleType == "Timer":
                 ScheduleController.CreateTimerTask(event, needToValidateSettings)
+            elif scheduleType == "Watch":
+                ScheduleController.CreateWatchTask(event, needToValidateSettings)
         logger.debug("Finished processing schedule type.")
 
     @staticmethod
@@ -267,3 +270,32 @@ class ScheduleController(object):
         ScheduleController.CreateTask(
             event, needToValidateSettings, startTime, scheduleType, msg,
             intervalMinutes=intervalMinutes)
+
+    @staticmethod
+    def CreateWatchTask(event, needToValidateSettings):
+        """
+        Create a task to scan the data directory once, and then continue
+        watching it for new files, uploading them once they have settled,
+        until the scans and uploads are stopped.
+        """
+        scheduleType = "Watch"
+        logger.debug("Schedule type is Watch.")
+        if event and event.GetEventType() == \
+                MYDATA_EVENTS.EVT_SHUTDOWN_FOR_REFRESH:
+            # The existing scans and uploads are being restarted (along
+            # with watching for new files), so we don't need another task:
+            return
+        if SETTINGS.lastSettingsUpdateTrigger == \
+                LastSettingsUpdateTrigger.READ_FROM_DISK:
+            startTime = datetime.now() + timedelta(seconds=5)
+        else:
+            # LastSettingsUpdateTrigger.UI_RESPONSE
+            startTime = datetime.now() + timedelta(seconds=1)
+        timeString = startTime.strftime("%I:%M:%S %p")
+        dateString = \
+            "{d:%A} {d.day}/{d.month}/{d.year}".format(d=startTime)
+        msg = ("The \"%s\" task is scheduled "
+               "to run at %s on %s (and then watch for new files)" %
+               (JOB_DESC, timeString, dateString))
+        ScheduleController.CreateTask(
+            event, needToValidateSettings, startTime, scheduleType, msg)
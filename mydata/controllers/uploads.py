@@ -2,7 +2,9 @@
 The main controller class for managing datafile uploads.
 """
 import os
+import posixpath
 import json
+import hashlib
 import traceback
 import mimetypes
 import threading
@@ -19,11 +21,20 @@ from ..models.settings.miscellaneous import MiscellaneousSettingsModel
 from ..models.upload import UploadModel
 from ..models.upload import UploadStatus
 from ..models.datafile import DataFileModel
+from ..models.datafile import DATAFILE_CREATION_BATCHER
 from ..threads.flags import FLAGS
 from ..threads.locks import LOCKS
 from ..utils import SafeStr
+from ..utils.checksums import CHECKSUM_CACHE
 from ..utils.exceptions import SshException
 from ..utils.exceptions import StorageBoxAttributeNotFound
+from ..utils.exceptions import UploadFailed
+from ..utils.localcopy import CopyFileToStaging
+from ..utils.localcopy import GetLocalStagingPath
+from ..utils import router
+from ..utils.router import UPLOAD_ROUTER
+from ..utils.tarbatches import BatchedFile
+from ..utils.tarbatches import SMALL_FILE_BATCHER
 from ..events import MYDATA_EVENTS
 from ..events import PostEvent
 from ..logs import logger
@@ -80,6 +91,8 @@ class UploadDatafileRunnable(object):
         self.folderModel = folderModel
         self.dataFileIndex = dataFileIndex
         self.uploadModel = None
+        self.uploadMethod = None
+        self.transport = None
         self.existingUnverifiedDatafile = existingUnverifiedDatafile
         self.verificationModel = verificationModel
         self.bytesUploadedPreviously = bytesUploadedPreviously
@@ -88,7 +101,8 @@ class UploadDatafileRunnable(object):
     def Run(self):
         """
         Upload the file specified by the folderModel and dataFileIndex
-        using foldersController.uploadMethod
+        using foldersController.uploadMethod, or HTTP POST for tiny files
+        (see ChooseTransport)
         """
         # pylint: disable=too-many-statements
         # pylint: disable=too-many-branches
@@ -107,9 +121,11 @@ class UploadDatafileRunnable(object):
 
         dataFilePath = self.folderModel.GetDataFilePath(self.dataFileIndex)
 
-        if not os.path.exists(dataFilePath) or \
+        # Stat the file again, in case it has changed since it was scanned:
+        fileStat = self.folderModel.RefreshDataFileStat(self.dataFileIndex)
+        if not fileStat or \
                 self.folderModel.FileIsTooNewToUpload(self.dataFileIndex):
-            if not os.path.exists(dataFilePath):
+            if not fileStat:
                 message = ("Not uploading file, because it has been "
                            "moved, renamed or deleted.")
             else:
@@ -129,12 +145,14 @@ class UploadDatafileRunnable(object):
         uploadsModel.SetMessage(self.uploadModel, message)
         dataFileSize = self.folderModel.GetDataFileSize(self.dataFileIndex)
         self.uploadModel.fileSize = dataFileSize
+        self.ChooseTransport(dataFileSize)
 
         if foldersController.IsShuttingDown():
             return
 
         dataFileMd5Sum = None
-        if foldersController.uploadMethod == UploadMethod.HTTP_POST or \
+        hashWhileUploading = False
+        if self.uploadMethod == UploadMethod.HTTP_POST or \
                 not self.existingUnverifiedDatafile:
             message = "Calculating MD5 checksum..."
             uploadsModel.SetMessage(self.uploadModel, message)
@@ -143,11 +161,14 @@ class UploadDatafileRunnable(object):
                 dataFileMd5Sum = MiscellaneousSettingsModel.GetFakeMd5Sum()
                 logger.warning("Faking MD5 sum for %s" % dataFilePath)
             else:
-                dataFileMd5Sum = \
-                    self.folderModel.CalculateMd5Sum(
-                        self.dataFileIndex,
-                        progressCallback=self.Md5ProgressCallback,
-                        canceledCallback=self.CanceledCallback)
+                dataFileMd5Sum = self.GetCachedMd5Sum()
+                if not dataFileMd5Sum and self.CanHashWhileUploading():
+                    # The MD5 sum will be calculated from the data being
+                    # uploaded, and added to the DataFile record afterwards:
+                    hashWhileUploading = True
+                    dataFileMd5Sum = ""
+                elif not dataFileMd5Sum:
+                    dataFileMd5Sum = self.CalculateMd5Sum()
 
             if self.uploadModel.canceled:
                 foldersController.canceled = True
@@ -157,6 +178,9 @@ class UploadDatafileRunnable(object):
                 return
         else:
             dataFileSize = int(self.existingUnverifiedDatafile.size)
+            if not self.existingUnverifiedDatafile.md5sum and \
+                    not self.AddMissingMd5Sum():
+                return
 
         self.uploadModel.SetProgress(0)
         uploadsModel.UploadProgressUpdated(self.uploadModel)
@@ -165,7 +189,7 @@ class UploadDatafileRunnable(object):
             return
 
         dataFileDict = None
-        if foldersController.uploadMethod == UploadMethod.HTTP_POST or \
+        if self.uploadMethod == UploadMethod.HTTP_POST or \
                 not self.existingUnverifiedDatafile:
             message = "Checking MIME type..."
             uploadsModel.SetMessage(self.uploadModel, message)
@@ -205,15 +229,132 @@ class UploadDatafileRunnable(object):
         self.uploadModel.startTime = datetime.now()
 
         try:
-            if foldersController.uploadMethod == UploadMethod.HTTP_POST:
+            if self.uploadMethod == UploadMethod.HTTP_POST:
                 self.UploadFileWithPost(dataFileDict)
             else:
-                self.UploadFileToStaging(dataFileDict)
+                self.UploadFileToStaging(dataFileDict, hashWhileUploading)
         except Exception as err:
             logger.error(traceback.format_exc())
             self.FinalizeUpload(uploadSuccess=False, message=SafeStr(err))
             return
 
+    def ChooseTransport(self, dataFileSize):
+        """
+        Choose the upload method (self.uploadMethod) and the transport
+        (self.transport) for this file.  When uploads to staging have been
+        approved, UPLOAD_ROUTER chooses the transport from the file's size,
+        which can be HTTP POST for tiny files.
+        """
+        self.uploadMethod = wx.GetApp().foldersController.uploadMethod
+        if self.uploadMethod == UploadMethod.HTTP_POST:
+            self.transport = router.HTTP_POST
+        elif self.uploadMethod == UploadMethod.LOCAL_COPY:
+            self.transport = router.LOCAL_COPY
+        else:
+            # A DataFile record created for staging must be completed by
+            # uploading to staging:
+            self.transport = UPLOAD_ROUTER.ChooseTransport(
+                SETTINGS.advanced.uploadMethod, dataFileSize,
+                canPost=not self.existingUnverifiedDatafile)
+            if self.transport == router.HTTP_POST:
+                self.uploadMethod = UploadMethod.HTTP_POST
+
+    def AddMissingMd5Sum(self):
+        """
+        Add the MD5 sum to an existing DataFile record which doesn't have
+        one, e.g. because it was created for hashing while uploading, but
+        the upload failed before the MD5 sum was added.  Without it, the
+        re-uploaded file could never be verified.
+
+        Returns False if the upload was canceled or failed.
+        """
+        uploadsModel = DATAVIEW_MODELS['uploads']
+        uploadsModel.SetMessage(self.uploadModel, "Calculating MD5 checksum...")
+        if SETTINGS.miscellaneous.fakeMd5Sum:
+            md5sum = MiscellaneousSettingsModel.GetFakeMd5Sum()
+        else:
+            md5sum = self.GetCachedMd5Sum() or self.CalculateMd5Sum()
+        if self.uploadModel.canceled or not md5sum:
+            if self.uploadModel.canceled:
+                wx.GetApp().foldersController.canceled = True
+            logger.debug("Upload for \"%s\" was canceled "
+                         "before it began uploading." %
+                         self.uploadModel.GetRelativePathToUpload())
+            return False
+        try:
+            DataFileModel.UpdateMd5Sum(
+                self.existingUnverifiedDatafile.datafileId, md5sum)
+        except requests.exceptions.RequestException as err:
+            logger.error(traceback.format_exc())
+            self.FinalizeUpload(uploadSuccess=False, message=SafeStr(err))
+            return False
+        self.existingUnverifiedDatafile.md5sum = md5sum
+        return True
+
+    def GetCachedMd5Sum(self):
+        """
+        Return the file's MD5 sum from the checksum cache, or None if it
+        isn't cached (or has been modified since it was cached).
+        """
+        if not SETTINGS.miscellaneous.useChecksumCache:
+            return None
+        dataFilePath = self.folderModel.GetDataFilePath(self.dataFileIndex)
+        md5sum = CHECKSUM_CACHE.Get(
+            dataFilePath, self.folderModel.GetDataFileStat(self.dataFileIndex))
+        if md5sum:
+            logger.debug("Using cached MD5 sum for %s" % dataFilePath)
+        return md5sum
+
+    def CalculateMd5Sum(self):
+        """
+        Calculate the file's MD5 sum, and record it in the checksum cache.
+        Returns None if the upload is canceled.
+        """
+        md5sum = self.folderModel.CalculateMd5Sum(
+            self.dataFileIndex,
+            progressCallback=self.Md5ProgressCallback,
+            canceledCallback=self.CanceledCallback)
+        self.CacheMd5Sum(md5sum)
+        return md5sum
+
+    def CacheMd5Sum(self, md5sum):
+        """
+        Record the file's MD5 sum in the checksum cache
+        """
+        if SETTINGS.miscellaneous.useChecksumCache and md5sum and \
+                not self.uploadModel.canceled:
+            CHECKSUM_CACHE.Put(
+                self.folderModel.GetDataFilePath(self.dataFileIndex),
+                self.folderModel.GetDataFileStat(self.dataFileIndex),
+                md5sum)
+
+    def CanHashWhileUploading(self):
+        """
+        Return True if the file's MD5 sum can be calculated from the data
+        being uploaded, instead of reading the file before uploading it.
+
+        This requires an upload method which reads the file in MyData's
+        process ("Chunked" or "ParallelSSH", or LOCAL_COPY, which then
+        copies the file via a buffer instead of in the kernel), and a new
+        DataFile record which can be created without an MD5 sum, and
+        updated afterwards.
+        """
+        foldersController = wx.GetApp().foldersController
+        return SETTINGS.miscellaneous.hashWhileUploading and \
+            (self.uploadMethod == UploadMethod.LOCAL_COPY or
+             (self.uploadMethod == UploadMethod.VIA_STAGING and
+              self.transport in ("Chunked", "ParallelSSH"))) \
+            and not self.existingUnverifiedDatafile and \
+            not foldersController.checksumRequiredUpFront
+
+    def UpdateMd5Sum(self, md5sum):
+        """
+        Called when the MD5 sum has been calculated while uploading, before
+        the upload is completed and verification is requested.
+        """
+        DataFileModel.UpdateMd5Sum(self.uploadModel.dataFileId, md5sum)
+        self.CacheMd5Sum(md5sum)
+
     def CanceledCallback(self):
         """
         Called by MD5 calculation method to check whether uploads
@@ -229,7 +370,7 @@ class UploadDatafileRunnable(object):
         if self.uploadModel.canceled:
             wx.GetApp().foldersController.canceled = True
             return
-        size = self.folderModel.GetDataFileSize(self.dataFileIndex)
+        size = self.uploadModel.fileSize
         if size > 0:
             percentComplete = 100.0 - ((size - bytesSummed) * 100.0) / size
         else:
@@ -298,9 +439,11 @@ class UploadDatafileRunnable(object):
                 self.uploadModel, ProgressCallback)
             self.FinalizeUpload(uploadSuccess=True)
             return
-        except TypeError as err:
+        except (TypeError, ValueError) as err:
             errString = SafeStr(err)
-            if "unsupported operand type(s)" in errString:
+            if "unsupported operand type(s)" in errString or \
+                    (self.uploadModel.canceled and
+                     "I/O operation on closed file" in errString):
                 # This is how requests-toolbelt reacts if we close
                 # the file it's trying to upload in order to cancel it.
                 logger.debug("Aborting upload for \"%s\" because "
@@ -334,21 +477,47 @@ class UploadDatafileRunnable(object):
                 MYDATA_EVENTS.ShowMessageDialogEvent(
                     title="MyData", message=message, icon=wx.ICON_ERROR))
 
-    def UploadFileToStaging(self, dataFileDict):
+    def UploadFileToStaging(self, dataFileDict, hashWhileUploading=False):
         """
         Upload a file to staging (Using SCP).
+
+        If hashWhileUploading is True, the DataFile record is created without
+        an MD5 sum, which is calculated from the data being uploaded.  If the
+        MyTardis server rejects the DataFile record without an MD5 sum, the
+        MD5 sum is calculated before uploading instead.
         """
         # pylint: disable=too-many-statements,too-many-locals,too-many-branches
         dataFileDict = AddUploaderInfo(dataFileDict)
         dataFilePath = self.folderModel.GetDataFilePath(self.dataFileIndex)
         dataFileSize = self.folderModel.GetDataFileSize(self.dataFileIndex)
-        response = None
+        foldersController = wx.GetApp().foldersController
+        created = None
         if not self.existingUnverifiedDatafile:
+            created = DATAFILE_CREATION_BATCHER.Create(dataFileDict)
+        if not self.existingUnverifiedDatafile and not created:
             response = \
                 DataFileModel.CreateDataFileForStagingUpload(dataFileDict)
+            if hashWhileUploading and response.status_code == 400:
+                logger.warning(
+                    "MyTardis requires an MD5 sum when creating a DataFile "
+                    "record, so MD5 sums will be calculated before "
+                    "uploading.")
+                foldersController.checksumRequiredUpFront = True
+                hashWhileUploading = False
+                dataFileDict['md5sum'] = self.CalculateMd5Sum()
+                if self.uploadModel.canceled:
+                    return
+                response = \
+                    DataFileModel.CreateDataFileForStagingUpload(dataFileDict)
             response.raise_for_status()
+            # DataFile creation via the MyTardis API doesn't
+            # return JSON, but if a DataFile record is created
+            # without specifying a storage location, then a
+            # temporary location is returned for the client
+            # to copy/upload the file to.
+            created = (response.headers['Location'].split('/')[-2],
+                       response.text)
         uploadToStagingRequest = SETTINGS.uploaderModel.uploadToStagingRequest
-        foldersController = wx.GetApp().foldersController
         try:
             host = uploadToStagingRequest.scpHostname
             port = uploadToStagingRequest.scpPort
@@ -367,28 +536,45 @@ class UploadDatafileRunnable(object):
         if self.existingUnverifiedDatafile:
             uri = self.existingUnverifiedDatafile.replicas[0].uri
             remoteFilePath = "%s/%s" % (location.rstrip('/'), uri)
+            datafileId = self.existingUnverifiedDatafile.datafileId
         else:
-            # DataFile creation via the MyTardis API doesn't
-            # return JSON, but if a DataFile record is created
-            # without specifying a storage location, then a
-            # temporary location is returned for the client
-            # to copy/upload the file to.
-            tempUrl = response.text
-            remoteFilePath = tempUrl
-            dataFileId = response.headers['Location'].split('/')[-2]
-            self.uploadModel.dataFileId = dataFileId
+            datafileId, remoteFilePath = created
+            self.uploadModel.dataFileId = datafileId
+        if self.uploadMethod == UploadMethod.VIA_STAGING and \
+                self.transport == "ParallelSSH" and \
+                SMALL_FILE_BATCHER.CanBatch(dataFileSize):
+            self.AddToSmallFileBatch(
+                dataFilePath, remoteFilePath, dataFileDict, host, port,
+                username, datafileId, hashWhileUploading)
+            return
         while True:
             # Upload retries loop:
             try:
+                if hashWhileUploading:
+                    md5 = hashlib.md5()
+                    checksumCallback = self.UpdateMd5Sum
+                else:
+                    md5 = None
+                    checksumCallback = None
+                if self.uploadMethod == UploadMethod.LOCAL_COPY:
+                    self.CopyFileToLocalStaging(
+                        dataFilePath, dataFileSize, location, remoteFilePath,
+                        md5=md5, checksumCallback=checksumCallback)
+                    break
                 UploadFile(
                     dataFilePath, dataFileSize, username,
                     SETTINGS.uploaderModel.sshKeyPair.privateKeyFilePath,
                     host, port, remoteFilePath, self.ProgressCallback,
-                    self.uploadModel)
+                    self.uploadModel, md5=md5,
+                    checksumCallback=checksumCallback,
+                    getRelatedRemoteDirs=lambda: self.GetRemoteDatasetDirs(
+                        remoteFilePath, dataFileDict),
+                    uploadMethod=self.transport)
                 # Break out of upload retries loop.
                 break
-            except SshException as err:
-                # includes the ScpException subclass
+            except (SshException, UploadFailed) as err:
+                # SshException includes the ScpException subclass, and
+                # CopyFileToLocalStaging raises UploadFailed
                 if foldersController.IsShuttingDown() or \
                         self.uploadModel.canceled:
                     return
@@ -404,6 +590,36 @@ class UploadDatafileRunnable(object):
                 message = SafeStr(err)
                 self.FinalizeUpload(uploadSuccess=False, message=SafeStr(err))
                 return
+        self.FinishStagingUpload(datafileId, dataFileSize)
+
+    def CopyFileToLocalStaging(self, dataFilePath, dataFileSize, location,
+                               remoteFilePath, md5=None,
+                               checksumCallback=None):
+        """
+        Copy a file into the staging location mounted on this machine
+        (the LOCAL_COPY upload method), instead of uploading it with SSH
+        """
+        # pylint: disable=too-many-arguments
+        if self.uploadModel.canceled:
+            return
+        self.ProgressCallback(current=0, total=dataFileSize,
+                              message="Copying...")
+        try:
+            localPath = GetLocalStagingPath(
+                SETTINGS.miscellaneous.localStagingPath, location,
+                remoteFilePath)
+            CopyFileToStaging(
+                dataFilePath, localPath, self.uploadModel,
+                self.ProgressCallback, md5=md5,
+                checksumCallback=checksumCallback)
+        except (IOError, ValueError) as err:
+            raise UploadFailed(err)
+
+    def FinishStagingUpload(self, datafileId, dataFileSize):
+        """
+        Request verification of a file uploaded to staging, and finalize
+        its upload
+        """
         if self.uploadModel.canceled:
             logger.debug("FoldersController: "
                          "Aborting upload for \"%s\"."
@@ -417,12 +633,6 @@ class UploadDatafileRunnable(object):
                 self.uploadModel.status != UploadStatus.CANCELED and \
                 self.uploadModel.status != UploadStatus.FAILED:
             uploadSuccess = True
-            if self.existingUnverifiedDatafile:
-                datafileId = \
-                    self.existingUnverifiedDatafile.datafileId
-            else:
-                location = response.headers['location']
-                datafileId = location.split("/")[-2]
             verificationDelay = SETTINGS.miscellaneous.verificationDelay
 
             def RequestVerification():
@@ -447,7 +657,76 @@ class UploadDatafileRunnable(object):
         else:
             uploadSuccess = False
         self.FinalizeUpload(uploadSuccess)
-        return
+
+    def AddToSmallFileBatch(self, dataFilePath, remoteFilePath,
+                            dataFileDict, host, port, username, datafileId,
+                            hashWhileUploading):
+        """
+        Add a small file to a batch which will be sent to staging as one
+        tar stream.  The upload is finalized once the batch has been sent.
+        """
+        # pylint: disable=too-many-arguments
+        dataFileSize = self.folderModel.GetDataFileSize(self.dataFileIndex)
+        self.transport = router.TAR_BATCH
+
+        def BatchSentCallback(error):
+            """
+            Called once the file's batch has been sent (or has failed)
+            """
+            if error is not None:
+                self.uploadModel.traceback = SafeStr(error)
+                self.FinalizeUpload(uploadSuccess=False, message=SafeStr(error))
+                return
+            try:
+                if batchedFile.md5sum and not self.uploadModel.canceled:
+                    self.UpdateMd5Sum(batchedFile.md5sum)
+                self.FinishStagingUpload(datafileId, dataFileSize)
+            except Exception as err:
+                # The upload must be finalized, so that the run can finish:
+                self.uploadModel.traceback = traceback.format_exc()
+                logger.error(traceback.format_exc())
+                self.FinalizeUpload(uploadSuccess=False, message=SafeStr(err))
+
+        batchedFile = BatchedFile(
+            dataFilePath, remoteFilePath, self.uploadModel,
+            self.ProgressCallback, BatchSentCallback,
+            md5=hashlib.md5() if hashWhileUploading else None)
+        remoteDir = self.GetRemoteDatasetDir(remoteFilePath, dataFileDict) \
+            or posixpath.dirname(remoteFilePath)
+        DATAVIEW_MODELS['uploads'].SetMessage(
+            self.uploadModel, "Waiting to upload in a batch...")
+        SMALL_FILE_BATCHER.Add(
+            (host, port),
+            (username, SETTINGS.uploaderModel.sshKeyPair.privateKeyFilePath),
+            remoteDir, batchedFile)
+
+    @staticmethod
+    def GetRemoteDatasetDir(remoteFilePath, dataFileDict):
+        """
+        Return the remote directory for the dataset folder, derived from
+        this file's remote path, or None if the remote path doesn't end
+        with the file's directory and filename.
+        """
+        directory = dataFileDict.get('directory') or ""
+        suffix = posixpath.join(directory, dataFileDict['filename'])
+        if not remoteFilePath.endswith("/" + suffix):
+            return None
+        return remoteFilePath[:-len(suffix) - 1]
+
+    def GetRemoteDatasetDirs(self, remoteFilePath, dataFileDict):
+        """
+        Return the remote directories for all of the dataset folder's files,
+        derived from this file's remote path, so that they can be created
+        in one remote command.  Returns an empty list if the remote path
+        doesn't end with the file's directory and filename.
+        """
+        remoteDatasetDir = self.GetRemoteDatasetDir(
+            remoteFilePath, dataFileDict)
+        if remoteDatasetDir is None:
+            return []
+        return [posixpath.join(remoteDatasetDir, directory)
+                if directory else remoteDatasetDir
+                for directory in self.folderModel.dataFiles.directories]
 
     def FinalizeUpload(self, uploadSuccess, message=None):
         """
@@ -458,10 +737,14 @@ class UploadDatafileRunnable(object):
         dataFileName = os.path.basename(dataFilePath)
         foldersModel = DATAVIEW_MODELS['folders']
         uploadsModel = DATAVIEW_MODELS['uploads']
-        foldersController = wx.GetApp().foldersController
-        uploadMethod = foldersController.uploadMethod
+        uploadMethod = self.uploadMethod
         if uploadSuccess:
             logger.debug("Upload succeeded for %s" % dataFileName)
+            if self.uploadModel.startTime:
+                UPLOAD_ROUTER.Record(
+                    self.transport, dataFileSize,
+                    (datetime.now() -
+                     self.uploadModel.startTime).total_seconds())
             uploadsModel.SetStatus(
                 self.uploadModel, UploadStatus.COMPLETED)
             if not message:
@@ -472,7 +755,8 @@ class UploadDatafileRunnable(object):
         else:
             uploadsModel.SetStatus(self.uploadModel, UploadStatus.FAILED)
             if not message:
-                if uploadMethod == UploadMethod.VIA_STAGING and \
+                if uploadMethod in (UploadMethod.VIA_STAGING,
+                                    UploadMethod.LOCAL_COPY) and \
                         self.uploadModel.bytesUploaded < dataFileSize:
                     message = "Only %s of %s bytes were uploaded for %s" \
                         % (self.uploadModel.bytesUploaded, dataFileSize,
@@ -22,6 +22,7 @@ import traceback
 import hashlib
 from datetime import datetime
 
+import requests
 import wx
 
 from ..settings import SETTINGS
@@ -32,7 +33,9 @@ from ..models.replica import ReplicaModel
 from ..models.verification import VerificationModel
 from ..models.verification import VerificationStatus
 from ..models.datafile import DataFileModel
+from ..models.datafile import DataFileLookupIndex
 from ..threads.locks import LOCKS
+from ..utils.checksums import CHECKSUM_CACHE
 from ..utils.exceptions import DoesNotExist
 from ..utils.exceptions import MissingMyDataReplicaApiEndpoint
 from ..events import MYDATA_EVENTS
@@ -109,9 +112,8 @@ class VerifyDatafileRunnable(object):
                 "Looking for matching file on MyTardis server..."
             self.verificationModel.status = VerificationStatus.IN_PROGRESS
             verificationsModel.MessageUpdated(self.verificationModel)
-            existingDatafile = DataFileModel.GetDataFile(
-                dataset=dataset, filename=dataFileName,
-                directory=dataFileDirectory)
+            existingDatafile = self.LookupDataFile(
+                dataset, dataFileName, dataFileDirectory)
             self.verificationModel.message = \
                 "Found datafile on MyTardis server."
             verificationsModel.SetFoundVerified(self.verificationModel)
@@ -124,6 +126,27 @@ class VerifyDatafileRunnable(object):
             verificationsModel.SetComplete(self.verificationModel)
             logger.error(traceback.format_exc())
 
+    def LookupDataFile(self, dataset, dataFileName, dataFileDirectory):
+        """
+        Look up the DataFile record matching a local file, either with one
+        query per file, or via an index of all of the dataset's DataFile
+        records shared by all of the folder's verification workers.
+
+        :raises DoesNotExist:
+        :raises MultipleObjectsReturned:
+        :raises requests.exceptions.HTTPError:
+        """
+        if not SETTINGS.miscellaneous.bulkDataFileLookups:
+            return DataFileModel.GetDataFile(
+                dataset=dataset, filename=dataFileName,
+                directory=dataFileDirectory)
+        with LOCKS.createLookupIndex:
+            if not self.folderModel.dataFileLookupIndex:
+                self.folderModel.dataFileLookupIndex = \
+                    DataFileLookupIndex(dataset)
+        return self.folderModel.dataFileLookupIndex.GetDataFile(
+            filename=dataFileName, directory=dataFileDirectory)
+
     def HandleNonExistentDataFile(self):
         """
         If file doesn't exist on the server, it needs to be uploaded.
@@ -235,12 +258,7 @@ class VerifyDatafileRunnable(object):
         self.folderModel.SetDataFileUploaded(self.dataFileIndex, True)
         DATAVIEW_MODELS['folders'].FolderStatusUpdated(self.folderModel)
         if existingDatafile and not FLAGS.testRunRunning:
-            if existingDatafile.md5sum == \
-                    MiscellaneousSettingsModel.GetFakeMd5Sum():
-                logger.warning("MD5(%s): %s" %
-                               (dataFilePath, existingDatafile.md5sum))
-            else:
-                DataFileModel.Verify(existingDatafile.datafileId)
+            self.RequestVerification(existingDatafile)
         verificationsModel.SetComplete(self.verificationModel)
         PostEvent(MYDATA_EVENTS.FoundFullSizeStagedEvent(
             folderModel=self.folderModel, dataFileIndex=self.dataFileIndex,
@@ -250,6 +268,54 @@ class VerifyDatafileRunnable(object):
                 % self.folderModel.GetDataFileRelPath(self.dataFileIndex)
             logger.testrun(message)
 
+    def RequestVerification(self, existingDatafile):
+        """
+        Request verification of an existing unverified DataFile record.
+
+        A DataFile record created while hashing while uploading has no MD5
+        sum until the upload finishes.  If the upload failed, or MyData
+        exited before the MD5 sum was added, the record could never be
+        verified, so the MD5 sum is calculated and added to the record
+        before requesting verification.
+        """
+        dataFilePath = self.folderModel.GetDataFilePath(self.dataFileIndex)
+        if existingDatafile.md5sum == \
+                MiscellaneousSettingsModel.GetFakeMd5Sum():
+            logger.warning("MD5(%s): %s" %
+                           (dataFilePath, existingDatafile.md5sum))
+            return
+        if not existingDatafile.md5sum:
+            logger.debug("Adding missing MD5 sum to the DataFile record "
+                         "for %s" % dataFilePath)
+            md5sum = self.GetMd5Sum()
+            if not md5sum:
+                return
+            try:
+                DataFileModel.UpdateMd5Sum(existingDatafile.datafileId, md5sum)
+            except requests.exceptions.RequestException:
+                logger.error(traceback.format_exc())
+                return
+            existingDatafile.md5sum = md5sum
+        DataFileModel.Verify(existingDatafile.datafileId)
+
+    def GetMd5Sum(self):
+        """
+        Return the file's MD5 sum from the checksum cache, or calculate it
+        (and cache it).  Returns None if uploads are canceled.
+        """
+        dataFilePath = self.folderModel.GetDataFilePath(self.dataFileIndex)
+        fileStat = self.folderModel.GetDataFileStat(self.dataFileIndex)
+        if SETTINGS.miscellaneous.useChecksumCache:
+            md5sum = CHECKSUM_CACHE.Get(dataFilePath, fileStat)
+            if md5sum:
+                return md5sum
+        md5sum = self.folderModel.CalculateMd5Sum(
+            self.dataFileIndex,
+            canceledCallback=wx.GetApp().foldersController.IsShuttingDown)
+        if md5sum and SETTINGS.miscellaneous.useChecksumCache:
+            CHECKSUM_CACHE.Put(dataFilePath, fileStat, md5sum)
+        return md5sum
+
     def HandleIncompleteStagedUpload(self, existingDatafile,
                                      bytesUploadedPreviously):
         """
@@ -305,12 +371,7 @@ class VerifyDatafileRunnable(object):
             VerificationStatus.FOUND_UNVERIFIED_UNSTAGED
         verificationsModel.MessageUpdated(self.verificationModel)
         if existingDatafile and not FLAGS.testRunRunning:
-            if existingDatafile.md5sum == \
-                    MiscellaneousSettingsModel.GetFakeMd5Sum():
-                logger.warning("MD5(%s): %s" %
-                               (dataFilePath, existingDatafile.md5sum))
-            else:
-                DataFileModel.Verify(existingDatafile.datafileId)
+            self.RequestVerification(existingDatafile)
         verificationsModel.SetComplete(self.verificationModel)
         PostEvent(MYDATA_EVENTS.FoundUnverifiedUnstagedEvent(
             folderModel=self.folderModel, dataFileIndex=self.dataFileIndex,
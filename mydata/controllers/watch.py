@@ -0,0 +1,198 @@
+"""
+Watching the data directory for new and modified files, for the "Watch"
+schedule type.
+"""
+import os
+import threading
+
+import wx
+
+from ..dataviewmodels.dataview import DATAVIEW_MODELS
+from ..dataviewmodels.folders import DatasetIsTooNew
+from ..dataviewmodels.folders import DatasetIsTooOld
+from ..events import MYDATA_THREADS
+from ..logs import logger
+from ..models.folder import FolderModel
+from ..settings import SETTINGS
+from ..threads.flags import FLAGS
+from ..threads.locks import LOCKS
+from ..utils.watcher import FolderWatcher
+from .verifications import VerifyDatafileRunnable
+
+
+class WatchController(object):
+    """
+    Adds the files found by a FolderWatcher to their dataset folders, and
+    queues their verifications (and uploads if required) with the
+    FoldersController.
+    """
+    def __init__(self, foldersController):
+        self.foldersController = foldersController
+        self.watcher = None
+        self.pendingWatchedFiles = []
+        self.ignoredWatchedFolders = dict()
+
+    def StartWatching(self):
+        """
+        Start watching the data directory for new files, for the "Watch"
+        schedule type.
+        """
+        self.pendingWatchedFiles = []
+        self.ignoredWatchedFolders = dict()
+        self.watcher = FolderWatcher(
+            SETTINGS.general.dataDirectory, self.HandleSettledFiles,
+            settleTime=SETTINGS.miscellaneous.watchSettleTime,
+            pollInterval=SETTINGS.miscellaneous.watchPollInterval,
+            useInotify=SETTINGS.miscellaneous.watchUseInotify)
+        self.watcher.Start()
+
+    def StopWatching(self):
+        """
+        Stop watching the data directory for new files.
+        """
+        if self.watcher:
+            self.watcher.Stop()
+            self.watcher = None
+        self.pendingWatchedFiles = []
+
+    def HandleSettledFiles(self, settledFiles):
+        """
+        Called from the FolderWatcher's thread with a list of
+        (path, fileStat) tuples for new files which have settled.
+        """
+        if wx.PyApp.IsMainLoopRunning():
+            wx.CallAfter(self.AddWatchedFiles, settledFiles)
+        else:
+            self.AddWatchedFiles(settledFiles)
+
+    def AddWatchedFiles(self, settledFiles):
+        """
+        Add new files found by the FolderWatcher to their dataset folders'
+        FolderModels (creating new FolderModels for new dataset folders),
+        and queue their verifications (and uploads if required).
+
+        Files are held back until the scan for dataset folders has finished,
+        and until the folder they belong to has queued its initial
+        verifications.
+        """
+        foldersController = self.foldersController
+        if not self.watcher or foldersController.IsShuttingDown():
+            return
+        self.pendingWatchedFiles.extend(settledFiles)
+        if not foldersController.finishedScanningForDatasetFolders.isSet():
+            return
+        foldersModel = DATAVIEW_MODELS['folders']
+        datasetFolders = dict()
+        experimentFilesFolders = dict()
+        siblings = dict()
+        for folderModel in foldersModel.rowsData:
+            if folderModel.isExperimentFilesFolder:
+                experimentFilesFolders[folderModel.location] = folderModel
+            else:
+                datasetFolders[folderModel.absoluteFolderPath] = folderModel
+                siblings[folderModel.location] = folderModel
+        stillPending = []
+        for dataFilePath, fileStat in self.pendingWatchedFiles:
+            folderModel = self.FindFolderModel(
+                dataFilePath, datasetFolders, experimentFilesFolders,
+                siblings)
+            if not folderModel:
+                logger.debug(
+                    "Not uploading %s, because it isn't in a known dataset "
+                    "folder." % dataFilePath)
+                continue
+            with LOCKS.finishedCounting:
+                finishedCounting = foldersController \
+                    .finishedCountingVerifications.get(folderModel)
+            if not finishedCounting or not finishedCounting.isSet():
+                stillPending.append((dataFilePath, fileStat))
+                continue
+            dataFileIndex = folderModel.AddDataFile(dataFilePath, fileStat)
+            if dataFileIndex is None:
+                continue
+            logger.info("Found new or modified file: %s" % dataFilePath)
+            with LOCKS.numVerificationsToBePerformed:
+                foldersController.numVerificationsToBePerformed += 1
+            foldersModel.FolderStatusUpdated(folderModel)
+            verifyDatafileRunnable = \
+                VerifyDatafileRunnable(folderModel, dataFileIndex)
+            if wx.PyApp.IsMainLoopRunning():
+                foldersController.verificationsQueue.put(
+                    verifyDatafileRunnable)
+            else:
+                verifyDatafileRunnable.Run()
+        self.pendingWatchedFiles = stillPending
+
+    def FindFolderModel(self, dataFilePath, datasetFolders,
+                        experimentFilesFolders, siblings):
+        """
+        Return the FolderModel which a file found by the FolderWatcher
+        belongs to, adding a new dataset folder if the file is in a new
+        folder alongside an existing dataset folder (one of siblings, keyed
+        by location).  Returns None if the file isn't in a known (or new)
+        dataset folder.
+        """
+        dirname = os.path.dirname(dataFilePath)
+        folderModel = experimentFilesFolders.get(dirname)
+        path = dirname
+        while not folderModel and path != os.path.dirname(path):
+            folderModel = datasetFolders.get(path)
+            if not folderModel and path in siblings and path != dirname:
+                # A new dataset folder, alongside an existing one:
+                datasetFolderName = \
+                    os.path.relpath(dirname, path).split(os.sep)[0]
+                folderModel = self.AddWatchedDatasetFolder(
+                    siblings[path], datasetFolderName)
+                if not folderModel:
+                    break
+                datasetFolders[folderModel.absoluteFolderPath] = folderModel
+            path = os.path.dirname(path)
+        return folderModel
+
+    def AddWatchedDatasetFolder(self, sibling, datasetFolderName):
+        """
+        Add a new dataset folder found by the FolderWatcher, alongside an
+        existing dataset folder (sibling) with the same owner, group and
+        experiment, and start its uploads.  Its files will be added as they
+        settle.
+
+        Returns None if the dataset folder is excluded by the dataset
+        filters, in which case its files will be ignored.
+        """
+        location = sibling.location
+        if datasetFolderName in self.ignoredWatchedFolders.get(
+                location, set()):
+            return None
+        if SETTINGS.filters.datasetFilter not in datasetFolderName or \
+                (SETTINGS.filters.ignoreOldDatasets and
+                 DatasetIsTooOld(location, datasetFolderName)) or \
+                (SETTINGS.filters.ignoreNewDatasets and
+                 DatasetIsTooNew(location, datasetFolderName)):
+            self.ignoredWatchedFolders.setdefault(location, set()).add(
+                datasetFolderName)
+            return None
+        foldersModel = DATAVIEW_MODELS['folders']
+        folderModel = FolderModel(
+            dataViewId=foldersModel.GetMaxDataViewId() + 1,
+            folderName=datasetFolderName,
+            location=sibling.location,
+            userFolderName=sibling.userFolderName,
+            groupFolderName=sibling.groupFolderName,
+            owner=sibling.owner,
+            group=sibling.group,
+            scanFiles=False)
+        folderModel.experimentTitle = sibling.experimentTitle
+        folderModel.SetCreatedDate()
+        logger.info("Found new dataset folder: %s"
+                    % folderModel.absoluteFolderPath)
+        foldersModel.AddWatchedFolder(folderModel)
+        FLAGS.performingLookupsAndUploads = True
+        if wx.PyApp.IsMainLoopRunning():
+            thread = threading.Thread(
+                target=self.foldersController.StartUploadsForFolder, args=[folderModel],
+                name="StartDataUploadsForWatchedFolderThread")
+            MYDATA_THREADS.Add(thread)
+            thread.start()
+        else:
+            self.foldersController.StartUploadsForFolder(folderModel)
+        return folderModel
@@ -1,7 +1,9 @@
 """
 Shared functionality for MyData's dataview model classes.
 """
+import bisect
 import threading
+import time
 import traceback
 
 import wx
@@ -13,6 +15,11 @@ if 'phoenix' in wx.PlatformInfo:
 else:
     from wx.dataview import PyDataViewIndexListModel as DataViewIndexListModel
 
+# When more rows than this have been added, inserted or deleted since the
+# views were last notified, the views are reset instead of being notified
+# of each row:
+MAX_ROW_NOTIFICATIONS = 1000
+
 
 class ColumnRenderer(object):
     """
@@ -35,11 +42,22 @@ class MyDataDataViewModel(DataViewIndexListModel):
         super(MyDataDataViewModel, self).__init__()
 
         self.rowsData = list()
+        # Maps id(rowData) to rowData's index in rowsData, so that views can
+        # be notified of changes to a row without searching rowsData:
+        self.rowIndices = dict()
+        # The sort key (see GetSortKey) of each row in rowsData:
+        self.rowKeys = list()
+        # Protects rowsData, which can be updated from worker threads:
+        self.rowsLock = threading.RLock()
+        self.pendingNotifications = list()
+        self.notificationsScheduled = False
+        self.batchingNotifications = False
 
         self.columnNames = list()
         self.columnKeys = list()
         self.defaultColumnWidths = list()
 
+        # All rows, and the rows hidden by the search string:
         self.unfilteredData = list()
         self.filteredData = list()
         self.searchString = ""
@@ -71,6 +89,29 @@ class MyDataDataViewModel(DataViewIndexListModel):
         """
         return len(self.rowsData)
 
+    def GetRowIndex(self, rowData):
+        """
+        Return rowData's index in rowsData, or None if it isn't displayed,
+        e.g. because it has been filtered out by the search string.
+        """
+        row = self.rowIndices.get(id(rowData))
+        try:
+            if row is not None and self.rowsData[row] is rowData:
+                return row
+        except IndexError:
+            pass
+        return None
+
+    def ReindexRows(self, firstRow=0):
+        """
+        Update the row indices for rowsData[firstRow:], after rows have
+        been inserted or deleted.
+        """
+        if firstRow == 0:
+            self.rowIndices = dict()
+        for row in range(firstRow, len(self.rowsData)):
+            self.rowIndices[id(self.rowsData[row])] = row
+
     def GetValueByRow(self, row, col):
         """
         This method is called to provide the rowsData object
@@ -155,97 +196,218 @@ class MyDataDataViewModel(DataViewIndexListModel):
         """
         return len(self.columnNames)
 
+    def GetSortKey(self, rowData):
+        """
+        Return the key which rowsData is sorted by, i.e. the row's ID,
+        which is what Compare uses for column 0.  Rows without IDs are
+        kept at the end, in the order they were added.
+        """
+        if rowData.dataViewId is None:
+            return float('inf')
+        return int(rowData.dataViewId)
+
+    def MatchesSearchString(self, rowData, query):
+        """
+        Return True if a row should be displayed for the (lower case)
+        query string typed in the search box.
+        """
+        if not query or not self.filterFields:
+            return True
+        return any([query in rowData.GetValueForKey(field).lower()
+                    for field in self.filterFields])
+
     def Filter(self, searchString):
         """
         Only show rows matching the query string, typed in the search box
         in the upper-right corner of the main window.
+
+        Displayed rows only need to be checked if the new query string
+        isn't contained in the previous one, and hidden rows only need to
+        be checked if the new query string doesn't contain the previous one.
         """
         if not self.filterFields:
             return
-        self.searchString = searchString
-        query = self.searchString.lower()
-        if self.GetFilteredRowCount() == 0:
-            # This only does a shallow copy:
-            self.unfilteredData = list(self.rowsData)
-
-        for row in reversed(range(0, self.GetRowCount())):
-            rowData = self.rowsData[row]
-            if all([query not in rowData.GetValueForKey(field).lower()
-                    for field in self.filterFields]):
+        with self.rowsLock:
+            previousQuery = self.searchString.lower()
+            self.searchString = searchString
+            query = searchString.lower()
+            self.batchingNotifications = True
+            try:
+                if query not in previousQuery:
+                    self._HideRows(query)
+                if previousQuery not in query:
+                    self._ShowRows(query)
+            finally:
+                self.batchingNotifications = False
+            if threading.current_thread().name == "MainThread":
+                self._SendNotifications()
+            elif self.pendingNotifications and \
+                    not self.notificationsScheduled:
+                self.notificationsScheduled = True
+                wx.CallAfter(self._SendNotifications)
+
+    def _HideRows(self, query):
+        """
+        Hide the displayed rows which don't match the query string.
+        Must be called with rowsLock acquired.
+        """
+        rowsDeleted = []
+        keptRows = []
+        keptKeys = []
+        for row, rowData in enumerate(self.rowsData):
+            if self.MatchesSearchString(rowData, query):
+                keptRows.append(rowData)
+                keptKeys.append(self.rowKeys[row])
+            else:
                 self.filteredData.append(rowData)
-                del self.rowsData[row]
-                self._RowDeleted(row)
-
-        for filteredRow in reversed(range(0, self.GetFilteredRowCount())):
-            rowData = self.filteredData[filteredRow]
-            if any([query in rowData.GetValueForKey(field).lower()
-                    for field in self.filterFields]):
-                # Model doesn't care about currently sorted column.
-                # Always use ID.
-                row = 0
-                col = 0
-                ascending = True  # Need to get current sort direction
-                while row < self.GetRowCount() and \
-                        self.Compare(self.rowsData[row],
-                                     self.filteredData[filteredRow],
-                                     col, ascending) < 0:
-                    row += 1
-
-                if row == self.GetRowCount():
-                    self.rowsData.append(self.filteredData[filteredRow])
-                    self._RowAppended()
-                else:
-                    self.rowsData.insert(row, self.filteredData[filteredRow])
-                    self._RowInserted(row)
-                del self.filteredData[filteredRow]
+                self.rowIndices.pop(id(rowData), None)
+                rowsDeleted.append(row)
+        if rowsDeleted:
+            self.rowsData = keptRows
+            self.rowKeys = keptKeys
+            self.ReindexRows(rowsDeleted[0])
+            self._RowsDeleted(rowsDeleted)
+
+    def _ShowRows(self, query):
+        """
+        Display the hidden rows which match the query string, merging them
+        into rowsData in sort order.  Must be called with rowsLock acquired.
+        """
+        shownRows = []
+        hiddenRows = []
+        for rowData in self.filteredData:
+            if self.MatchesSearchString(rowData, query):
+                shownRows.append((self.GetSortKey(rowData), rowData))
+            else:
+                hiddenRows.append(rowData)
+        if not shownRows:
+            return
+        self.filteredData = hiddenRows
+        shownRows.sort(key=lambda shownRow: shownRow[0])
+        mergedRows = []
+        mergedKeys = []
+        rowsInserted = []
+        row = 0
+        for key, rowData in shownRows:
+            while row < len(self.rowKeys) and self.rowKeys[row] <= key:
+                mergedRows.append(self.rowsData[row])
+                mergedKeys.append(self.rowKeys[row])
+                row += 1
+            rowsInserted.append(len(mergedRows))
+            mergedRows.append(rowData)
+            mergedKeys.append(key)
+        mergedRows.extend(self.rowsData[row:])
+        mergedKeys.extend(self.rowKeys[row:])
+        self.rowsData = mergedRows
+        self.rowKeys = mergedKeys
+        self.ReindexRows(rowsInserted[0])
+        numViewRows = len(self.rowsData) - len(rowsInserted)
+        for row in rowsInserted:
+            if row == numViewRows:
+                self._RowAppended()
+            else:
+                self._RowInserted(row)
+            numViewRows += 1
 
-    def _RowAppended(self):
+    def _InsertRow(self, rowData):
         """
-        Notify the view(s) using this model that a row has been added
+        Insert a row into rowsData, keeping rowsData sorted by GetSortKey,
+        and notify the view(s).  Must be called with rowsLock acquired.
         """
-        if threading.current_thread().name == "MainThread":
-            super(MyDataDataViewModel, self).RowAppended()
+        key = self.GetSortKey(rowData)
+        if not self.rowKeys or key >= self.rowKeys[-1]:
+            self.rowsData.append(rowData)
+            self.rowKeys.append(key)
+            self.rowIndices[id(rowData)] = len(self.rowsData) - 1
+            self._RowAppended()
         else:
-            wx.CallAfter(super(MyDataDataViewModel, self).RowAppended)
+            row = bisect.bisect_right(self.rowKeys, key)
+            self.rowsData.insert(row, rowData)
+            self.rowKeys.insert(row, key)
+            self.ReindexRows(row)
+            self._RowInserted(row)
 
-    def _RowInserted(self, row):
+    def _QueueNotification(self, notification, arg=None):
         """
-        Notify the view(s) using this model that a row has been inserted
+        Notify the view(s) using this model that rows have changed.
+
+        Notifications from other threads (and from Filter) are queued and
+        sent from the main thread in order, with consecutive appends merged,
+        and with a single Reset notification instead of many individual
+        notifications.  Must be called with rowsLock acquired.
         """
-        if threading.current_thread().name == "MainThread":
-            super(MyDataDataViewModel, self).RowInserted(row)
+        if notification == "appended" and self.pendingNotifications and \
+                self.pendingNotifications[-1][0] == "appended":
+            self.pendingNotifications[-1][1] += 1
         else:
-            wx.CallAfter(super(MyDataDataViewModel, self).RowInserted, row)
+            self.pendingNotifications.append(
+                [notification, 1 if notification == "appended" else arg])
+        if self.batchingNotifications:
+            return
+        if threading.current_thread().name == "MainThread":
+            self._SendNotifications()
+        elif not self.notificationsScheduled:
+            self.notificationsScheduled = True
+            wx.CallAfter(self._SendNotifications)
+
+    def _SendNotifications(self):
+        """
+        Send queued notifications to the view(s) using this model.
+        """
+        with self.rowsLock:
+            notifications = self.pendingNotifications
+            self.pendingNotifications = []
+            self.notificationsScheduled = False
+            count = len(self.rowsData)
+        numNotifications = 0
+        for notification, arg in notifications:
+            if notification == "appended":
+                numNotifications += arg
+            elif notification == "deleted":
+                numNotifications += len(arg)
+            else:
+                numNotifications += 1
+        if numNotifications > MAX_ROW_NOTIFICATIONS:
+            super(MyDataDataViewModel, self).Reset(count)
+            return
+        for notification, arg in notifications:
+            if notification == "appended":
+                for _ in range(arg):
+                    super(MyDataDataViewModel, self).RowAppended()
+            elif notification == "inserted":
+                super(MyDataDataViewModel, self).RowInserted(arg)
+            else:
+                super(MyDataDataViewModel, self).RowsDeleted(arg)
 
-    def _RowDeleted(self, row):
+    def _RowAppended(self):
         """
-        Notify the view(s) using this model that a row has been deleted
+        Notify the view(s) using this model that a row has been added
         """
-        if threading.current_thread().name == "MainThread":
-            super(MyDataDataViewModel, self).RowDeleted(row)
-        else:
-            wx.CallAfter(super(MyDataDataViewModel, self).RowDeleted, row)
+        self._QueueNotification("appended")
+
+    def _RowInserted(self, row):
+        """
+        Notify the view(s) using this model that a row has been inserted
+        """
+        self._QueueNotification("inserted", row)
 
     def _RowsDeleted(self, rows):
         """
         Notify the view(s) using this model that rows have been deleted
         """
-        if threading.current_thread().name == "MainThread":
-            super(MyDataDataViewModel, self).RowsDeleted(rows)
-        else:
-            wx.CallAfter(super(MyDataDataViewModel, self).RowsDeleted, rows)
+        self._QueueNotification("deleted", rows)
 
     def AddRow(self, value):
         """
-        Add a new row
+        Add a new row, which will be hidden if it doesn't match the
+        current search string
         """
-        self.Filter("")
-        self.rowsData.append(value)
-        self._RowAppended()
-
-        self.unfilteredData = self.rowsData
-        self.filteredData = list()
-        self.Filter(self.searchString)
+        with self.rowsLock:
+            self.unfilteredData.append(value)
+            if self.MatchesSearchString(value, self.searchString.lower()):
+                self._InsertRow(value)
+            else:
+                self.filteredData.append(value)
 
         with self.maxDataViewIdLock:
             self.maxDataViewId = value.dataViewId
@@ -254,17 +416,18 @@ class MyDataDataViewModel(DataViewIndexListModel):
         """
         Delete all rows.
         """
-        rowsDeleted = []
-        for row in reversed(range(0, self.GetCount())):
-            del self.rowsData[row]
-            rowsDeleted.append(row)
+        with self.rowsLock:
+            rowsDeleted = list(reversed(range(0, self.GetCount())))
+            self.rowsData = list()
+            self.rowKeys = list()
+            self.rowIndices = dict()
+            if rowsDeleted:
+                self._RowsDeleted(rowsDeleted)
 
-        self._RowsDeleted(rowsDeleted)
-
-        self.unfilteredData = list()
-        self.filteredData = list()
-        self.searchString = ""
-        self.maxDataViewId = 0
+            self.unfilteredData = list()
+            self.filteredData = list()
+            self.searchString = ""
+            self.maxDataViewId = 0
 
     def GetMaxDataViewId(self):
         """
@@ -300,5 +463,119 @@ class MyDataDataViewModel(DataViewIndexListModel):
         return ColumnRenderer.TEXT
 
 
+class UiUpdateBus(object):
+    """
+    Coalesces row value changes reported by worker threads (e.g. upload
+    progress), so that the views are refreshed at most uiRefreshRate times
+    per second, instead of each change being sent with its own
+    wx.CallAfter.
+
+    Workers add (model, rowData, col) tuples to a set (set.add is atomic,
+    so no lock is needed), and a timer in the main thread pops them and
+    calls TryRowValueChanged once per changed cell.  Rows are looked up
+    when the changes are flushed, so rows inserted or deleted in the
+    meantime don't matter.
+
+    When the timer isn't running (e.g. while scanning folders, or in
+    unit tests), changes are flushed by a single pending wx.CallAfter.
+    """
+    def __init__(self):
+        self.changedCells = set()
+        self.timer = None
+        self.flushScheduled = False
+        # Metrics:
+        self.queueDepth = 0
+        self.maxQueueDepth = 0
+        self.flushDuration = 0.0
+        self.maxFlushDuration = 0.0
+        self.numFlushes = 0
+
+    def RowValueChanged(self, model, rowData, col):
+        """
+        Report that the value in rowData's row and column col has changed.
+        """
+        self.changedCells.add((model, rowData, col))
+        if self.timer and self.timer.IsRunning():
+            return
+        if threading.current_thread().name == "MainThread":
+            self.Flush()
+        elif not self.flushScheduled:
+            self.flushScheduled = True
+            wx.CallAfter(self.Flush)
+
+    def Flush(self, event=None):
+        """
+        Notify the views of the changes reported since the last flush.
+        Must be called from the main thread.
+        """
+        self.flushScheduled = False
+        queueDepth = len(self.changedCells)
+        if not queueDepth:
+            return
+        startTime = time.time()
+        while True:
+            try:
+                model, rowData, col = self.changedCells.pop()
+            except KeyError:
+                break
+            row = model.GetRowIndex(rowData)
+            if row is not None:
+                model.TryRowValueChanged(row, col)
+        flushDuration = time.time() - startTime
+        self.queueDepth = queueDepth
+        self.maxQueueDepth = max(self.maxQueueDepth, queueDepth)
+        self.flushDuration = flushDuration
+        self.maxFlushDuration = max(self.maxFlushDuration, flushDuration)
+        self.numFlushes += 1
+
+    def Start(self, parent, refreshRate):
+        """
+        Start flushing changes refreshRate times per second.  Must be called
+        from the main thread.
+        """
+        if not self.timer:
+            self.timer = wx.Timer(parent)
+            parent.Bind(wx.EVT_TIMER, self.Flush, self.timer)
+        self.ResetMetrics()
+        self.timer.Start(max(1, int(1000.0 / refreshRate)))
+
+    def Stop(self):
+        """
+        Stop the timer, and flush any remaining changes.  Must be called
+        from the main thread.
+        """
+        if self.timer:
+            self.timer.Stop()
+        self.Flush()
+        logger.debug(
+            "UI update bus: %s flushes, maximum queue depth %s, maximum "
+            "flush duration %.3f seconds"
+            % (self.numFlushes, self.maxQueueDepth, self.maxFlushDuration))
+
+    def ResetMetrics(self):
+        """
+        Reset the queue depth and flush duration metrics.
+        """
+        self.queueDepth = 0
+        self.maxQueueDepth = 0
+        self.flushDuration = 0.0
+        self.maxFlushDuration = 0.0
+        self.numFlushes = 0
+
+    def GetMetrics(self):
+        """
+        Return the queue depth (number of changed cells) and the duration
+        (in seconds) of the most recent flush, and their maximums
+        """
+        return dict(
+            queueDepth=self.queueDepth,
+            maxQueueDepth=self.maxQueueDepth,
+            flushDuration=self.flushDuration,
+            maxFlushDuration=self.maxFlushDuration,
+            numFlushes=self.numFlushes)
+
+
+UI_UPDATE_BUS = UiUpdateBus()
+
 # This will be populated as each dataview model is initialized:
 DATAVIEW_MODELS = dict()
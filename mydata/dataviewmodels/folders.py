@@ -20,11 +20,13 @@ from ..logs import logger
 from ..utils.exceptions import InvalidFolderStructure
 from ..utils.exceptions import DoesNotExist
 from ..utils import Compare
+from ..utils.scanindex import SCAN_INDEX
 from ..events import MYDATA_EVENTS
 from ..events import PostEvent
 from ..events.stop import RaiseExceptionIfUserAborted
 from ..threads.locks import LOCKS
 from .dataview import MyDataDataViewModel
+from .dataview import UI_UPDATE_BUS
 from .dataview import DATAVIEW_MODELS
 
 
@@ -136,6 +138,10 @@ class FoldersModel(MyDataDataViewModel):
     def AddRow(self, folderModel):
         """
         Add folder model to folders model and notify view.
+
+        If the folder model was created with streamFiles=True, its files are
+        scanned here, after its uploads have been started, so that its
+        verifications can begin while the scan is still in progress.
         """
         RaiseExceptionIfUserAborted()
         super(FoldersModel, self).AddRow(folderModel)
@@ -144,6 +150,16 @@ class FoldersModel(MyDataDataViewModel):
             MYDATA_EVENTS.StartUploadsForFolderEvent(
                 folderModel=folderModel)
         PostEvent(startDataUploadsForFolderEvent)
+        if not folderModel.finishedScanningFiles.isSet():
+            folderModel.PopulateDataFilePaths()
+
+    def AddWatchedFolder(self, folderModel):
+        """
+        Add a dataset folder found by the FolderWatcher used for the "Watch"
+        schedule type.  The FoldersController starts its uploads directly,
+        because the scan for dataset folders has already finished.
+        """
+        super(FoldersModel, self).AddRow(folderModel)
 
     def FolderStatusUpdated(self, folderModel, delay=False):
         """
@@ -153,13 +169,8 @@ class FoldersModel(MyDataDataViewModel):
             if folderModel not in self.foldersToUpdate:
                 with LOCKS.foldersToUpdate:
                     self.foldersToUpdate.append(folderModel)
-        for row in range(0, self.GetCount()):
-            if self.rowsData[row] == folderModel:
-                col = self.columnNames.index("Status")
-                if threading.current_thread().name == "MainThread":
-                    self.TryRowValueChanged(row, col)
-                else:
-                    wx.CallAfter(self.TryRowValueChanged, row, col)
+        UI_UPDATE_BUS.RowValueChanged(
+            self, folderModel, self.columnNames.index("Status"))
 
     def ScanFolders(self, writeProgressUpdateToStatusBar):
         """
@@ -176,19 +187,30 @@ class FoldersModel(MyDataDataViewModel):
         defaultOwner = SETTINGS.general.defaultOwner
         folderStructure = SETTINGS.advanced.folderStructure
         logger.debug("FoldersModel.ScanFolders(): Scanning " + dataDir + "...")
-        if folderStructure.startswith("Username") or \
-                folderStructure.startswith("Email"):
-            self.ScanForUserFolders(writeProgressUpdateToStatusBar)
-        elif folderStructure.startswith("User Group"):
-            self.ScanForGroupFolders(writeProgressUpdateToStatusBar)
-        elif folderStructure.startswith("Experiment"):
-            self.ScanForExperimentFolders(dataDir, defaultOwner,
-                                          defaultOwner.username)
-        elif folderStructure.startswith("Dataset"):
-            self.ScanForDatasetFolders(dataDir, defaultOwner,
-                                       defaultOwner.username)
-        else:
-            raise InvalidFolderStructure("Unknown folder structure.")
+        if SETTINGS.miscellaneous.useScanIndex:
+            SCAN_INDEX.Begin(SETTINGS.scanIndexPath,
+                             SETTINGS.miscellaneous.fullRescanInterval,
+                             SETTINGS.miscellaneous.fullRescan)
+            SETTINGS.miscellaneous.fullRescan = False
+        completed = False
+        try:
+            if folderStructure.startswith("Username") or \
+                    folderStructure.startswith("Email"):
+                self.ScanForUserFolders(writeProgressUpdateToStatusBar)
+            elif folderStructure.startswith("User Group"):
+                self.ScanForGroupFolders(writeProgressUpdateToStatusBar)
+            elif folderStructure.startswith("Experiment"):
+                self.ScanForExperimentFolders(dataDir, defaultOwner,
+                                              defaultOwner.username)
+            elif folderStructure.startswith("Dataset"):
+                self.ScanForDatasetFolders(dataDir, defaultOwner,
+                                           defaultOwner.username)
+            else:
+                raise InvalidFolderStructure("Unknown folder structure.")
+            completed = True
+        finally:
+            # Don't save the scan index if the scan was aborted:
+            SCAN_INDEX.End(save=completed)
 
     def ScanForUserFolders(self, writeProgressUpdateToStatusBar):
         """
@@ -344,7 +366,8 @@ class FoldersModel(MyDataDataViewModel):
                                 userFolderName=userFolderName,
                                 groupFolderName=groupFolderName,
                                 owner=owner,
-                                group=groupRecord)
+                                group=groupRecord,
+                                streamFiles=wx.PyApp.IsMainLoopRunning())
                 RaiseExceptionIfUserAborted()
                 folderModel.SetCreatedDate()
                 SetExperimentTitle(folderModel, owner, groupFolderName)
@@ -382,7 +405,8 @@ class FoldersModel(MyDataDataViewModel):
                                 userFolderName=userFolderName,
                                 groupFolderName=groupFolderName,
                                 owner=owner,
-                                group=groupRecord)
+                                group=groupRecord,
+                                streamFiles=wx.PyApp.IsMainLoopRunning())
                 RaiseExceptionIfUserAborted()
                 if folderStructure.startswith("Username") or \
                         folderStructure.startswith("Email") or \
@@ -411,7 +435,8 @@ class FoldersModel(MyDataDataViewModel):
                                 groupFolderName=groupFolderName,
                                 owner=owner,
                                 group=groupRecord,
-                                isExperimentFilesFolder=True)
+                                isExperimentFilesFolder=True,
+                                streamFiles=wx.PyApp.IsMainLoopRunning())
                 RaiseExceptionIfUserAborted()
                 folderModel.experimentTitle = expFolderName
                 folderModel.SetCreatedDate()
@@ -475,7 +500,8 @@ class FoldersModel(MyDataDataViewModel):
                                     userFolderName=userFolderName,
                                     groupFolderName=groupFolderName,
                                     owner=owner,
-                                    group=groupRecord)
+                                    group=groupRecord,
+                                    streamFiles=wx.PyApp.IsMainLoopRunning())
                     RaiseExceptionIfUserAborted()
                     folderModel.SetCreatedDate()
                     folderModel.experimentTitle = \
@@ -10,6 +10,7 @@ import wx
 from ..models.upload import UploadStatus
 from ..media import MYDATA_ICONS
 from .dataview import MyDataDataViewModel
+from .dataview import UI_UPDATE_BUS
 from .dataview import ColumnRenderer
 
 
@@ -113,33 +114,24 @@ class UploadsModel(MyDataDataViewModel):
         """
         Notify views that upload progress has been updated
         """
-        for row in reversed(range(0, self.GetCount())):
-            if self.rowsData[row] == uploadModel:
-                col = self.columnNames.index("Progress")
-                wx.CallAfter(self.TryRowValueChanged, row, col)
-                col = self.columnNames.index("Speed")
-                wx.CallAfter(self.TryRowValueChanged, row, col)
-                break
+        UI_UPDATE_BUS.RowValueChanged(
+            self, uploadModel, self.columnNames.index("Progress"))
+        UI_UPDATE_BUS.RowValueChanged(
+            self, uploadModel, self.columnNames.index("Speed"))
 
     def StatusUpdated(self, uploadModel):
         """
         Notify views that upload status has been updated
         """
-        for row in reversed(range(0, self.GetCount())):
-            if self.rowsData[row] == uploadModel:
-                col = self.columnNames.index("Status")
-                wx.CallAfter(self.TryRowValueChanged, row, col)
-                break
+        UI_UPDATE_BUS.RowValueChanged(
+            self, uploadModel, self.columnNames.index("Status"))
 
     def MessageUpdated(self, uploadModel):
         """
         Notify views that upload message has been updated
         """
-        for row in reversed(range(0, self.GetCount())):
-            if self.rowsData[row] == uploadModel:
-                col = self.columnNames.index("Message")
-                wx.CallAfter(self.TryRowValueChanged, row, col)
-                break
+        UI_UPDATE_BUS.RowValueChanged(
+            self, uploadModel, self.columnNames.index("Message"))
 
     def SetStatus(self, uploadModel, status):
         """
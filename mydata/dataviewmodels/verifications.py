@@ -4,10 +4,9 @@ and the tabular data displayed on that tab view.
 """
 import threading
 
-import wx
-
 from ..models.verification import VerificationStatus
 from .dataview import MyDataDataViewModel
+from .dataview import UI_UPDATE_BUS
 
 
 class VerificationsModel(MyDataDataViewModel):
@@ -119,11 +118,8 @@ class VerificationsModel(MyDataDataViewModel):
         """
         Update verificationModel's message
         """
-        for row in reversed(range(0, self.GetCount())):
-            if self.rowsData[row] == verificationModel:
-                col = self.columnNames.index("Message")
-                wx.CallAfter(self.TryRowValueChanged, row, col)
-                break
+        UI_UPDATE_BUS.RowValueChanged(
+            self, verificationModel, self.columnNames.index("Message"))
 
     def GetFoundVerifiedCount(self):
         """
@@ -4,6 +4,8 @@ Model class for MyTardis API v1's DataFileResource.
 
 import io
 import json
+import os
+import threading
 import urllib
 
 import requests
@@ -14,7 +16,11 @@ from ..settings import SETTINGS
 from ..logs import logger
 from ..utils.exceptions import DoesNotExist
 from ..utils.exceptions import MultipleObjectsReturned
+from ..utils.jsonstream import JsonListStream
+from ..utils.multipart import CanSendFile
+from ..utils.multipart import PostMultipartFile
 from ..utils import UnderscoreToCamelcase
+from ..utils.session import SESSION
 from .replica import ReplicaModel
 
 
@@ -65,7 +71,7 @@ class DataFileModel(object):
             "&dataset__id=" + str(dataset.datasetId) + \
             "&filename=" + urllib.parse.quote(filename.encode('utf-8')) + \
             "&directory=" + urllib.parse.quote(directory.encode('utf-8'))
-        response = requests.get(url=url, headers=SETTINGS.defaultHeaders)
+        response = SESSION.Get(url)
         response.raise_for_status()
         dataFilesJson = response.json()
         numDataFilesFound = dataFilesJson['meta']['total_count']
@@ -81,6 +87,45 @@ class DataFileModel(object):
         return DataFileModel(
             dataset=dataset, dataFileJson=dataFilesJson['objects'][0])
 
+    @staticmethod
+    def GetDataFilesForDataset(dataset, pageSize=1000):
+        """
+        Generator yielding the JSON for every DataFile record in a dataset.
+
+        The records are requested one page (of up to pageSize records) at
+        a time, and each page is parsed incrementally as it is streamed
+        from the server.
+
+        :raises requests.exceptions.HTTPError:
+        """
+        myTardisUrl = SETTINGS.general.myTardisUrl
+        offset = 0
+        while True:
+            url = myTardisUrl + "/api/v1/mydata_dataset_file/?format=json" + \
+                "&dataset__id=" + str(dataset.datasetId) + \
+                "&limit=%s&offset=%s" % (pageSize, offset)
+            response = SESSION.Get(url, stream=True)
+            numDataFilesInPage = 0
+            try:
+                response.raise_for_status()
+                dataFiles = JsonListStream(
+                    response.iter_content(chunk_size=64 * 1024))
+                for dataFileJson in dataFiles:
+                    numDataFilesInPage += 1
+                    yield dataFileJson
+            finally:
+                response.close()
+            offset += numDataFilesInPage
+            # The server may cap the page size (Tastypie's max_limit),
+            # so we prefer its "next" link to decide whether we're done:
+            if dataFiles.meta is not None:
+                if not dataFiles.meta.get('next'):
+                    break
+            elif numDataFilesInPage < pageSize:
+                break
+            if numDataFilesInPage == 0:
+                break
+
     @staticmethod
     def GetDataFileFromId(dataFileId):
         """
@@ -91,7 +136,7 @@ class DataFileModel(object):
         myTardisUrl = SETTINGS.general.myTardisUrl
         url = "%s/api/v1/mydata_dataset_file/%s/?format=json" \
             % (myTardisUrl, dataFileId)
-        response = requests.get(url=url, headers=SETTINGS.defaultHeaders)
+        response = SESSION.Get(url)
         response.raise_for_status()
         dataFileJson = response.json()
         return DataFileModel(dataset=None, dataFileJson=dataFileJson)
@@ -103,7 +148,7 @@ class DataFileModel(object):
         """
         myTardisUrl = SETTINGS.general.myTardisUrl
         url = myTardisUrl + "/api/v1/dataset_file/%s/verify/" % datafileId
-        response = requests.get(url=url, headers=SETTINGS.defaultHeaders)
+        response = SESSION.Get(url)
         if response.status_code < 200 or response.status_code >= 300:
             logger.warning("Failed to verify datafile id \"%s\" " % datafileId)
             logger.warning(response.text)
@@ -114,6 +159,20 @@ class DataFileModel(object):
         # Celery queue.
         return True
 
+    @staticmethod
+    def UpdateMd5Sum(datafileId, md5sum):
+        """
+        Update a datafile's MD5 sum via the MyTardis API, e.g. after
+        calculating it while uploading the file.
+
+        :raises requests.exceptions.HTTPError:
+        """
+        myTardisUrl = SETTINGS.general.myTardisUrl
+        url = myTardisUrl + "/api/v1/dataset_file/%s/" % datafileId
+        dataFileJson = json.dumps({"md5sum": md5sum})
+        response = SESSION.Patch(url, data=dataFileJson.encode())
+        response.raise_for_status()
+
     @staticmethod
     def CreateDataFileForStagingUpload(dataFileDict):
         """
@@ -122,8 +181,21 @@ class DataFileModel(object):
         """
         url = "%s/api/v1/mydata_dataset_file/" % SETTINGS.general.myTardisUrl
         dataFileJson = json.dumps(dataFileDict)
-        response = requests.post(headers=SETTINGS.defaultHeaders,
-                                 url=url, data=dataFileJson.encode())
+        response = SESSION.Post(url, data=dataFileJson.encode())
+        return response
+
+    @staticmethod
+    def CreateDataFilesForStagingUpload(dataFileDicts):
+        """
+        Create several DataFile records with one request.  If successful,
+        the response's JSON contains an "objects" list with the "id" and
+        the temporary upload location ("temp_url") of each DataFile record,
+        in the same order as dataFileDicts.
+        """
+        url = "%s/api/v1/mydata_dataset_file/bulk/" \
+            % SETTINGS.general.myTardisUrl
+        dataFilesJson = json.dumps(dict(objects=dataFileDicts))
+        response = SESSION.Post(url, data=dataFilesJson.encode())
         return response
 
     @staticmethod
@@ -139,6 +211,20 @@ class DataFileModel(object):
         datafileBufferedReader = io.open(dataFilePath, 'rb')
         uploadModel.bufferedReader = datafileBufferedReader
 
+        if SETTINGS.miscellaneous.useSendfileForPostUploads and \
+                CanSendFile(
+                    url, os.fstat(datafileBufferedReader.fileno()).st_size):
+            try:
+                response = PostMultipartFile(
+                    url, SETTINGS.defaultHeaders,
+                    {"json_data": json.dumps(dataFileDict)},
+                    'attached_file', datafileBufferedReader,
+                    uploadModel.filename, progressCallback,
+                    timeout=SESSION.GetUploadTimeout())
+            finally:
+                datafileBufferedReader.close()
+            return response
+
         encoded = encoder.MultipartEncoder(
             fields={"json_data": json.dumps(dataFileDict),
                     'attached_file': (uploadModel.filename,
@@ -153,7 +239,278 @@ class DataFileModel(object):
 
         multipart = encoder.MultipartEncoderMonitor(encoded, progressCallback)
 
-        headers = SETTINGS.defaultHeaders
-        headers['Content-Type'] = multipart.content_type
-        response = requests.post(url, data=multipart, headers=headers)
+        try:
+            response = SESSION.PostUpload(
+                url, data=multipart,
+                headers={'Content-Type': multipart.content_type})
+        finally:
+            datafileBufferedReader.close()
         return response
+
+
+class DataFileLookupIndex(object):
+    """
+    In-memory index of a dataset's DataFile records, keyed by
+    (directory, filename).
+
+    The index is populated with a paginated listing of the whole dataset
+    the first time it is queried, so verifying the files in a dataset
+    folder requires one request per page of DataFile records, rather
+    than one request per file.  If the listing fails, lookups fall back
+    to querying one file at a time.  Files whose DataFile records could
+    have changed since the listing (see Invalidate) are also looked up
+    individually.
+    """
+    def __init__(self, dataset):
+        self.dataset = dataset
+        self.dataFilesJson = dict()
+        self.duplicates = set()
+        self.invalidated = set()
+        self.populated = False
+        self.failed = False
+        self.lock = threading.Lock()
+
+    def Populate(self):
+        """
+        Request the dataset's DataFile records from MyTardis.
+
+        :raises requests.exceptions.HTTPError:
+        """
+        self.dataFilesJson = dict()
+        self.duplicates = set()
+        numDataFiles = 0
+        for dataFileJson in \
+                DataFileModel.GetDataFilesForDataset(self.dataset):
+            # Parameter sets aren't needed for verification:
+            dataFileJson.pop('parameter_sets', None)
+            key = (dataFileJson.get('directory') or "",
+                   dataFileJson['filename'])
+            if key in self.dataFilesJson:
+                self.duplicates.add(key)
+            self.dataFilesJson[key] = dataFileJson
+            numDataFiles += 1
+        self.populated = True
+        logger.debug("Indexed %s DataFile record(s) for dataset ID %s"
+                     % (numDataFiles, self.dataset.datasetId))
+
+    def GetDataFile(self, filename, directory):
+        """
+        Lookup datafile by filename and directory, populating the
+        index first if necessary.
+
+        Raises the same exceptions as DataFileModel.GetDataFile, so
+        callers can use either lookup method interchangeably.
+
+        :raises requests.exceptions.HTTPError:
+        """
+        with self.lock:
+            if not self.populated and not self.failed:
+                try:
+                    self.Populate()
+                except (requests.exceptions.RequestException, ValueError) \
+                        as err:
+                    logger.warning(
+                        "Couldn't list DataFile records for dataset ID %s, "
+                        "so they will be looked up individually: %s"
+                        % (self.dataset.datasetId, err))
+                    self.dataFilesJson = dict()
+                    self.failed = True
+        key = (directory or "", filename)
+        if self.failed or key in self.invalidated:
+            return DataFileModel.GetDataFile(
+                dataset=self.dataset, filename=filename, directory=directory)
+        if key in self.duplicates:
+            raise MultipleObjectsReturned(
+                message="Multiple datafiles matching %s were found in MyTardis"
+                % filename)
+        if key not in self.dataFilesJson:
+            raise DoesNotExist(
+                message="Datafile \"%s\" was not found in MyTardis" % filename)
+        return DataFileModel(
+            dataset=self.dataset, dataFileJson=self.dataFilesJson[key])
+
+
+    def Invalidate(self, filename, directory):
+        """
+        Look up a file's DataFile record individually from now on, e.g.
+        because the file has been modified after being uploaded, so its
+        DataFile record could have been created after the listing.
+        """
+        with self.lock:
+            self.invalidated.add((directory or "", filename))
+
+
+class DataFileCreationRequest(object):
+    """
+    A DataFile record waiting to be created in a batch
+    """
+    def __init__(self, dataFileDict):
+        self.dataFileDict = dataFileDict
+        self.done = threading.Event()
+        self.lead = False
+        self.created = None
+        self.error = None
+
+
+class DataFileCreationBatcher(object):
+    """
+    Creates DataFile records for staging uploads with as few requests to
+    MyTardis as possible.
+
+    The first upload thread to request a DataFile record for a dataset
+    leads.  Requests for the same dataset from other upload threads which
+    arrive while the leader's request is in progress are queued, and the
+    next thread in the queue creates up to maxBatchSize of them with one
+    bulk request, so no upload waits for more than one request ahead of
+    its own.  As each upload thread waits for its own DataFile record, a
+    batch can't hold more DataFile records than there are upload threads.
+
+    Create returns None if the DataFile record should be created
+    individually with DataFileModel.CreateDataFileForStagingUpload, i.e.
+    if MyTardis rejected the bulk request (bulk requests are expected to
+    create all or none of their DataFile records).  If MyTardis doesn't
+    support bulk requests, all DataFile records are created individually
+    until Configure is called.  If the bulk request fails in any other way,
+    e.g. with a connection error or an unexpected response, MyTardis could
+    still have created the DataFile records, so creating them individually
+    could duplicate them.  Instead, Create raises the error in each upload
+    thread in the batch, failing those uploads, so that they are retried
+    (with any DataFile records which were created) by a later scan.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.maxBatchSize = 500
+        self.bulkSupported = True
+        self.pending = dict()
+        self.running = set()
+        self.numDataFiles = 0
+        self.numRequests = 0
+
+    def Configure(self, maxBatchSize):
+        """
+        Set the maximum number of DataFile records created per request
+        (1 disables bulk requests), and reset the counts
+        """
+        with self.lock:
+            self.maxBatchSize = maxBatchSize
+            self.bulkSupported = True
+            self.numDataFiles = 0
+            self.numRequests = 0
+
+    def Create(self, dataFileDict):
+        """
+        Create a DataFile record for a staging upload, possibly sharing a
+        request with other upload threads.
+
+        :return: (datafileId, tempUrl), or None if the DataFile record
+                 should be created individually
+        """
+        if self.maxBatchSize <= 1 or not self.bulkSupported:
+            return None
+        key = dataFileDict['dataset']
+        request = DataFileCreationRequest(dataFileDict)
+        with self.lock:
+            self.pending.setdefault(key, []).append(request)
+            lead = key not in self.running
+            if lead:
+                self.running.add(key)
+        if not lead:
+            request.done.wait()
+            if not request.lead:
+                if request.error:
+                    raise request.error
+                return request.created
+        with self.lock:
+            batch = self.pending[key][:self.maxBatchSize]
+            del self.pending[key][:self.maxBatchSize]
+        created = None
+        try:
+            if self.bulkSupported:
+                created = self.CreateBatch(batch)
+            if created:
+                for queued, createdDataFile in zip(batch, created):
+                    queued.created = createdDataFile
+        except Exception as err:
+            # MyTardis could have created the DataFile records before the
+            # request failed, so they mustn't be created individually:
+            created = None
+            for queued in batch:
+                queued.created = None
+                queued.error = err
+            logger.warning(
+                "Failed to create %s DataFile records with one request: %s"
+                % (len(batch), err))
+            raise
+        finally:
+            # The lead must be handed over and the queued requests woken
+            # whatever happened, otherwise they would wait forever:
+            self.HandOver(key, batch, request, created)
+        return request.created
+
+    def HandOver(self, key, batch, request, created):
+        """
+        Update the counts once the leader's batch has been sent (or has
+        failed), hand the lead over to the next queued request for the
+        dataset (if any), and wake the other requests in the batch
+        """
+        with self.lock:
+            if created:
+                self.numDataFiles += len(batch)
+                self.numRequests += 1
+            if self.pending.get(key):
+                self.pending[key][0].lead = True
+                self.pending[key][0].done.set()
+            else:
+                self.pending.pop(key, None)
+                self.running.discard(key)
+        for queued in batch:
+            if queued is not request:
+                queued.done.set()
+
+    def CreateBatch(self, batch):
+        """
+        Create a batch of DataFile records with one request
+
+        :return: a list of (datafileId, tempUrl), or None if MyTardis
+                 rejected the request
+        :raises requests.exceptions.HTTPError:
+        """
+        response = DataFileModel.CreateDataFilesForStagingUpload(
+            [queued.dataFileDict for queued in batch])
+        if response.status_code in (404, 405, 501):
+            logger.info(
+                "MyTardis doesn't support creating DataFile records in "
+                "bulk, so they will be created individually.")
+            self.bulkSupported = False
+            return None
+        if response.status_code == 400:
+            # Creating the DataFile records individually will report
+            # which record was rejected (e.g. for not having an MD5 sum):
+            logger.warning(
+                "MyTardis rejected a request to create %s DataFile records: "
+                "%s" % (len(batch), response.text))
+            return None
+        response.raise_for_status()
+        dataFilesJson = response.json()['objects']
+        if len(dataFilesJson) != len(batch):
+            raise ValueError(
+                "Expected %s DataFile records, but MyTardis returned %s."
+                % (len(batch), len(dataFilesJson)))
+        return [(str(dataFileJson['id']), dataFileJson['temp_url'])
+                for dataFileJson in dataFilesJson]
+
+    def LogCounts(self):
+        """
+        Log the number of DataFile records created in bulk, and reset the
+        counts
+        """
+        with self.lock:
+            if self.numDataFiles:
+                logger.debug(
+                    "Created %s DataFile record(s) with %s bulk request(s)."
+                    % (self.numDataFiles, self.numRequests))
+            self.numDataFiles = 0
+            self.numRequests = 0
+
+
+DATAFILE_CREATION_BATCHER = DataFileCreationBatcher()
@@ -4,12 +4,11 @@ Model class for MyTardis API v1's DatasetResource.
 import json
 import urllib
 
-import requests
-
 from ..settings import SETTINGS
 from ..threads.flags import FLAGS
 from ..logs import logger
 from ..utils.exceptions import DoesNotExist
+from ..utils.session import SESSION
 
 
 class DatasetModel(object):
@@ -100,8 +99,7 @@ class DatasetModel(object):
                         % (SETTINGS.general.myTardisUrl, experiment.viewUri)
                 logger.testrun(message)
                 return None
-            response = requests.post(headers=SETTINGS.defaultHeaders,
-                                     url=url, data=data.encode())
+            response = SESSION.Post(url, data=data.encode())
             response.raise_for_status()
             newDatasetJson = response.json()
             return DatasetModel(newDatasetJson)
@@ -128,12 +126,11 @@ class DatasetModel(object):
                                     description))
         urlWithInstrument = "%s&instrument__id=%s"\
             % (url, SETTINGS.general.instrument.instrumentId)
-        response = requests.get(
-            headers=SETTINGS.defaultHeaders, url=urlWithInstrument)
+        response = SESSION.Get(urlWithInstrument)
         if response.status_code == 400:
             logger.debug(
                 "MyTardis doesn't support filtering datasets by instrument")
-            response = requests.get(headers=SETTINGS.defaultHeaders, url=url)
+            response = SESSION.Get(url)
         response.raise_for_status()
         datasetsJson = response.json()
         numDatasets = datasetsJson['meta']['total_count']
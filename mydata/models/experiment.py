@@ -4,12 +4,11 @@ Model class for MyTardis API v1's ExperimentResource.
 import json
 import urllib
 
-import requests
-
 from ..settings import SETTINGS
 from ..threads.flags import FLAGS
 from ..logs import logger
 from ..utils.exceptions import DoesNotExist
+from ..utils.session import SESSION
 from .objectacl import ObjectAclModel
 
 
@@ -66,7 +65,7 @@ class ExperimentModel(object):
                 % urllib.parse.quote(folderModel.groupFolderName.encode('utf-8'))
 
         logger.debug(url)
-        response = requests.get(url=url, headers=SETTINGS.defaultHeaders)
+        response = SESSION.Get(url)
         response.raise_for_status()
         experimentsJson = response.json()
         numExperimentsFound = experimentsJson['meta']['total_count']
@@ -142,9 +141,7 @@ class ExperimentModel(object):
                 {"name": "group_folder_name", "value": groupFolderName})
         url = "%s/api/v1/mydata_experiment/" % SETTINGS.general.myTardisUrl
         logger.debug(url)
-        response = requests.post(headers=SETTINGS.defaultHeaders,
-                                 url=url,
-                                 data=json.dumps(experimentJson).encode())
+        response = SESSION.Post(url, data=json.dumps(experimentJson).encode())
         response.raise_for_status()
         createdExperimentJson = response.json()
         createdExperiment = ExperimentModel(createdExperimentJson)
@@ -2,9 +2,8 @@
 Model class for MyTardis API v1's FacilityResource.
 """
 
-import requests
-
 from ..settings import SETTINGS
+from ..utils.session import SESSION
 from .group import GroupModel
 
 
@@ -42,7 +41,7 @@ class FacilityModel(object):
         """
         facilities = []
         url = "%s/api/v1/facility/?format=json" % SETTINGS.general.myTardisUrl
-        response = requests.get(url=url, headers=SETTINGS.defaultHeaders)
+        response = SESSION.Get(url)
         response.raise_for_status()
         facilitiesJson = response.json()
         for facilityJson in facilitiesJson['objects']:
@@ -6,11 +6,22 @@ import os
 import time
 from datetime import datetime
 import hashlib
+import threading
 import traceback
-from fnmatch import fnmatch
 
 from ..settings import SETTINGS
 from ..logs import logger
+from ..utils.filetable import DataFileTable
+from ..utils.patterns import PATTERN_MATCHERS
+from ..utils.scanindex import SCAN_INDEX
+from ..utils.scanner import ScanFolder
+from ..utils.scanner import StatFile
+
+# When a folder's files are streamed to its verification worker while the
+# folder is being scanned, the worker is notified after this many files
+# have been found, or after this many seconds:
+FILE_BATCH_SIZE = 1000
+FILE_BATCH_INTERVAL = 1.0
 
 
 class FolderModel(object):
@@ -21,7 +32,8 @@ class FolderModel(object):
     # pylint: disable=too-many-public-methods
     def __init__(self, dataViewId, folderName, location, userFolderName,
                  groupFolderName, owner, group=None,
-                 isExperimentFilesFolder=False):
+                 isExperimentFilesFolder=False, scanFiles=True,
+                 streamFiles=False):
 
         self.dataViewFields = dict(
             dataViewId=dataViewId,
@@ -38,11 +50,24 @@ class FolderModel(object):
         # collect these files:
         self.isExperimentFilesFolder = isExperimentFilesFolder
 
-        self.dataFilePaths = dict(
-            files=[],
-            directories=[],
-            uploaded=[])
-        self.PopulateDataFilePaths()
+        # Each file's directory, filename and upload state, and a snapshot
+        # of its size, timestamps and inode (FileStat) recorded while
+        # scanning, so we don't need to stat each file again:
+        self.dataFiles = DataFileTable(self.absoluteFolderPath)
+        # Maps each file's path to its index, for AddDataFile:
+        self.dataFileIndices = None
+        # Notified as files are found by PopulateDataFilePaths, so that
+        # DataFileBatches can yield them while the scan is in progress:
+        self.dataFilesFound = threading.Condition()
+        self.finishedScanningFiles = threading.Event()
+        if streamFiles:
+            # The caller will call PopulateDataFilePaths after adding the
+            # folder to the Folders view:
+            pass
+        elif scanFiles:
+            self.PopulateDataFilePaths()
+        else:
+            self.finishedScanningFiles.set()
 
         self.userFolderName = userFolderName
         self.groupFolderName = groupFolderName
@@ -50,60 +75,137 @@ class FolderModel(object):
         self.datasetModel = None
         self.experimentModel = None
 
+        # Populated on demand when bulk DataFile lookups are enabled:
+        self.dataFileLookupIndex = None
+
+    @property
+    def absoluteFolderPath(self):
+        """
+        The folder's root directory, which contains its data files
+        """
+        if self.isExperimentFilesFolder:
+            return self.location
+        return os.path.join(self.location, self.folderName)
+
     def PopulateDataFilePaths(self):
         """
         Populate data file paths within folder object
+
+        Files found so far are available from DataFileBatches while the
+        scan is in progress.
         """
-        if self.isExperimentFilesFolder:
-            absoluteFolderPath = self.location
-        else:
-            absoluteFolderPath = os.path.join(self.location, self.folderName)
-
-        for dirname, _, files in os.walk(absoluteFolderPath):
-            for filename in sorted(files):
-                if SETTINGS.filters.useIncludesFile and \
-                        not SETTINGS.filters.useExcludesFile:
-                    if not FolderModel.MatchesIncludes(filename):
-                        logger.debug("Ignoring %s, not matching includes."
-                                     % filename)
-                        continue
-                elif not SETTINGS.filters.useIncludesFile and \
-                        SETTINGS.filters.useExcludesFile:
-                    if FolderModel.MatchesExcludes(filename):
-                        logger.debug("Ignoring %s, matching excludes."
-                                     % filename)
-                        continue
-                elif SETTINGS.filters.useIncludesFile and \
-                        SETTINGS.filters.useExcludesFile:
-                    if FolderModel.MatchesExcludes(filename) and \
-                            not FolderModel.MatchesIncludes(filename):
-                        logger.debug("Ignoring %s, matching excludes "
-                                     "and not matching includes."
-                                     % filename)
-                        continue
-                self.dataFilePaths['files'].append(
-                    os.path.join(dirname, filename))
-                self.dataFilePaths['directories']\
-                    .append(os.path.relpath(dirname, absoluteFolderPath))
-                self.dataFilePaths['uploaded'].append(False)
-            if self.isExperimentFilesFolder:
-                break
-        self.ConvertSubdirectoriesToMyTardisFormat()
-        self.dataViewFields['status'] = \
-            "0 of %d files uploaded" % self.numFiles
+        absoluteFolderPath = self.absoluteFolderPath
+        recursive = not self.isExperimentFilesFolder
+        scanIndex = SCAN_INDEX if SCAN_INDEX.active else None
+        lastDirname = directory = None
+        lastNotified = 0
+        lastNotifiedTime = time.time()
+        try:
+            for dirname, filename, fileStat in ScanFolder(
+                    absoluteFolderPath, recursive,
+                    filenamesFilter=FolderModel.FilterFilenames,
+                    scanIndex=scanIndex):
+                if dirname != lastDirname:
+                    lastDirname = dirname
+                    directory = self.GetSubdirectory(dirname)
+                dataFileIndex = self.dataFiles.Append(
+                    directory, filename, fileStat)
+                if dataFileIndex + 1 - lastNotified >= FILE_BATCH_SIZE or \
+                        time.time() - lastNotifiedTime >= FILE_BATCH_INTERVAL:
+                    lastNotified = dataFileIndex + 1
+                    lastNotifiedTime = time.time()
+                    self.UpdateStatus()
+                    with self.dataFilesFound:
+                        self.dataFilesFound.notify_all()
+        finally:
+            self.UpdateStatus()
+            with self.dataFilesFound:
+                self.finishedScanningFiles.set()
+                self.dataFilesFound.notify_all()
+
+    def DataFileBatches(self, timeout=1.0):
+        """
+        Yield ranges of data file indices as files are found, until the
+        folder has been scanned.  If no new files are found within timeout
+        seconds, an empty range is yielded, so the caller can check whether
+        it should stop waiting.
+        """
+        start = 0
+        while True:
+            with self.dataFilesFound:
+                if self.numFiles == start and \
+                        not self.finishedScanningFiles.isSet():
+                    self.dataFilesFound.wait(timeout)
+                finished = self.finishedScanningFiles.isSet()
+                end = self.numFiles
+            yield range(start, end)
+            start = end
+            if finished:
+                return
+
+    def AddDataFile(self, dataFilePath, fileStat):
+        """
+        Add a file found after the folder was scanned, e.g. by the
+        FolderWatcher used for the "Watch" schedule type.  If the file was
+        already included, but has been modified since its FileStat was
+        recorded (e.g. it was still being written when the folder was
+        scanned), its FileStat is updated, and it is marked as not uploaded,
+        so that it can be verified (and uploaded) again.  Its DataFile
+        record will be looked up individually, rather than in the lookup
+        index, which could have been populated before the record was
+        created.
+
+        Returns the file's index, or None if the file was already included
+        and hasn't been modified, or is excluded by the includes/excludes
+        file filters.
+        """
+        if self.dataFileIndices is None:
+            self.dataFileIndices = self.dataFiles.GetIndices()
+        if dataFilePath in self.dataFileIndices:
+            dataFileIndex = self.dataFileIndices[dataFilePath]
+            recorded = self.dataFiles.GetStat(dataFileIndex)
+            if recorded.size == fileStat.size and \
+                    recorded.mtimeNs == fileStat.mtimeNs:
+                return None
+            self.dataFiles.SetStat(dataFileIndex, fileStat)
+            self.SetDataFileUploaded(dataFileIndex, uploaded=False)
+            lookupIndex = self.dataFileLookupIndex
+            if lookupIndex:
+                # The file's DataFile record could have been created after
+                # the lookup index was populated:
+                lookupIndex.Invalidate(
+                    self.GetDataFileName(dataFileIndex),
+                    self.GetDataFileDirectory(dataFileIndex))
+            return dataFileIndex
+        dirname, filename = os.path.split(dataFilePath)
+        if not FolderModel.FilterFilenames([filename]):
+            return None
+        dataFileIndex = self.dataFiles.Append(
+            self.GetSubdirectory(dirname), filename, fileStat)
+        self.dataFileIndices[dataFilePath] = dataFileIndex
+        self.UpdateStatus()
+        return dataFileIndex
+
+    def GetSubdirectory(self, dirname):
+        """
+        Return a directory's path relative to the folder's root directory,
+        using an empty string (rather than ".") for the root directory
+        itself.  The data file table converts subdirectories to MyTardis
+        format (with forward slashes) for the DataFile directory field.
+        """
+        directory = os.path.relpath(dirname, self.absoluteFolderPath)
+        if directory == ".":
+            return ""
+        return directory
 
-    def ConvertSubdirectoriesToMyTardisFormat(self):
+    def UpdateStatus(self):
         """
-        When we write a subdirectory path into the directory field of a
-        MyTardis DataFile record, we use forward slashes, and use an
-        empty string (rather than ".") to indicate that the file is in
-        the dataset's top-level directory
+        Update the number of files uploaded displayed in the Status column
+        of the Folders view
         """
-        for i in range(0, len(self.dataFilePaths['directories'])):
-            if self.dataFilePaths['directories'][i] == ".":
-                self.dataFilePaths['directories'][i] = ""
-            self.dataFilePaths['directories'][i] = \
-                self.dataFilePaths['directories'][i].replace("\\", "/")
+        self.dataViewFields['status'] = \
+            "%d of %d files uploaded" % (self.dataFiles.numUploaded,
+                                         self.numFiles)
 
     def __hash__(self):
         """
@@ -126,18 +228,15 @@ class FolderModel(object):
         Used to update the number of files uploaded per folder
         displayed in the Status column of the Folders view.
         """
-        self.dataFilePaths['uploaded'][dataFileIndex] = uploaded
-        numFilesUploaded = sum(self.dataFilePaths['uploaded'])
-        self.dataViewFields['status'] = \
-            "%d of %d files uploaded" % (numFilesUploaded,
-                                         self.numFiles)
+        self.dataFiles.SetUploaded(dataFileIndex, uploaded)
+        self.UpdateStatus()
 
     def GetDataFilePath(self, dataFileIndex):
         """
         Get the absolute path to a file within this folder's root directory
         which is os.path.join(self.location, self.folderName)
         """
-        return self.dataFilePaths['files'][dataFileIndex]
+        return self.dataFiles.GetPath(dataFileIndex)
 
     def GetDataFileRelPath(self, dataFileIndex):
         """
@@ -153,28 +252,49 @@ class FolderModel(object):
         folder's root directory which is
         os.path.join(self.location, self.folderName)
         """
-        return self.dataFilePaths['directories'][dataFileIndex]
+        return self.dataFiles.GetDirectory(dataFileIndex)
 
     def GetDataFileName(self, dataFileIndex):
         """
         Return a file's filename
         """
-        return os.path.basename(self.dataFilePaths['files'][dataFileIndex])
+        return self.dataFiles.GetFilename(dataFileIndex)
+
+    def GetDataFileStat(self, dataFileIndex):
+        """
+        Return a file's size, timestamps and inode (FileStat), as recorded
+        when the folder was scanned, or by the most recent
+        RefreshDataFileStat call
+        """
+        return self.dataFiles.GetStat(dataFileIndex)
+
+    def RefreshDataFileStat(self, dataFileIndex):
+        """
+        Stat the file again, updating the snapshot recorded when the folder
+        was scanned.  This should only be used where staleness matters, e.g.
+        just before uploading a file.
+
+        Returns the updated FileStat, or None if the file has been moved,
+        renamed or deleted.
+        """
+        fileStat = StatFile(self.GetDataFilePath(dataFileIndex))
+        if fileStat:
+            self.dataFiles.SetStat(dataFileIndex, fileStat)
+        return fileStat
 
     def GetDataFileSize(self, dataFileIndex):
         """
         Return a file's size on disk
         """
-        return os.stat(self.GetDataFilePath(dataFileIndex)).st_size
+        return self.GetDataFileStat(dataFileIndex).size
 
     def GetDataFileCreatedTime(self, dataFileIndex):
         """
         Return a file's created time on disk
         """
-        absoluteFilePath = self.GetDataFilePath(dataFileIndex)
         try:
             createdTimeIsoString = datetime.fromtimestamp(
-                os.stat(absoluteFilePath).st_ctime).isoformat()
+                self.GetDataFileStat(dataFileIndex).ctime).isoformat()
             return createdTimeIsoString
         except:
             logger.error(traceback.format_exc())
@@ -184,10 +304,9 @@ class FolderModel(object):
         """
         Return a file's modified time on disk
         """
-        absoluteFilePath = self.GetDataFilePath(dataFileIndex)
         try:
             modifiedTimeIsoString = datetime.fromtimestamp(
-                os.stat(absoluteFilePath).st_mtime).isoformat()
+                self.GetDataFileStat(dataFileIndex).mtime).isoformat()
             return modifiedTimeIsoString
         except:
             logger.error(traceback.format_exc())
@@ -212,7 +331,7 @@ class FolderModel(object):
         """
         Return total number of files in this folder
         """
-        return len(self.dataFilePaths['files'])
+        return len(self.dataFiles)
 
     def GetValueForKey(self, key):
         """
@@ -230,12 +349,8 @@ class FolderModel(object):
         """
         Set created date
         """
-        if self.isExperimentFilesFolder:
-            absoluteFolderPath = self.location
-        else:
-            absoluteFolderPath = os.path.join(self.location, self.folderName)
         self.dataViewFields['created'] = datetime.fromtimestamp(
-            os.stat(absoluteFolderPath).st_ctime)\
+            os.stat(self.absoluteFolderPath).st_ctime)\
             .strftime('%Y-%m-%d')
 
     @property
@@ -252,24 +367,50 @@ class FolderModel(object):
         """
         self.dataViewFields['experimentTitle'] = title
 
+    @staticmethod
+    def FilterFilenames(filenames):
+        """
+        Apply the includes and/or excludes file filters (if enabled) to a
+        directory listing, returning the filenames which should be uploaded.
+        """
+        useIncludesFile = SETTINGS.filters.useIncludesFile
+        useExcludesFile = SETTINGS.filters.useExcludesFile
+        if not useIncludesFile and not useExcludesFile:
+            return filenames
+        if useIncludesFile:
+            includes = PATTERN_MATCHERS.GetMatcher(
+                SETTINGS.filters.includesFile).Match(filenames)
+        if useExcludesFile:
+            excludes = PATTERN_MATCHERS.GetMatcher(
+                SETTINGS.filters.excludesFile).Match(filenames)
+        keep = []
+        for filename in filenames:
+            if useIncludesFile and not useExcludesFile:
+                if filename not in includes:
+                    logger.debug("Ignoring %s, not matching includes."
+                                 % filename)
+                    continue
+            elif not useIncludesFile and useExcludesFile:
+                if filename in excludes:
+                    logger.debug("Ignoring %s, matching excludes."
+                                 % filename)
+                    continue
+            elif filename in excludes and filename not in includes:
+                logger.debug("Ignoring %s, matching excludes "
+                             "and not matching includes."
+                             % filename)
+                continue
+            keep.append(filename)
+        return keep
+
     @staticmethod
     def MatchesPatterns(filename, includesOrExcludesFile):
         """
         Return True if file matches at least one pattern in the includes
         or excludes file.
         """
-        match = False
-        with open(includesOrExcludesFile, 'r') as patternsFile:
-            for glob in patternsFile.readlines():
-                glob = glob.strip()
-                if glob == "":
-                    continue
-                if glob.startswith(";"):
-                    continue
-                if glob.startswith("#"):
-                    continue
-                match = match or fnmatch(filename, glob)
-        return match
+        return PATTERN_MATCHERS.GetMatcher(
+            includesOrExcludesFile).Matches(filename)
 
     @staticmethod
     def MatchesIncludes(filename):
@@ -294,10 +435,13 @@ class FolderModel(object):
         Check whether this file's upload should be skipped because it has been
         modified too recently and might require further local modifications
         before its upload.
+
+        This uses the modified time recorded by the most recent scan or
+        RefreshDataFileStat call.
         """
         if SETTINGS.filters.ignoreNewFiles:
-            absoluteFilePath = self.GetDataFilePath(dataFileIndex)
-            tooNew = (time.time() - os.path.getmtime(absoluteFilePath)) <= \
+            mtime = self.GetDataFileStat(dataFileIndex).mtime
+            tooNew = (time.time() - mtime) <= \
                 (SETTINGS.filters.ignoreNewFilesMinutes * 60)
         else:
             tooNew = False
@@ -337,9 +481,7 @@ class FolderModel(object):
         """
         Reset counts of uploaded files etc.
         """
-        self.dataFilePaths['uploaded'] = []
-        for _ in range(0, self.numFiles):
-            self.dataFilePaths['uploaded'].append(False)
+        self.dataFiles.ResetUploaded()
 
     @property
     def dataViewId(self):
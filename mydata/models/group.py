@@ -3,11 +3,10 @@ Model class for MyTardis API v1's GroupResource.
 """
 import urllib
 
-import requests
-
 from ..settings import SETTINGS
 from ..logs import logger
 from ..utils.exceptions import DoesNotExist
+from ..utils.session import SESSION
 
 
 class GroupModel(object):
@@ -46,7 +45,7 @@ class GroupModel(object):
         url = "%s/api/v1/group/?format=json&name=%s" \
             % (SETTINGS.general.myTardisUrl,
                urllib.parse.quote(name.encode('utf-8')))
-        response = requests.get(url=url, headers=SETTINGS.defaultHeaders)
+        response = SESSION.Get(url)
         response.raise_for_status()
         groupsJson = response.json()
         numGroupsFound = groupsJson['meta']['total_count']
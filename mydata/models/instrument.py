@@ -5,12 +5,11 @@ Model class for MyTardis API v1's InstrumentResource.
 import json
 import urllib
 
-import requests
-
 from ..settings import SETTINGS
 from ..logs import logger
 from ..utils.exceptions import DoesNotExist
 from ..utils.exceptions import DuplicateKey
+from ..utils.session import SESSION
 from .facility import FacilityModel
 
 
@@ -43,8 +42,7 @@ class InstrumentModel(object):
             "facility": facility.resourceUri,
             "name": name}
         data = json.dumps(instrumentJson)
-        headers = SETTINGS.defaultHeaders
-        response = requests.post(headers=headers, url=url, data=data.encode())
+        response = SESSION.Post(url, data=data.encode())
         response.raise_for_status()
         instrumentJson = response.json()
         return InstrumentModel(name=name, instrumentJson=instrumentJson)
@@ -59,7 +57,7 @@ class InstrumentModel(object):
         url = "%s/api/v1/instrument/?format=json&facility__id=%s&name=%s" \
             % (SETTINGS.general.myTardisUrl, facility.facilityId,
                urllib.parse.quote(name.encode('utf-8')))
-        response = requests.get(url=url, headers=SETTINGS.defaultHeaders)
+        response = SESSION.Get(url)
         response.raise_for_status()
         instrumentsJson = response.json()
         numInstrumentsFound = \
@@ -113,7 +111,6 @@ class InstrumentModel(object):
             % (SETTINGS.general.myTardisUrl, self.instrumentId)
         uploaderJson = {"name": name}
         data = json.dumps(uploaderJson)
-        headers = SETTINGS.defaultHeaders
-        response = requests.put(headers=headers, url=url, data=data.encode())
+        response = SESSION.Put(url, data=data.encode())
         response.raise_for_status()
         logger.info("Renaming instrument succeeded.")
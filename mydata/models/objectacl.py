@@ -3,10 +3,10 @@ Model class for MyTardis API v1's ObjectACLResource.
 """
 
 import json
-import requests
 
 from ..settings import SETTINGS
 from ..logs import logger
+from ..utils.session import SESSION
 
 
 class ObjectAclModel(object):
@@ -38,8 +38,7 @@ class ObjectAclModel(object):
             "expiryDate": None}
 
         url = myTardisUrl + "/api/v1/objectacl/"
-        response = requests.post(headers=SETTINGS.defaultHeaders, url=url,
-                                 data=json.dumps(objectAclJson).encode())
+        response = SESSION.Post(url, data=json.dumps(objectAclJson).encode())
         response.raise_for_status()
         logger.debug("Shared experiment with user " + user.username + ".")
 
@@ -68,7 +67,6 @@ class ObjectAclModel(object):
             "expiryDate": None}
 
         url = myTardisUrl + "/api/v1/objectacl/"
-        response = requests.post(headers=SETTINGS.defaultHeaders, url=url,
-                                 data=json.dumps(objectAclJson).encode())
+        response = SESSION.Post(url, data=json.dumps(objectAclJson).encode())
         response.raise_for_status()
         logger.debug("Shared experiment with group " + group.name + ".")
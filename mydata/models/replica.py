@@ -2,10 +2,9 @@
 Model class for MyTardis API v1's ReplicaResource.
 """
 
-import requests
-
 from ..settings import SETTINGS
 from ..utils import UnderscoreToCamelcase
+from ..utils.session import SESSION
 
 
 class ReplicaModel(object):
@@ -41,7 +40,7 @@ class ReplicaModel(object):
         """
         url = "%s/api/v1/mydata_replica/%s/?format=json" \
             % (SETTINGS.general.myTardisUrl, dfoId)
-        response = requests.get(url=url, headers=SETTINGS.defaultHeaders)
+        response = SESSION.Get(url)
         response.raise_for_status()
         dfoJson = response.json()
         return dfoJson['size']
@@ -54,7 +54,28 @@ class MiscellaneousSettingsModel(BaseSettingsModel):
             'progress_poll_interval',
             'immutable_datasets',
             'cache_datafile_lookups',
-            'connection_timeout'
+            'connection_timeout',
+            'bulk_datafile_lookups',
+            'use_scan_index',
+            'full_rescan_interval',
+            'watch_settle_time',
+            'watch_poll_interval',
+            'watch_use_inotify',
+            'ui_refresh_rate',
+            'use_checksum_cache',
+            'checksum_cache_size',
+            'hash_while_uploading',
+            'max_chunk_upload_threads',
+            'ssh_session_idle_timeout',
+            'sftp_write_window',
+            'use_ssh_control_master',
+            'small_file_batch_threshold',
+            'small_file_batch_bytes',
+            'datafile_creation_batch_size',
+            'use_sendfile_for_post_uploads',
+            'local_staging_path',
+            'post_upload_max_size',
+            'chunked_upload_min_size'
         ]
 
         self.default = dict(
@@ -68,12 +89,34 @@ class MiscellaneousSettingsModel(BaseSettingsModel):
             progress_poll_interval=1.0,
             immutable_datasets=False,
             cache_datafile_lookups=True,
-            connection_timeout=10.0)
+            connection_timeout=10.0,
+            bulk_datafile_lookups=False,
+            use_scan_index=False,
+            full_rescan_interval=24,
+            watch_settle_time=10.0,
+            watch_poll_interval=30.0,
+            watch_use_inotify=True,
+            ui_refresh_rate=10.0,
+            use_checksum_cache=True,
+            checksum_cache_size=100000,
+            hash_while_uploading=True,
+            max_chunk_upload_threads=4,
+            ssh_session_idle_timeout=60.0,
+            sftp_write_window=8,
+            use_ssh_control_master=True,
+            small_file_batch_threshold=0,
+            small_file_batch_bytes=64 * 1024 * 1024,
+            datafile_creation_batch_size=500,
+            use_sendfile_for_post_uploads=True,
+            local_staging_path="",
+            post_upload_max_size=0,
+            chunked_upload_min_size=0)
 
         # Settings determined from command-line arguments of the
         # MyData binary or the run.py entry point which are
         # not saved in MyData.cfg:
         self.autoexit = False
+        self.fullRescan = False
 
     @property
     def locked(self):
@@ -243,6 +286,402 @@ class MiscellaneousSettingsModel(BaseSettingsModel):
         """
         self.mydataConfig['connection_timeout'] = connectionTimeout
 
+    @property
+    def bulkDataFileLookups(self):
+        """
+        Returns True if MyData will look up all of a dataset's DataFile
+        records with a paginated listing, instead of querying MyTardis
+        once for each local file
+        """
+        return self.mydataConfig['bulk_datafile_lookups']
+
+    @bulkDataFileLookups.setter
+    def bulkDataFileLookups(self, bulkDataFileLookups):
+        """
+        Set this to True if MyData should look up all of a dataset's
+        DataFile records with a paginated listing, instead of querying
+        MyTardis once for each local file
+        """
+        self.mydataConfig['bulk_datafile_lookups'] = bulkDataFileLookups
+
+    @property
+    def useScanIndex(self):
+        """
+        Returns True if MyData will record dataset folder listings in a scan
+        index, so that unchanged directories don't need to be listed again
+        """
+        return self.mydataConfig['use_scan_index']
+
+    @useScanIndex.setter
+    def useScanIndex(self, useScanIndex):
+        """
+        Set this to True if MyData should record dataset folder listings in
+        a scan index, so that unchanged directories don't need to be listed
+        again
+        """
+        self.mydataConfig['use_scan_index'] = useScanIndex
+
+    @property
+    def fullRescanInterval(self):
+        """
+        The interval in hours between full rescans (ignoring the scan
+        index), or 0 for no periodic full rescans
+
+        :return: the interval in hours
+        :rtype: int
+        """
+        return int(self.mydataConfig['full_rescan_interval'])
+
+    @fullRescanInterval.setter
+    def fullRescanInterval(self, fullRescanInterval):
+        """
+        Set the interval in hours between full rescans (ignoring the scan
+        index), or 0 for no periodic full rescans
+        """
+        self.mydataConfig['full_rescan_interval'] = fullRescanInterval
+
+    @property
+    def watchSettleTime(self):
+        """
+        With the "Watch" schedule type, a new file is only uploaded once its
+        size and modified time haven't changed for this many seconds
+
+        :return: the settle time in seconds
+        :rtype: float
+        """
+        return self.mydataConfig['watch_settle_time']
+
+    @watchSettleTime.setter
+    def watchSettleTime(self, watchSettleTime):
+        """
+        Set the settle time (in seconds) for new files found with the
+        "Watch" schedule type
+        """
+        self.mydataConfig['watch_settle_time'] = watchSettleTime
+
+    @property
+    def watchPollInterval(self):
+        """
+        With the "Watch" schedule type, if inotify is unavailable (or
+        disabled), the data directory is polled at this interval
+
+        :return: the interval in seconds
+        :rtype: float
+        """
+        return self.mydataConfig['watch_poll_interval']
+
+    @watchPollInterval.setter
+    def watchPollInterval(self, watchPollInterval):
+        """
+        Set the polling interval (in seconds) used with the "Watch"
+        schedule type if inotify is unavailable (or disabled)
+        """
+        self.mydataConfig['watch_poll_interval'] = watchPollInterval
+
+    @property
+    def watchUseInotify(self):
+        """
+        Returns True if the "Watch" schedule type will use inotify (on Linux)
+        instead of polling.  Polling is required for network shares, where
+        changes made by other hosts don't generate inotify events.
+        """
+        return self.mydataConfig['watch_use_inotify']
+
+    @watchUseInotify.setter
+    def watchUseInotify(self, watchUseInotify):
+        """
+        Set this to False to poll the data directory with the "Watch"
+        schedule type, instead of using inotify
+        """
+        self.mydataConfig['watch_use_inotify'] = watchUseInotify
+
+    @property
+    def uiRefreshRate(self):
+        """
+        How many times per second the Folders, Verifications and Uploads
+        views are refreshed with progress, status and message updates
+        from the worker threads
+
+        :return: the refresh rate in Hz
+        :rtype: float
+        """
+        return self.mydataConfig['ui_refresh_rate']
+
+    @uiRefreshRate.setter
+    def uiRefreshRate(self, uiRefreshRate):
+        """
+        Set the refresh rate (in Hz) for updates from the worker threads
+        """
+        self.mydataConfig['ui_refresh_rate'] = uiRefreshRate
+
+    @property
+    def useChecksumCache(self):
+        """
+        Returns True if MyData will cache the MD5 checksums of uploaded files,
+        so that unchanged files don't need to be read again when their
+        uploads are retried
+        """
+        return self.mydataConfig['use_checksum_cache']
+
+    @useChecksumCache.setter
+    def useChecksumCache(self, useChecksumCache):
+        """
+        Set this to False to calculate each file's MD5 checksum every time
+        MyData attempts to upload it
+        """
+        self.mydataConfig['use_checksum_cache'] = useChecksumCache
+
+    @property
+    def checksumCacheSize(self):
+        """
+        The maximum number of MD5 checksums kept in the checksum cache
+
+        :return: the maximum number of checksums
+        :rtype: int
+        """
+        return int(self.mydataConfig['checksum_cache_size'])
+
+    @checksumCacheSize.setter
+    def checksumCacheSize(self, checksumCacheSize):
+        """
+        Set the maximum number of MD5 checksums kept in the checksum cache
+        """
+        self.mydataConfig['checksum_cache_size'] = checksumCacheSize
+
+    @property
+    def hashWhileUploading(self):
+        """
+        Returns True if MyData will calculate MD5 sums from the data being
+        uploaded with the "Chunked" and "ParallelSSH" upload methods, instead
+        of reading each file once to calculate its MD5 sum and again to
+        upload it.  MyData falls back to calculating MD5 sums before
+        uploading if the MyTardis server requires them up front.
+        """
+        return self.mydataConfig['hash_while_uploading']
+
+    @hashWhileUploading.setter
+    def hashWhileUploading(self, hashWhileUploading):
+        """
+        Set this to False to calculate each file's MD5 sum before uploading it
+        """
+        self.mydataConfig['hash_while_uploading'] = hashWhileUploading
+
+    @property
+    def maxChunkUploadThreads(self):
+        """
+        With the "Chunked" upload method, the maximum number of chunks of
+        each file which can be uploaded concurrently
+
+        :return: the maximum number of threads per file
+        :rtype: int
+        """
+        return int(self.mydataConfig['max_chunk_upload_threads'])
+
+    @maxChunkUploadThreads.setter
+    def maxChunkUploadThreads(self, maxChunkUploadThreads):
+        """
+        Set the maximum number of chunks of each file which can be uploaded
+        concurrently with the "Chunked" upload method
+        """
+        self.mydataConfig['max_chunk_upload_threads'] = maxChunkUploadThreads
+
+    @property
+    def sshSessionIdleTimeout(self):
+        """
+        With the "ParallelSSH" upload method, SSH sessions are reused for
+        subsequent uploads, unless they have been idle for longer than this
+
+        :return: the timeout in seconds
+        :rtype: float
+        """
+        return self.mydataConfig['ssh_session_idle_timeout']
+
+    @sshSessionIdleTimeout.setter
+    def sshSessionIdleTimeout(self, sshSessionIdleTimeout):
+        """
+        Set the idle timeout (in seconds) for reusing SSH sessions
+        """
+        self.mydataConfig['ssh_session_idle_timeout'] = sshSessionIdleTimeout
+
+    @property
+    def sftpWriteWindow(self):
+        """
+        With the "ParallelSSH" upload method, the maximum number of 256 KiB
+        buffers of each file which can be in flight as SFTP write requests.
+        The SSH server's channel window (2 MiB for OpenSSH) also limits the
+        data in flight.
+
+        :return: the maximum number of buffers in flight
+        :rtype: int
+        """
+        return int(self.mydataConfig['sftp_write_window'])
+
+    @sftpWriteWindow.setter
+    def sftpWriteWindow(self, sftpWriteWindow):
+        """
+        Set the maximum number of buffers in flight for SFTP uploads
+        """
+        self.mydataConfig['sftp_write_window'] = sftpWriteWindow
+
+    @property
+    def useSshControlMaster(self):
+        """
+        Returns True if the "OpenSSH" upload method should share one
+        ControlMaster connection per staging host between its ssh and scp
+        commands (except on Windows, where it isn't supported)
+        """
+        return self.mydataConfig['use_ssh_control_master']
+
+    @useSshControlMaster.setter
+    def useSshControlMaster(self, useSshControlMaster):
+        """
+        Set this to False to open a new connection for each ssh or scp command
+        """
+        self.mydataConfig['use_ssh_control_master'] = useSshControlMaster
+
+    @property
+    def smallFileBatchThreshold(self):
+        """
+        With the "ParallelSSH" upload method, files no larger than this are
+        uploaded in batches, each streamed as one tar archive.  Set to 0 to
+        upload each file separately.
+
+        :return: the largest file size (in bytes) which can be batched
+        :rtype: int
+        """
+        return int(self.mydataConfig['small_file_batch_threshold'])
+
+    @smallFileBatchThreshold.setter
+    def smallFileBatchThreshold(self, smallFileBatchThreshold):
+        """
+        Set the largest file size (in bytes) which can be batched
+        """
+        self.mydataConfig['small_file_batch_threshold'] = \
+            smallFileBatchThreshold
+
+    @property
+    def smallFileBatchBytes(self):
+        """
+        The maximum total size of the small files uploaded in one batch
+
+        :return: the maximum batch size in bytes
+        :rtype: int
+        """
+        return int(self.mydataConfig['small_file_batch_bytes'])
+
+    @smallFileBatchBytes.setter
+    def smallFileBatchBytes(self, smallFileBatchBytes):
+        """
+        Set the maximum total size (in bytes) of each batch of small files
+        """
+        self.mydataConfig['small_file_batch_bytes'] = smallFileBatchBytes
+
+    @property
+    def dataFileCreationBatchSize(self):
+        """
+        The maximum number of DataFile records for staging uploads which can
+        be created with one request to MyTardis.  Set to 1 to create each
+        DataFile record with a separate request.
+
+        Each upload worker thread waits for its own DataFile record, so a
+        request can't create more records than there are upload worker
+        threads (max_upload_threads), whatever this is set to.
+
+        :return: the maximum number of DataFile records created per request
+        :rtype: int
+        """
+        return int(self.mydataConfig['datafile_creation_batch_size'])
+
+    @dataFileCreationBatchSize.setter
+    def dataFileCreationBatchSize(self, dataFileCreationBatchSize):
+        """
+        Set the maximum number of DataFile records created per request
+        """
+        self.mydataConfig['datafile_creation_batch_size'] = \
+            dataFileCreationBatchSize
+
+    @property
+    def useSendfileForPostUploads(self):
+        """
+        Whether HTTP POST uploads of large files (16 MB or more) send file
+        content with sendfile (or from a reusable buffer for HTTPS), rather
+        than with requests_toolbelt's MultipartEncoder.  Smaller files, and
+        uploads via a proxy, always use the pooled HTTP session.
+
+        :return: True if sendfile should be used for HTTP POST uploads
+        :rtype: bool
+        """
+        return self.mydataConfig['use_sendfile_for_post_uploads']
+
+    @useSendfileForPostUploads.setter
+    def useSendfileForPostUploads(self, useSendfileForPostUploads):
+        """
+        Set this to False to upload with requests_toolbelt's MultipartEncoder
+        """
+        self.mydataConfig['use_sendfile_for_post_uploads'] = \
+            useSendfileForPostUploads
+
+    @property
+    def localStagingPath(self):
+        """
+        The directory where the staging storage box's location is mounted
+        on this machine (e.g. via NFS or SMB).  If this is set, and uploads
+        to staging have been approved, files are copied into this directory,
+        rather than being uploaded with SSH.
+
+        :return: the local path of the staging location, or ""
+        :rtype: str
+        """
+        return self.mydataConfig['local_staging_path']
+
+    @localStagingPath.setter
+    def localStagingPath(self, localStagingPath):
+        """
+        Set the local path of the staging location
+        """
+        self.mydataConfig['local_staging_path'] = localStagingPath
+
+    @property
+    def postUploadMaxSize(self):
+        """
+        When uploads to staging have been approved, files up to this size
+        (in bytes) are uploaded with HTTP POST instead, avoiding the cost
+        of setting up an SSH transfer for tiny files.  Set to 0 to upload
+        every file to staging.
+
+        :return: the maximum size of files uploaded with HTTP POST
+        :rtype: int
+        """
+        return int(self.mydataConfig['post_upload_max_size'])
+
+    @postUploadMaxSize.setter
+    def postUploadMaxSize(self, postUploadMaxSize):
+        """
+        Set the maximum size of files uploaded with HTTP POST
+        """
+        self.mydataConfig['post_upload_max_size'] = postUploadMaxSize
+
+    @property
+    def chunkedUploadMinSize(self):
+        """
+        When uploads to staging have been approved, files of at least this
+        size (in bytes) are uploaded with the "Chunked" upload method, using
+        up to max_chunk_upload_threads parallel chunk uploads, whichever
+        upload method is selected for other files.  Set to 0 to use the
+        selected upload method for every file.
+
+        :return: the minimum size of files uploaded in parallel chunks
+        :rtype: int
+        """
+        return int(self.mydataConfig['chunked_upload_min_size'])
+
+    @chunkedUploadMinSize.setter
+    def chunkedUploadMinSize(self, chunkedUploadMinSize):
+        """
+        Set the minimum size of files uploaded in parallel chunks
+        """
+        self.mydataConfig['chunked_upload_min_size'] = chunkedUploadMinSize
+
     def SetDefaultForField(self, field):
         """
         Set default value for one field.
@@ -280,6 +280,24 @@ class SettingsModel(object):
             "verified-files-cache-%s-%s.json" %
             (parsed.scheme, parsed.netloc))
 
+    @property
+    def scanIndexPath(self):
+        """
+        We use a serialized dictionary to record dataset folder listings,
+        so unchanged directories don't need to be listed again.
+        """
+        return os.path.join(
+            os.path.dirname(self.configPath), "scan-index.json")
+
+    @property
+    def checksumCachePath(self):
+        """
+        We use a serialized dictionary to cache the MD5 checksums of files
+        we have uploaded (or attempted to upload).
+        """
+        return os.path.join(
+            os.path.dirname(self.configPath), "checksum-cache.json")
+
     def InitializeVerifiedDatafilesCache(self, resetFile=False):
         """
         We use a serialized dictionary to cache DataFile lookup results.
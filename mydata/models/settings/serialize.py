@@ -221,22 +221,40 @@ def LoadMiscellaneousSettings(settings, configParser):
     fields = ["locked", "uuid", "cipher", "use_none_cipher",
               "max_verification_threads", "verification_delay",
               "fake_md5_sum", "progress_poll_interval", "immutable_datasets",
-              "cache_datafile_lookups", "connection_timeout"]
+              "cache_datafile_lookups", "connection_timeout",
+              "bulk_datafile_lookups", "use_scan_index",
+              "full_rescan_interval", "watch_settle_time",
+              "watch_poll_interval", "watch_use_inotify", "ui_refresh_rate",
+              "use_checksum_cache", "checksum_cache_size",
+              "hash_while_uploading", "max_chunk_upload_threads",
+              "ssh_session_idle_timeout", "sftp_write_window",
+              "use_ssh_control_master", "small_file_batch_threshold",
+              "small_file_batch_bytes", "datafile_creation_batch_size",
+              "use_sendfile_for_post_uploads", "local_staging_path",
+              "post_upload_max_size", "chunked_upload_min_size"]
     for field in fields:
         if configParser.has_option(configFileSection, field):
             settings[field] = configParser.get(configFileSection, field)
     booleanFields = [
         "fake_md5_sum", "use_none_cipher", "locked", "immutable_datasets",
-        "cache_datafile_lookups"]
+        "cache_datafile_lookups", "bulk_datafile_lookups", "use_scan_index",
+        "watch_use_inotify", "use_checksum_cache", "hash_while_uploading",
+        "use_ssh_control_master", "use_sendfile_for_post_uploads"]
     for field in booleanFields:
         if configParser.has_option(configFileSection, field):
             settings[field] = configParser.getboolean(configFileSection, field)
-    intFields = ["max_verification_threads"]
+    intFields = ["max_verification_threads", "full_rescan_interval",
+                 "checksum_cache_size", "max_chunk_upload_threads",
+                 "sftp_write_window", "small_file_batch_threshold",
+                 "small_file_batch_bytes", "datafile_creation_batch_size",
+                 "post_upload_max_size", "chunked_upload_min_size"]
     for field in intFields:
         if configParser.has_option(configFileSection, field):
             settings[field] = configParser.getint(configFileSection, field)
     floatFields = [
-        "verification_delay", "progress_poll_interval", "connection_timeout"]
+        "verification_delay", "progress_poll_interval", "connection_timeout",
+        "watch_settle_time", "watch_poll_interval", "ui_refresh_rate",
+        "ssh_session_idle_timeout"]
     for field in floatFields:
         if configParser.has_option(configFileSection, field):
             try:
@@ -282,18 +300,31 @@ def CheckForUpdatedSettingsOnServer(settings):
                         "friday_checked", "saturday_checked",
                         "sunday_checked", "use_includes_file",
                         "use_excludes_file", "immutable_datasets",
-                        "cache_datafile_lookups"):
+                        "cache_datafile_lookups", "bulk_datafile_lookups",
+                        "use_scan_index", "watch_use_inotify",
+                        "use_checksum_cache", "hash_while_uploading",
+                        "use_ssh_control_master",
+                        "use_sendfile_for_post_uploads"):
                     settings[setting['key']] = (setting['value'] == "True")
                 if setting['key'] in (
                         "timer_minutes", "ignore_interval_number",
                         "ignore_new_interval_number",
                         "ignore_new_files_minutes",
                         "max_verification_threads",
-                        "max_upload_threads", "max_upload_retries"):
+                        "max_upload_threads", "max_upload_retries",
+                        "full_rescan_interval", "checksum_cache_size",
+                        "max_chunk_upload_threads", "sftp_write_window",
+                        "small_file_batch_threshold",
+                        "small_file_batch_bytes",
+                        "datafile_creation_batch_size",
+                        "post_upload_max_size",
+                        "chunked_upload_min_size"):
                     settings[setting['key']] = int(setting['value'])
                 elif setting['key'] in (
                         "progress_poll_interval", "verification_delay",
-                        "connection_timeout"):
+                        "connection_timeout", "watch_settle_time",
+                        "watch_poll_interval", "ui_refresh_rate",
+                        "ssh_session_idle_timeout"):
                     try:
                         settings[setting['key']] = float(setting['value'])
                     except ValueError:
@@ -356,7 +387,17 @@ def SaveSettingsToDisk(configPath=None):
                   "progress_poll_interval", "verification_delay",
                   "start_automatically_on_login", "on_start_run", "immutable_datasets",
                   "cache_datafile_lookups", "upload_invalid_user_folders",
-                  "connection_timeout"]
+                  "connection_timeout", "bulk_datafile_lookups",
+                  "use_scan_index", "full_rescan_interval",
+                  "watch_settle_time", "watch_poll_interval",
+                  "watch_use_inotify", "ui_refresh_rate",
+                  "use_checksum_cache", "checksum_cache_size",
+                  "hash_while_uploading", "max_chunk_upload_threads",
+                  "ssh_session_idle_timeout", "sftp_write_window",
+                  "use_ssh_control_master", "small_file_batch_threshold",
+                  "small_file_batch_bytes", "datafile_creation_batch_size",
+                  "use_sendfile_for_post_uploads", "local_staging_path",
+                  "post_upload_max_size", "chunked_upload_min_size"]
         settingsList = []
         for field in fields:
             value = SETTINGS[field]
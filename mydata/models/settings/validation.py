@@ -19,6 +19,8 @@ from ...threads.flags import FLAGS
 from ...utils.autostart import UpdateAutostartFile
 from ...utils.exceptions import InvalidSettings
 from ...utils.exceptions import UserAborted
+from ...utils.patterns import PATTERN_MATCHERS
+from ...utils.session import SESSION
 from ..facility import FacilityModel
 from .miscellaneous import LastSettingsUpdateTrigger
 
@@ -355,7 +357,7 @@ def CheckMyTardisCredentials(setStatusMessage):
         setStatusMessage(message)
     url = SETTINGS.general.myTardisUrl + \
         "/api/v1/user/?format=json&username=" + SETTINGS.general.username
-    response = requests.get(headers=SETTINGS.defaultHeaders, url=url)
+    response = SESSION.Get(url)
     statusCode = response.status_code
     if statusCode < 200 or statusCode >= 300:
         message = "Your MyTardis credentials are invalid.\n\n" \
@@ -505,17 +507,14 @@ def PerformGlobsFileValidation(filePath, upper, lower, field):
         message = "Specified %s file path is not a file." \
             % lower
         raise InvalidSettings(message, field)
-    with open(filePath, 'r') as globsFile:
-        for line in globsFile.readlines():
-            try:
-                # Lines starting with '#' or ';' will be ignored.
-                # Other non-blank lines are expected to be globs,
-                # e.g. *.txt
-                _ = line.strip()
-            except UnicodeDecodeError:
-                message = "%s file is not a valid plain text " \
-                    "(UTF-8) file." % upper
-                raise InvalidSettings(message, field)
+    try:
+        # Compiling the patterns now means that they won't need to be
+        # read again while scanning folders, unless the file is modified.
+        PATTERN_MATCHERS.GetMatcher(filePath)
+    except UnicodeDecodeError:
+        message = "%s file is not a valid plain text " \
+            "(UTF-8) file." % upper
+        raise InvalidSettings(message, field)
 
 
 def CheckStructureAndCountDatasets(setStatusMessage=None):
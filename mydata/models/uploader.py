@@ -81,7 +81,6 @@ import uuid
 
 import dateutil.parser
 import psutil
-import requests
 import netifaces
 
 from .. import __version__ as VERSION
@@ -94,6 +93,7 @@ from ..utils.exceptions import StorageBoxOptionNotFound
 from ..utils.exceptions import StorageBoxAttributeNotFound
 from ..utils import BytesToHuman
 from ..utils import MyDataInstallLocation
+from ..utils.session import SESSION
 from ..threads.locks import LOCKS
 from .storage import StorageBox
 
@@ -169,7 +169,7 @@ class UploaderModel(object):
         url = myTardisUrl + "/api/v1/mydata_uploader/?format=json" + \
             "&uuid=" + urllib.parse.quote(self.settings.miscellaneous.uuid)
         headers = self.settings.defaultHeaders
-        response = requests.get(
+        response = SESSION.Get(
             headers=headers, url=url,
             timeout=self.settings.miscellaneous.connectionTimeout)
         response.raise_for_status()
@@ -236,11 +236,11 @@ class UploaderModel(object):
         logger.debug(data)
         headers = self.settings.defaultHeaders
         if numExistingUploaderRecords > 0:
-            response = requests.put(
+            response = SESSION.Put(
                 headers=headers, url=url, data=data.encode(),
                 timeout=self.settings.miscellaneous.connectionTimeout)
         else:
-            response = requests.post(
+            response = SESSION.Post(
                 headers=headers, url=url, data=data.encode(),
                 timeout=self.settings.miscellaneous.connectionTimeout)
         response.raise_for_status()
@@ -296,7 +296,7 @@ class UploaderModel(object):
                 self.sshKeyPair.fingerprint)
         logger.debug(url)
         headers = self.settings.defaultHeaders
-        response = requests.get(headers=headers, url=url)
+        response = SESSION.Get(headers=headers, url=url)
         response.raise_for_status()
         logger.debug(response.text)
         existingUploaderRegReqRecords = response.json()
@@ -331,8 +331,8 @@ class UploaderModel(object):
              "requester_public_key": self.sshKeyPair.publicKey,
              "requester_key_fingerprint": self.sshKeyPair.fingerprint}
         data = json.dumps(uploaderRegistrationRequestJson)
-        response = requests.post(headers=self.settings.defaultHeaders, url=url,
-                                 data=data.encode())
+        response = SESSION.Post(headers=self.settings.defaultHeaders, url=url,
+                                data=data.encode())
         response.raise_for_status()
         return UploaderRegistrationRequest(
             uploaderRegRequestJson=response.json())
@@ -383,7 +383,7 @@ class UploaderModel(object):
             url = "%s/api/v1/mydata_uploader/?format=json&uuid=%s" \
                 % (myTardisUrl,
                    urllib.parse.quote(self.settings.miscellaneous.uuid))
-            response = requests.get(headers=headers, url=url)
+            response = SESSION.Get(headers=headers, url=url)
             response.raise_for_status()
             existingUploaderRecords = response.json()
             numExistingUploaderRecords = \
@@ -401,8 +401,8 @@ class UploaderModel(object):
             'settings': settingsList,
             'uuid': self.settings.miscellaneous.uuid
         }
-        response = requests.patch(headers=headers, url=url,
-                                  data=json.dumps(patchData).encode())
+        response = SESSION.Patch(headers=headers, url=url,
+                                 data=json.dumps(patchData).encode())
         response.raise_for_status()
 
     def GetSettings(self):
@@ -417,7 +417,7 @@ class UploaderModel(object):
         url = "%s/api/v1/mydata_uploader/?format=json&uuid=%s" \
             % (myTardisUrl, urllib.parse.quote(self.settings.miscellaneous.uuid))
         try:
-            response = requests.get(
+            response = SESSION.Get(
                 headers=headers, url=url,
                 timeout=self.settings.miscellaneous.connectionTimeout)
         except Exception as err:
@@ -3,11 +3,10 @@ Model class for MyTardis API v1's UserResource.
 """
 import urllib
 
-import requests
-
 from ..settings import SETTINGS
 from ..utils.exceptions import DoesNotExist
 from ..logs import logger
+from ..utils.session import SESSION
 from .group import GroupModel
 
 
@@ -120,7 +119,7 @@ class UserModel(object):
         """
         url = "%s/api/v1/user/?format=json&username=%s" \
             % (SETTINGS.general.myTardisUrl, username)
-        response = requests.get(url=url, headers=SETTINGS.defaultHeaders)
+        response = SESSION.Get(url)
         response.raise_for_status()
         userRecordsJson = response.json()
 
@@ -131,7 +130,7 @@ class UserModel(object):
             url = "%s/api/v1/mydata_user/?username=%s" \
                   % (SETTINGS.general.myTardisUrl, username)
             try:
-                rsp = requests.get(url=url, headers=SETTINGS.defaultHeaders)
+                rsp = SESSION.Get(url)
                 data = rsp.json()
                 userFound = data["success"]
             except:
@@ -156,7 +155,7 @@ class UserModel(object):
         url = "%s/api/v1/user/?format=json&email__iexact=%s" \
             % (SETTINGS.general.myTardisUrl,
                urllib.parse.quote(email.encode('utf-8')))
-        response = requests.get(url=url, headers=SETTINGS.defaultHeaders)
+        response = SESSION.Get(url)
         response.raise_for_status()
         userRecordsJson = response.json()
         numUserRecordsFound = userRecordsJson['meta']['total_count']
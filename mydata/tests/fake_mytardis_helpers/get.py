@@ -15,6 +15,14 @@ from . import RespondToRequestForStatusCode, RespondWithStatusCode
 # This storage box attribute can be overwritten by an ephemeral port:
 SCP_PORT = 2200
 
+# Filenames for which the fake MyTardis server has DataFile records:
+CANNED_DATAFILE_NAMES = [
+    "existing_unverified_incomplete_file.txt",
+    "existing_unverified_full_size_file.txt",
+    "existing_verified_file.txt",
+    "missing_mydata_replica_api_endpoint.txt"
+]
+
 
 def FakeMyTardisGet(mytardis):
     """
@@ -77,6 +85,9 @@ def FakeMyTardisGet(mytardis):
     if re.match(r"^.*&dataset__id=(\S+)&filename=(\S+)&directory=(\S*)$",
                 mytardis.path):
         RespondToDataFilesRequest(mytardis)
+    elif re.match(r"^.*&dataset__id=(\S+)&limit=(\d+)&offset=(\d+)$",
+                  mytardis.path):
+        RespondToDatasetDataFilesRequest(mytardis)
     elif re.match(r"^/api/v1/mydata_dataset_file/(\d+)/\?format=json$",
                   mytardis.path):
         RespondToDataFileRequest(mytardis)
@@ -598,143 +609,177 @@ def RespondToDataFilesRequest(mytardis):
     mytardis.send_header("Content-type", "application/json")
     mytardis.end_headers()
     datafilesJson = copy.deepcopy(EMPTY_API_LIST)
-    if filename == "existing_unverified_incomplete_file.txt":
+    datafileJson = GetCannedDataFileJson(datasetId, filename, directory)
+    if datafileJson:
         datafilesJson['meta']['total_count'] = 1
-        datafilesJson['objects'] = [
-            {
-                "id": 290385,
-                "created_time": "2015-06-25T00:26:21",
-                "datafile": None,
-                "dataset": "/api/v1/dataset/%s/" % datasetId,
-                "deleted": False,
-                "deleted_time": None,
-                "directory": directory,
-                "filename": filename,
-                "md5sum": "c033080e8b2ec59e37fb1a9dc341c813",
-                "mimetype": "image/jpeg",
-                "modification_time": None,
-                "parameter_sets": [],
-                "replicas": [
-                    {
-                        "created_time": "2015-10-06T10:21:48.910470",
-                        "datafile": "/api/v1/dataset_file/290385/",
-                        "id": 444891,
-                        "last_verified_time": "2015-10-06T10:21:53.952521",
-                        "resource_uri": "/api/v1/replica/444891/",
-                        "uri": "DatasetDescription-%s/%s" % (datasetId,
-                                                             filename),
-                        "verified": False
-                    }
-                ],
-                "resource_uri": "/api/v1/mydata_dataset_file/290385/",
-                "sha512sum": "",
-                "size": "36",
-                "version": 1
-            }
-        ]
+        datafilesJson['objects'] = [datafileJson]
+    mytardis.wfile.write(json.dumps(datafilesJson).encode())
+
+
+def RespondToDatasetDataFilesRequest(mytardis):
+    """
+    Respond to a request for one page of all of a dataset's DataFiles,
+    as used for bulk DataFile lookups.  The fake MyTardis server's
+    datasets all contain the DataFiles known to GetCannedDataFileJson,
+    in the dataset's top-level directory.
+
+    :param mytardis: The FakeMyTardisHandler instance
+    """
+    match = re.match(
+        r"^.*&dataset__id=(\S+)&limit=(\d+)&offset=(\d+)$", mytardis.path)
+    datasetId = match.groups()[0]
+    limit = int(match.groups()[1])
+    offset = int(match.groups()[2])
+    datafiles = [
+        GetCannedDataFileJson(datasetId, filename, "")
+        for filename in CANNED_DATAFILE_NAMES]
+    mytardis.send_response(200)
+    mytardis.send_header("Content-type", "application/json")
+    mytardis.end_headers()
+    datafilesJson = copy.deepcopy(EMPTY_API_LIST)
+    datafilesJson['meta']['limit'] = limit
+    datafilesJson['meta']['offset'] = offset
+    datafilesJson['meta']['total_count'] = len(datafiles)
+    if offset + limit < len(datafiles):
+        datafilesJson['meta']['next'] = \
+            "/api/v1/mydata_dataset_file/?format=json" \
+            "&dataset__id=%s&limit=%s&offset=%s" \
+            % (datasetId, limit, offset + limit)
+    datafilesJson['objects'] = datafiles[offset:offset + limit]
+    mytardis.wfile.write(json.dumps(datafilesJson).encode())
+
+
+def GetCannedDataFileJson(datasetId, filename, directory):
+    """
+    Return the fake DataFile record for one of the filenames the fake
+    MyTardis server knows about, or None if the filename isn't known.
+    """
+    if filename == "existing_unverified_incomplete_file.txt":
+        return {
+            "id": 290385,
+            "created_time": "2015-06-25T00:26:21",
+            "datafile": None,
+            "dataset": "/api/v1/dataset/%s/" % datasetId,
+            "deleted": False,
+            "deleted_time": None,
+            "directory": directory,
+            "filename": filename,
+            "md5sum": "c033080e8b2ec59e37fb1a9dc341c813",
+            "mimetype": "image/jpeg",
+            "modification_time": None,
+            "parameter_sets": [],
+            "replicas": [
+                {
+                    "created_time": "2015-10-06T10:21:48.910470",
+                    "datafile": "/api/v1/dataset_file/290385/",
+                    "id": 444891,
+                    "last_verified_time": "2015-10-06T10:21:53.952521",
+                    "resource_uri": "/api/v1/replica/444891/",
+                    "uri": "DatasetDescription-%s/%s" % (datasetId,
+                                                         filename),
+                    "verified": False
+                }
+            ],
+            "resource_uri": "/api/v1/mydata_dataset_file/290385/",
+            "sha512sum": "",
+            "size": "36",
+            "version": 1
+        }
     elif filename == "existing_unverified_full_size_file.txt":
-        datafilesJson['meta']['total_count'] = 1
-        datafilesJson['objects'] = [
-            {
-                "id": 290385,
-                "created_time": "2015-06-25T00:26:21",
-                "datafile": None,
-                "dataset": "/api/v1/dataset/%s/" % datasetId,
-                "deleted": False,
-                "deleted_time": None,
-                "directory": directory,
-                "filename": filename,
-                "md5sum": "e71c538337dce5b7fd36ae8db8160756",
-                "mimetype": "image/jpeg",
-                "modification_time": None,
-                "parameter_sets": [],
-                "replicas": [
-                    {
-                        "created_time": "2015-10-06T10:21:48.910470",
-                        "datafile": "/api/v1/dataset_file/290385/",
-                        "id": 444892,
-                        "last_verified_time": "2015-10-06T10:21:53.952521",
-                        "resource_uri": "/api/v1/replica/444892/",
-                        "uri": "DatasetDescription-%s/%s" % (datasetId,
-                                                             filename),
-                        "verified": False
-                    }
-                ],
-                "resource_uri": "/api/v1/mydata_dataset_file/290385/",
-                "sha512sum": "",
-                "size": "35",
-                "version": 1
-            }
-        ]
+        return {
+            "id": 290385,
+            "created_time": "2015-06-25T00:26:21",
+            "datafile": None,
+            "dataset": "/api/v1/dataset/%s/" % datasetId,
+            "deleted": False,
+            "deleted_time": None,
+            "directory": directory,
+            "filename": filename,
+            "md5sum": "e71c538337dce5b7fd36ae8db8160756",
+            "mimetype": "image/jpeg",
+            "modification_time": None,
+            "parameter_sets": [],
+            "replicas": [
+                {
+                    "created_time": "2015-10-06T10:21:48.910470",
+                    "datafile": "/api/v1/dataset_file/290385/",
+                    "id": 444892,
+                    "last_verified_time": "2015-10-06T10:21:53.952521",
+                    "resource_uri": "/api/v1/replica/444892/",
+                    "uri": "DatasetDescription-%s/%s" % (datasetId,
+                                                         filename),
+                    "verified": False
+                }
+            ],
+            "resource_uri": "/api/v1/mydata_dataset_file/290385/",
+            "sha512sum": "",
+            "size": "35",
+            "version": 1
+        }
     elif filename == "existing_verified_file.txt":
-        datafilesJson['meta']['total_count'] = 1
-        datafilesJson['objects'] = [
-            {
-                "id": 290386,
-                "created_time": "2015-06-25T00:26:21",
-                "datafile": None,
-                "dataset": "/api/v1/dataset/%s/" % datasetId,
-                "deleted": False,
-                "deleted_time": None,
-                "directory": directory,
-                "filename": filename,
-                "md5sum": "0d2a8fb0a57bf4a9aabce5f7e69b36e9",
-                "mimetype": "image/jpeg",
-                "modification_time": None,
-                "parameter_sets": [],
-                "replicas": [
-                    {
-                        "created_time": "2015-10-06T10:21:48.910470",
-                        "datafile": "/api/v1/dataset_file/290386/",
-                        "id": 444893,
-                        "last_verified_time": "2015-10-06T10:21:53.952521",
-                        "resource_uri": "/api/v1/replica/444893/",
-                        "uri": "DatasetDescription-%s/%s" % (datasetId,
-                                                             filename),
-                        "verified": True
-                    }
-                ],
-                "resource_uri": "/api/v1/mydata_dataset_file/290386/",
-                "sha512sum": "",
-                "size": "23",
-                "version": 1
-            }
-        ]
+        return {
+            "id": 290386,
+            "created_time": "2015-06-25T00:26:21",
+            "datafile": None,
+            "dataset": "/api/v1/dataset/%s/" % datasetId,
+            "deleted": False,
+            "deleted_time": None,
+            "directory": directory,
+            "filename": filename,
+            "md5sum": "0d2a8fb0a57bf4a9aabce5f7e69b36e9",
+            "mimetype": "image/jpeg",
+            "modification_time": None,
+            "parameter_sets": [],
+            "replicas": [
+                {
+                    "created_time": "2015-10-06T10:21:48.910470",
+                    "datafile": "/api/v1/dataset_file/290386/",
+                    "id": 444893,
+                    "last_verified_time": "2015-10-06T10:21:53.952521",
+                    "resource_uri": "/api/v1/replica/444893/",
+                    "uri": "DatasetDescription-%s/%s" % (datasetId,
+                                                         filename),
+                    "verified": True
+                }
+            ],
+            "resource_uri": "/api/v1/mydata_dataset_file/290386/",
+            "sha512sum": "",
+            "size": "23",
+            "version": 1
+        }
     elif filename == "missing_mydata_replica_api_endpoint.txt":
-        datafilesJson['meta']['total_count'] = 1
-        datafilesJson['objects'] = [
-            {
-                "id": 290387,
-                "created_time": "2015-06-25T00:26:21",
-                "datafile": None,
-                "dataset": "/api/v1/dataset/%s/" % datasetId,
-                "deleted": False,
-                "deleted_time": None,
-                "directory": directory,
-                "filename": filename,
-                "md5sum": "0d2a8fb0a57bf4a9aabce5f7e69b36e9",
-                "mimetype": "image/jpeg",
-                "modification_time": None,
-                "parameter_sets": [],
-                "replicas": [
-                    {
-                        "created_time": "2015-10-06T10:21:48.910470",
-                        "datafile": "/api/v1/dataset_file/290387/",
-                        "id": 444894,
-                        "last_verified_time": "2015-10-06T10:21:53.952521",
-                        "resource_uri": "/api/v1/replica/444894/",
-                        "uri": "DatasetDescription-%s/%s" % (datasetId,
-                                                             filename),
-                        "verified": True
-                    }
-                ],
-                "resource_uri": "/api/v1/mydata_dataset_file/290387/",
-                "sha512sum": "",
-                "size": "23",
-                "version": 1
-            }
-        ]
-    mytardis.wfile.write(json.dumps(datafilesJson).encode())
+        return {
+            "id": 290387,
+            "created_time": "2015-06-25T00:26:21",
+            "datafile": None,
+            "dataset": "/api/v1/dataset/%s/" % datasetId,
+            "deleted": False,
+            "deleted_time": None,
+            "directory": directory,
+            "filename": filename,
+            "md5sum": "0d2a8fb0a57bf4a9aabce5f7e69b36e9",
+            "mimetype": "image/jpeg",
+            "modification_time": None,
+            "parameter_sets": [],
+            "replicas": [
+                {
+                    "created_time": "2015-10-06T10:21:48.910470",
+                    "datafile": "/api/v1/dataset_file/290387/",
+                    "id": 444894,
+                    "last_verified_time": "2015-10-06T10:21:53.952521",
+                    "resource_uri": "/api/v1/replica/444894/",
+                    "uri": "DatasetDescription-%s/%s" % (datasetId,
+                                                         filename),
+                    "verified": True
+                }
+            ],
+            "resource_uri": "/api/v1/mydata_dataset_file/290387/",
+            "sha512sum": "",
+            "size": "23",
+            "version": 1
+        }
+    return None
+
 
 
 def RespondToDataFileRequest(mytardis):
@@ -57,6 +57,7 @@ def FakeMyTardisPost(mytardis):
 
     responderForPath = {
         "/api/v1/mydata_dataset_file/": RespondToDataFileRequest,
+        "/api/v1/mydata_dataset_file/bulk/": RespondToBulkDataFileRequest,
         "/api/v1/dataset_file/": RespondToDataFileRequest,
         "/api/v1/mydata_experiment/": RespondToExperimentRequest,
         "/api/v1/objectacl/": RespondToObjectAclRequest,
@@ -98,22 +99,48 @@ def RespondToDataFileRequest(mytardis, postData, contentType=None):
     if contentType == 'multipart/form-data':
         return
 
-    filename = postData['filename']
-    directory = postData['directory']
-    dataset = postData['dataset']  # e.g. "/api/v1/dataset/123/"
-    datasetId = dataset.split("/")[-2]
     foundAttachedFile = ('attached_file' in postData)
     foundReplicas = ('replicas' in postData)
     # For datafiles uploaded via staging, the
     # POST request should return a temp url.
     if not foundReplicas and not foundAttachedFile:
-        if directory and directory != "":
-            tempUrl = "%s/DatasetDescription-%s/%s/%s" \
-                % (STAGING_PATH, datasetId, directory, filename)
-        else:
-            tempUrl = "%s/DatasetDescription-%s/%s" \
-                % (STAGING_PATH, datasetId, filename)
-        mytardis.wfile.write(tempUrl.encode())
+        mytardis.wfile.write(GetTempUrl(postData).encode())
+
+
+def RespondToBulkDataFileRequest(mytardis, postData):
+    """
+    Respond to a request to create several datafiles for staging uploads.
+
+    :param mytardis: The FakeMyTardisHandler instance
+    :param postData: The POST data dict
+    """
+    mytardis.send_response(201)
+    mytardis.send_header("Content-type", "application/json")
+    mytardis.end_headers()
+    dataFilesJson = []
+    for dataFileJson in postData['objects']:
+        mytardis.datafileIdAutoIncrement += 1
+        dataFilesJson.append(dict(
+            id=mytardis.datafileIdAutoIncrement,
+            resource_uri="/api/v1/dataset_file/%d/"
+            % mytardis.datafileIdAutoIncrement,
+            temp_url=GetTempUrl(dataFileJson)))
+    mytardis.wfile.write(json.dumps(dict(objects=dataFilesJson)).encode())
+
+
+def GetTempUrl(dataFileJson):
+    """
+    Return the temporary location to upload a datafile to via staging
+    """
+    filename = dataFileJson['filename']
+    directory = dataFileJson['directory']
+    dataset = dataFileJson['dataset']  # e.g. "/api/v1/dataset/123/"
+    datasetId = dataset.split("/")[-2]
+    if directory and directory != "":
+        return "%s/DatasetDescription-%s/%s/%s" \
+            % (STAGING_PATH, datasetId, directory, filename)
+    return "%s/DatasetDescription-%s/%s" \
+        % (STAGING_PATH, datasetId, filename)
 
 
 def RespondToExperimentRequest(mytardis, postData):
@@ -0,0 +1,139 @@
+"""
+Fake SSH sessions, SFTP channels and upload models, for testing uploads
+over pooled SSH sessions without an SSH server.
+"""
+import os
+
+# The fakes' method names match ssh2-python's:
+# pylint: disable=invalid-name
+
+class FakeSocket(object):
+    """
+    A socket which only records whether it has been closed
+    """
+    def __init__(self):
+        self.closed = False
+
+    def close(self):
+        """
+        Close the socket
+        """
+        self.closed = True
+
+
+class FakeSftpHandle(object):
+    """
+    An SFTP file handle which writes to a local file
+    """
+    def __init__(self, path, sftpSession):
+        self.localFile = open(path, 'wb')
+        self.sftpSession = sftpSession
+
+    def write(self, data):
+        """
+        Write data, failing if the connection has been dropped
+        """
+        if self.sftpSession.dropped:
+            raise Exception("Connection reset by peer")
+        self.localFile.write(data)
+        return 0, len(data)
+
+    def fsetstat(self, attrs):
+        """
+        Record the file's permissions
+        """
+        self.sftpSession.modes[self.localFile.name] = attrs.permissions
+
+    def close(self):
+        """
+        Close the file
+        """
+        self.localFile.close()
+
+
+class FakeSftp(object):
+    """
+    An SFTP channel which operates on the local filesystem
+    """
+    def __init__(self):
+        self.dropped = False
+        self.modes = dict()
+        self.numMkdirs = 0
+
+    def stat(self, path):
+        """
+        Stat a path, raising an exception if it doesn't exist
+        """
+        return os.stat(path)
+
+    def mkdir(self, path, mode):  # pylint: disable=unused-argument
+        """
+        Create a directory
+        """
+        self.numMkdirs += 1
+        os.mkdir(path)
+
+    def setstat(self, path, attrs):
+        """
+        Record a directory's permissions
+        """
+        self.modes[path] = attrs.permissions
+
+    def open(self, path, flags, mode):  # pylint: disable=unused-argument
+        """
+        Open a file for writing
+        """
+        return FakeSftpHandle(path, self)
+
+
+class FakeSshSession(object):
+    """
+    An authenticated SSH session
+    """
+    def __init__(self):
+        self.healthy = True
+        self.blocking = True
+        self.sftp = FakeSftp()
+
+    def set_blocking(self, blocking):
+        """
+        Switch between blocking and non-blocking mode
+        """
+        self.blocking = blocking
+
+    def block_directions(self):  # pylint: disable=no-self-use
+        """
+        The fake socket is never blocked
+        """
+        return 0
+
+    def keepalive_send(self):
+        """
+        Send a keepalive message, failing if the connection is down
+        """
+        if not self.healthy:
+            raise Exception("Connection is down")
+        return 30
+
+    def sftp_init(self):
+        """
+        Open the SFTP channel
+        """
+        return self.sftp
+
+    def disconnect(self):
+        """
+        Disconnect the session
+        """
+
+
+class FakeUploadModel(object):
+    """
+    The UploadModel attributes used by UploadFileSsh
+    """
+    canceled = False
+
+    def SetLatestTime(self, latestTime):
+        """
+        Ignore progress timestamps
+        """
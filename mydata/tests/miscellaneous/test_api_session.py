@@ -0,0 +1,99 @@
+"""
+Test the shared HTTP session used for MyTardis API requests.
+"""
+import threading
+
+from mock import patch
+
+from .. import MyDataTester
+from ...settings import SETTINGS
+from ...utils.session import SESSION
+from ...utils.session import COUNTS
+
+
+class ApiSessionTester(MyDataTester):
+    """
+    Test the shared HTTP session used for MyTardis API requests.
+    """
+    def test_api_session(self):
+        """Test the shared HTTP session used for MyTardis API requests.
+        """
+        SETTINGS.general.myTardisUrl = self.fakeMyTardisUrl
+        SETTINGS.general.username = "testuser1"
+        SETTINGS.general.apiKey = "valid"
+        SETTINGS.miscellaneous.maxVerificationThreads = 3
+        SETTINGS.advanced.maxUploadThreads = 4
+
+        session = SESSION.Configure()
+        self.assertEqual(SESSION.poolSize, 7)
+        adapter = session.get_adapter(self.fakeMyTardisUrl)
+        self.assertEqual(adapter._pool_maxsize, 7)  # pylint: disable=protected-access
+
+        SESSION.ResetConnectionCounts()
+        url = "%s/api/v1/user/?format=json&username=testfacility" \
+            % self.fakeMyTardisUrl
+        for _ in range(3):
+            response = SESSION.Get(url)
+            response.raise_for_status()
+        self.assertEqual(COUNTS.numRequests, 3)
+        self.assertLessEqual(COUNTS.numNewConnections, 3)
+        self.assertEqual(
+            COUNTS.numReusedConnections,
+            COUNTS.numRequests - COUNTS.numNewConnections)
+
+        # Default headers should be updated when the credentials change:
+        SETTINGS.general.apiKey = "invalid"
+        response = SESSION.Get(url)
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(
+            response.request.headers['Authorization'],
+            "ApiKey testuser1:invalid")
+        SETTINGS.general.apiKey = "valid"
+        response = SESSION.Get(url)
+        self.assertEqual(response.status_code, 200)
+
+        # Only the connection attempt is subject to connection_timeout:
+        with patch.object(session, "request") as mockRequest:
+            SESSION.Get(url)
+            SESSION.Get(url, timeout=5)
+        self.assertEqual(
+            mockRequest.call_args_list[0][1]['timeout'],
+            (SETTINGS.miscellaneous.connectionTimeout, None))
+        self.assertEqual(mockRequest.call_args_list[1][1]['timeout'], 5)
+
+    def test_thread_sessions(self):
+        """Test giving each upload worker thread its own HTTP session.
+        """
+        SETTINGS.general.myTardisUrl = self.fakeMyTardisUrl
+        SETTINGS.general.username = "testuser1"
+        SETTINGS.general.apiKey = "valid"
+        url = "%s/api/v1/user/?format=json&username=testfacility" \
+            % self.fakeMyTardisUrl
+        SESSION.CloseThreadSessions()
+        sessions = dict()
+
+        def UploadWorker(name):
+            """
+            Send requests from an upload worker thread
+            """
+            for _ in range(2):
+                response = SESSION.GetThreadSession().get(url)
+                response.raise_for_status()
+                sessions.setdefault(name, set()).add(
+                    SESSION.GetThreadSession())
+
+        threads = [threading.Thread(target=UploadWorker, args=(i,))
+                   for i in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        threadSessions = [sessions[i] for i in range(3)]
+        for threadSession in threadSessions:
+            self.assertEqual(len(threadSession), 1)
+        self.assertEqual(len(set.union(*threadSessions)), 3)
+        self.assertNotIn(SESSION.GetSession(), set.union(*threadSessions))
+        self.assertEqual(len(SESSION.threadSessions), 3)
+
+        SESSION.CloseThreadSessions()
+        self.assertEqual(SESSION.threadSessions, [])
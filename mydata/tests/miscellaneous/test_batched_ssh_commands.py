@@ -0,0 +1,114 @@
+"""
+Test batching remote mkdir and chmod commands for staging uploads.
+"""
+import threading
+import time
+
+from mock import patch
+
+from .. import MyDataTester
+from ...utils import openssh
+from ...utils.openssh import OPENSSH
+from ...utils.openssh import CreateRemoteDirs
+from ...utils.openssh import PermissionsBatcher
+
+
+class BatchedSshCommandsTester(MyDataTester):
+    """
+    Test batching remote mkdir and chmod commands for staging uploads.
+    """
+    def setUp(self):
+        super(BatchedSshCommandsTester, self).setUp()
+        self.ssh = ["staging.example.com", "22", "mydata", "/path/to/MyData"]
+        self.commands = []
+        self.lock = threading.Lock()
+        OPENSSH.ClearRemoteDirs()
+
+    def RunOpenSshCommand(self, cmd, raiseOnError=True, returnSuccess=False):
+        """
+        Record the remote command instead of running it
+        """
+        assert raiseOnError and not returnSuccess
+        with self.lock:
+            self.commands.append(cmd[-1])
+        time.sleep(0.05)
+        return 0, ""
+
+    def test_batched_mkdir(self):
+        """Test creating a dataset's remote directories in one command.
+        """
+        datasetDir = "/staging/DatasetDescription-1"
+        relatedDirs = [datasetDir, datasetDir + "/subdir1",
+                       datasetDir + "/subdir2"]
+        with patch.object(openssh, "RunOpenSshCommand",
+                          self.RunOpenSshCommand):
+            CreateRemoteDirs(self.ssh, datasetDir + "/subdir1",
+                             lambda: relatedDirs)
+            CreateRemoteDirs(self.ssh, datasetDir + "/subdir2",
+                             lambda: relatedDirs)
+            CreateRemoteDirs(self.ssh, datasetDir, lambda: relatedDirs)
+        self.assertEqual(len(self.commands), 1)
+        for remoteDir in relatedDirs:
+            self.assertIn('"%s"' % remoteDir, self.commands[0])
+
+    def test_batched_chmod(self):
+        """Test sharing chmod commands between concurrent uploads.
+        """
+        batcher = PermissionsBatcher()
+        remoteFilePaths = ["/staging/file%d.txt" % i for i in range(10)]
+        threads = [
+            threading.Thread(target=batcher.SetPermissions,
+                             args=(self.ssh, remoteFilePath))
+            for remoteFilePath in remoteFilePaths]
+        with patch.object(openssh, "RunOpenSshCommand",
+                          self.RunOpenSshCommand):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(batcher.numFiles, 10)
+        self.assertLess(len(self.commands), 10)
+        self.assertEqual(batcher.numCommands, len(self.commands))
+        for remoteFilePath in remoteFilePaths:
+            self.assertEqual(
+                len([command for command in self.commands
+                     if '"%s"' % remoteFilePath in command]), 1)
+        self.assertEqual(batcher.pending, {})
+        self.assertEqual(batcher.running, set())
+
+    def test_batched_chmod_unexpected_error(self):
+        """Test that an unexpected chmod error doesn't block queued uploads.
+        """
+        batcher = PermissionsBatcher()
+        errors = []
+
+        def FailingRunOpenSshCommand(*args, **kwargs):
+            """
+            Simulate a failure of the errand boy transport
+            """
+            time.sleep(0.05)
+            raise RuntimeError("errand boy failed")
+
+        def SetPermissions(remoteFilePath):
+            """
+            Set permissions from an upload thread, recording errors
+            """
+            try:
+                batcher.SetPermissions(self.ssh, remoteFilePath)
+            except RuntimeError as err:
+                errors.append(err)
+
+        threads = [
+            threading.Thread(target=SetPermissions,
+                             args=("/staging/file%d.txt" % i,))
+            for i in range(5)]
+        with patch.object(openssh, "RunOpenSshCommand",
+                          FailingRunOpenSshCommand):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+                self.assertFalse(thread.is_alive())
+        self.assertEqual(len(errors), 5)
+        self.assertEqual(batcher.pending, {})
+        self.assertEqual(batcher.running, set())
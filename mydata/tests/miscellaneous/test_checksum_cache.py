@@ -0,0 +1,65 @@
+"""
+Test the persistent cache of MD5 checksums used when retrying uploads.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from ...utils.checksums import ChecksumCache
+from ...utils.scanner import StatFile
+
+
+class ChecksumCacheTester(unittest.TestCase):
+    """
+    Test the persistent cache of MD5 checksums used when retrying uploads.
+    """
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.cachePath = os.path.join(self.tempDir, "checksum-cache.json")
+        self.filePaths = []
+        for i in range(3):
+            filePath = os.path.join(self.tempDir, "file%d.txt" % i)
+            with open(filePath, 'w') as dataFile:
+                dataFile.write(str(i))
+            self.filePaths.append(filePath)
+
+    def test_checksum_cache(self):
+        """Test looking up, evicting and persisting checksums.
+        """
+        cache = ChecksumCache()
+        cache.Load(self.cachePath, 2)
+        fileStats = [StatFile(filePath) for filePath in self.filePaths]
+        self.assertIsNone(cache.Get(self.filePaths[0], fileStats[0]))
+        cache.Put(self.filePaths[0], fileStats[0], "md5sum0")
+        cache.Put(self.filePaths[1], fileStats[1], "md5sum1")
+        self.assertEqual(
+            cache.Get(self.filePaths[0], fileStats[0]), "md5sum0")
+
+        # The least recently used checksum (file1's) is evicted:
+        cache.Put(self.filePaths[2], fileStats[2], "md5sum2")
+        self.assertIsNone(cache.Get(self.filePaths[1], fileStats[1]))
+        self.assertEqual(cache.numHits, 1)
+        self.assertEqual(cache.numMisses, 2)
+        cache.Save()
+        self.assertFalse(cache.modified)
+
+        cache = ChecksumCache()
+        cache.Load(self.cachePath, 2)
+        self.assertEqual(list(cache.entries.keys()),
+                         [self.filePaths[0], self.filePaths[2]])
+        self.assertEqual(
+            cache.Get(self.filePaths[2], fileStats[2]), "md5sum2")
+
+        # A modified file's checksum isn't reused:
+        with open(self.filePaths[2], 'a') as dataFile:
+            dataFile.write("modified")
+        self.assertIsNone(
+            cache.Get(self.filePaths[2], StatFile(self.filePaths[2])))
+
+        # Reducing the cache size evicts the least recently used checksums:
+        cache.Load(self.cachePath, 1)
+        self.assertEqual(list(cache.entries.keys()), [self.filePaths[2]])
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
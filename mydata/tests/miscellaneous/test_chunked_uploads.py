@@ -0,0 +1,190 @@
+"""
+Test uploading files with the chunks API.
+"""
+import hashlib
+import os
+import tempfile
+import time
+
+import requests_mock
+
+from .. import MyDataTester
+from ...utils.pacing import MAX_RETRY_DELAY
+from ...utils.pacing import PacingController
+from ...utils.upload import UploadFileChunked
+
+
+class FakeUploadModel(object):
+    """
+    The UploadModel attributes used by UploadFileChunked
+    """
+    def __init__(self, fileSize):
+        self.dfoId = 1
+        self.fileSize = fileSize
+        self.canceled = False
+
+    def SetLatestTime(self, latestTime):
+        """
+        Ignore progress timestamps
+        """
+
+
+class ChunkedUploadsTester(MyDataTester):
+    """
+    Test uploading files with the chunks API.
+    """
+    def setUp(self):
+        super(ChunkedUploadsTester, self).setUp()
+        with tempfile.NamedTemporaryFile(delete=False) as dataFile:
+            dataFile.write(os.urandom(2500))
+            self.dataFilePath = dataFile.name
+
+    def test_chunked_upload_hashing(self):
+        """Test hashing a chunked upload, resumed after its first chunk.
+        """
+        server = "http://mytardis.example.com"
+        url = "%s/api/v1/mydata_upload/1/" % server
+        uploadModel = FakeUploadModel(2500)
+        md5sums = []
+        with requests_mock.Mocker() as mocker:
+            mocker.get(url, json=dict(
+                success=True, completed=False, offset=1000, size=1000,
+                checksum="md5"))
+            mocker.post(url + "upload/", json=dict(success=True))
+            mocker.get(url + "complete/", json=dict(success=True))
+
+            def ChecksumCallback(md5sum):
+                """
+                Check that the MD5 sum is known before completing the upload
+                """
+                self.assertFalse(
+                    any(request.path.endswith("/complete/")
+                        for request in mocker.request_history))
+                md5sums.append(md5sum)
+
+            UploadFileChunked(
+                server, self.dataFilePath, uploadModel,
+                lambda current, total: None, 1, md5=hashlib.md5(),
+                checksumCallback=ChecksumCallback)
+            uploads = [request for request in mocker.request_history
+                       if request.method == "POST"]
+
+        # The first chunk is read for hashing, but isn't sent again:
+        self.assertEqual(
+            [request.headers['Content-Range'] for request in uploads],
+            ["1000-2000/2500", "2000-2500/2500"])
+        with open(self.dataFilePath, 'rb') as dataFile:
+            self.assertEqual(
+                md5sums, [hashlib.md5(dataFile.read()).hexdigest()])
+
+    def test_parallel_chunk_uploads(self):
+        """Test uploading several chunks of a file concurrently.
+        """
+        server = "http://mytardis.example.com"
+        url = "%s/api/v1/mydata_upload/1/" % server
+        uploadModel = FakeUploadModel(2500)
+        progress = []
+        chunks = dict()
+
+        def UploadChunk(request, context):  # pylint: disable=unused-argument
+            """
+            Record each chunk as it is sent, because chunk buffers are reused
+            """
+            chunks[request.headers['Content-Range']] = bytes(request.body)
+            return dict(success=True)
+
+        with requests_mock.Mocker() as mocker:
+            mocker.get(url, json=dict(
+                success=True, completed=False, offset=0, size=300,
+                checksum="md5"))
+            mocker.post(url + "upload/", json=UploadChunk)
+            mocker.get(url + "complete/", json=dict(success=True))
+            UploadFileChunked(
+                server, self.dataFilePath, uploadModel,
+                lambda current, total: progress.append(current), 1,
+                numThreads=3)
+            self.assertTrue(
+                mocker.request_history[-1].path.endswith("/complete/"))
+
+        # Every chunk is uploaded once, and progress never goes backwards:
+        with open(self.dataFilePath, 'rb') as dataFile:
+            data = dataFile.read()
+        self.assertEqual(
+            chunks,
+            dict(("%s-%s/2500" % (offset, min(offset + 300, 2500)),
+                  data[offset:offset + 300])
+                 for offset in range(0, 2500, 300)))
+        self.assertEqual(progress, sorted(progress))
+        self.assertEqual(progress[-1], 2500)
+
+    def test_chunk_upload_retries(self):
+        """Test retrying a failed chunk upload without a long back-off.
+        """
+        server = "http://mytardis.example.com"
+        url = "%s/api/v1/mydata_upload/1/" % server
+        uploadModel = FakeUploadModel(2500)
+        with requests_mock.Mocker() as mocker:
+            mocker.get(url, json=dict(
+                success=True, completed=False, offset=0, size=2500,
+                checksum="md5"))
+            mocker.post(url + "upload/", [
+                dict(status_code=500, json=dict(success=False, error="")),
+                dict(json=dict(success=True))])
+            mocker.get(url + "complete/", json=dict(success=True))
+            startTime = time.time()
+            UploadFileChunked(
+                server, self.dataFilePath, uploadModel,
+                lambda current, total: None, 1, numThreads=3)
+            self.assertLess(time.time() - startTime, 1.0)
+            self.assertEqual(
+                [request.method for request in mocker.request_history],
+                ["GET", "POST", "POST", "GET"])
+
+    def test_pacing_controller(self):
+        """Test adapting the window and chunk size to the measured goodput.
+        """
+        mebibyte = 1024 * 1024
+        pacing = PacingController(
+            "file.dat", 8 * mebibyte, minChunkSize=mebibyte, maxWindow=4)
+        self.assertEqual(pacing.window, 1)
+
+        # The window doubles while goodput improves, up to maxWindow:
+        pacing.AdaptWindow(1000000)
+        self.assertEqual(pacing.window, 2)
+        pacing.AdaptWindow(2000000)
+        self.assertEqual(pacing.window, 4)
+        pacing.AdaptWindow(4000000)
+        self.assertEqual(pacing.window, 4)
+
+        # Then it shrinks when goodput drops, and grows by one chunk at a
+        # time when goodput improves:
+        pacing.AdaptWindow(4000000)
+        self.assertFalse(pacing.slowStart)
+        pacing.AdaptWindow(2000000)
+        self.assertEqual(pacing.window, 3)
+        pacing.AdaptWindow(3000000)
+        self.assertEqual(pacing.window, 4)
+
+        # Chunk sizes move towards TARGET_CHUNK_TIME seconds per chunk,
+        # within the allowed bounds:
+        pacing.AdaptChunkSize(4 * mebibyte)
+        self.assertEqual(pacing.chunkSize, 5 * mebibyte)
+        for _ in range(10):
+            pacing.AdaptChunkSize(mebibyte)
+        self.assertEqual(pacing.chunkSize, mebibyte)
+        for _ in range(10):
+            pacing.AdaptChunkSize(100 * mebibyte)
+        self.assertEqual(pacing.chunkSize, 8 * mebibyte)
+
+        # Errors halve the window and chunk size, and retry delays grow
+        # smoothly up to MAX_RETRY_DELAY:
+        delays = [pacing.OnChunkFailed() for _ in range(10)]
+        self.assertEqual(pacing.window, 1)
+        self.assertEqual(pacing.chunkSize, mebibyte)
+        self.assertLessEqual(delays[0], 0.25)
+        self.assertTrue(all(delay <= MAX_RETRY_DELAY for delay in delays))
+        self.assertGreaterEqual(delays[-1], MAX_RETRY_DELAY / 2)
+
+    def tearDown(self):
+        os.remove(self.dataFilePath)
+        super(ChunkedUploadsTester, self).tearDown()
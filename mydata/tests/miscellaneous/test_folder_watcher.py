@@ -0,0 +1,76 @@
+"""
+Test watching the data directory for new files, for the Watch schedule type.
+"""
+import os
+import shutil
+import sys
+import tempfile
+import threading
+import unittest
+
+from ...utils.watcher import FolderWatcher
+
+
+class FolderWatcherTester(unittest.TestCase):
+    """
+    Test watching the data directory for new files.
+    """
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.tempDir, "A"))
+        self.WriteFile(os.path.join("A", "existing.txt"))
+        self.settledFiles = []
+        self.settled = threading.Event()
+
+    def WriteFile(self, relpath):
+        """
+        Write a small file into the temporary data directory.
+        """
+        with open(os.path.join(self.tempDir, relpath), 'w') as dataFile:
+            dataFile.write(relpath)
+
+    def OnSettledFiles(self, settledFiles):
+        """
+        Record files reported by the watcher.
+        """
+        self.settledFiles.extend(
+            os.path.relpath(path, self.tempDir) for path, _ in settledFiles)
+        if len(self.settledFiles) >= 2:
+            self.settled.set()
+
+    def WatchForNewFiles(self, useInotify):
+        """
+        Start a watcher, add some files, and check which files are reported.
+        """
+        watcher = FolderWatcher(
+            self.tempDir, self.OnSettledFiles, settleTime=0.2,
+            pollInterval=0.1, useInotify=useInotify)
+        watcher.Start()
+        try:
+            self.WriteFile(os.path.join("A", "new.txt"))
+            os.makedirs(os.path.join(self.tempDir, "B", "C"))
+            self.WriteFile(os.path.join("B", "C", "new.txt"))
+            self.assertTrue(self.settled.wait(10))
+        finally:
+            watcher.Stop()
+        self.assertEqual(
+            sorted(self.settledFiles),
+            [os.path.join("A", "new.txt"),
+             os.path.join("B", "C", "new.txt")])
+        return watcher
+
+    def test_folder_watcher_polling(self):
+        """Test detecting new files by polling.
+        """
+        watcher = self.WatchForNewFiles(useInotify=False)
+        self.assertEqual(watcher.method, "polling")
+
+    @unittest.skipUnless(sys.platform.startswith("linux"),
+                         "inotify is only available on Linux")
+    def test_folder_watcher_inotify(self):
+        """Test detecting new files with inotify.
+        """
+        self.WatchForNewFiles(useInotify=True)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
@@ -0,0 +1,92 @@
+"""
+Test copying files into a staging area mounted on this machine.
+"""
+import hashlib
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+
+from mock import patch
+
+from ...utils import localcopy
+from ...utils.localcopy import CopyFileToStaging
+from ...utils.localcopy import GetLocalStagingPath
+from ..fake_ssh_sessions import FakeUploadModel
+
+
+class LocalCopyTester(unittest.TestCase):
+    """
+    Test copying files into a staging area mounted on this machine.
+    """
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.stagingDir = os.path.join(self.tempDir, "staging")
+        os.mkdir(self.stagingDir)
+        self.filePath = os.path.join(self.tempDir, "file1.bin")
+        self.content = os.urandom(3 * 1024 * 1024 + 7)
+        with open(self.filePath, 'wb') as dataFile:
+            dataFile.write(self.content)
+        self.progress = []
+
+    def ProgressCallback(self, current, total, message=None):
+        """
+        Record progress updates
+        """
+        assert not message
+        self.progress.append((current, total))
+
+    def test_local_staging_path(self):
+        """Test mapping staging paths to the local staging directory.
+        """
+        self.assertEqual(
+            GetLocalStagingPath(
+                self.stagingDir, "/mnt/staging/",
+                "/mnt/staging/DatasetDescription-1/subdir/file1.bin"),
+            os.path.join(self.stagingDir, "DatasetDescription-1", "subdir",
+                         "file1.bin"))
+        with self.assertRaises(ValueError):
+            GetLocalStagingPath(
+                self.stagingDir, "/mnt/staging", "/mnt/other/file1.bin")
+
+    def CheckCopy(self, md5=None, checksumCallback=None):
+        """
+        Copy the test file into the staging directory, and check the copy
+        """
+        localPath = os.path.join(
+            self.stagingDir, "DatasetDescription-1", "subdir", "file1.bin")
+        CopyFileToStaging(
+            self.filePath, localPath, FakeUploadModel(),
+            self.ProgressCallback, md5=md5, checksumCallback=checksumCallback)
+        with open(localPath, 'rb') as copiedFile:
+            self.assertEqual(copiedFile.read(), self.content)
+        self.assertEqual(self.progress[-1], (len(self.content),) * 2)
+        if not sys.platform.startswith("win"):
+            self.assertEqual(stat.S_IMODE(os.stat(localPath).st_mode), 0o660)
+            self.assertEqual(
+                stat.S_IMODE(os.stat(os.path.dirname(localPath)).st_mode),
+                0o2770)
+
+    def test_copy_file_to_staging(self):
+        """Test copying a file into a locally mounted staging area.
+        """
+        self.CheckCopy()
+
+    def test_copy_file_to_staging_with_md5(self):
+        """Test calculating a file's MD5 sum while copying it.
+        """
+        md5sums = []
+        self.CheckCopy(md5=hashlib.md5(), checksumCallback=md5sums.append)
+        self.assertEqual(md5sums, [hashlib.md5(self.content).hexdigest()])
+
+    def test_copy_file_to_staging_fallback(self):
+        """Test copying via a buffer if the kernel can't copy the file.
+        """
+        with patch.object(localcopy, "CloneFile", return_value=False), \
+                patch.object(localcopy, "CopyInKernel", return_value=None):
+            self.CheckCopy()
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
@@ -0,0 +1,65 @@
+"""
+Test adding missing MD5 sums to unverified DataFile records before
+requesting their verification.
+"""
+import unittest
+
+from mock import MagicMock
+from mock import patch
+
+from ...controllers import verifications
+from ...controllers.verifications import VerifyDatafileRunnable
+from ...models.datafile import DataFileModel
+from ...settings import SETTINGS
+
+
+class MissingMd5SumsTester(unittest.TestCase):
+    """
+    Test adding missing MD5 sums to unverified DataFile records.
+    """
+    def setUp(self):
+        self.folderModel = MagicMock()
+        self.folderModel.GetDataFilePath.return_value = "/data/file1.txt"
+        self.folderModel.CalculateMd5Sum.return_value = \
+            "0123456789abcdef0123456789abcdef"
+        self.runnable = VerifyDatafileRunnable(self.folderModel, 0)
+        self.useChecksumCache = SETTINGS.miscellaneous.useChecksumCache
+        SETTINGS.miscellaneous.useChecksumCache = False
+
+    def test_add_missing_md5_sum(self):
+        """Test calculating a missing MD5 sum before requesting verification.
+        """
+        existingDatafile = DataFileModel(dataset=None, dataFileJson=None)
+        existingDatafile.datafileId = 1
+        existingDatafile.md5sum = ""
+        calls = []
+        with patch.object(verifications, "wx"), \
+                patch.object(DataFileModel, "UpdateMd5Sum",
+                             side_effect=lambda *args: calls.append(
+                                 ("UpdateMd5Sum",) + args)), \
+                patch.object(DataFileModel, "Verify",
+                             side_effect=lambda *args: calls.append(
+                                 ("Verify",) + args)):
+            self.runnable.RequestVerification(existingDatafile)
+        self.assertEqual(
+            calls,
+            [("UpdateMd5Sum", 1, "0123456789abcdef0123456789abcdef"),
+             ("Verify", 1)])
+        self.assertEqual(
+            existingDatafile.md5sum, "0123456789abcdef0123456789abcdef")
+
+    def test_existing_md5_sum(self):
+        """Test requesting verification of a record with an MD5 sum.
+        """
+        existingDatafile = DataFileModel(dataset=None, dataFileJson=None)
+        existingDatafile.datafileId = 2
+        existingDatafile.md5sum = "fedcba9876543210fedcba9876543210"
+        with patch.object(DataFileModel, "UpdateMd5Sum") as mockUpdate, \
+                patch.object(DataFileModel, "Verify") as mockVerify:
+            self.runnable.RequestVerification(existingDatafile)
+        mockUpdate.assert_not_called()
+        mockVerify.assert_called_once_with(2)
+        self.folderModel.CalculateMd5Sum.assert_not_called()
+
+    def tearDown(self):
+        SETTINGS.miscellaneous.useChecksumCache = self.useChecksumCache
@@ -0,0 +1,122 @@
+"""
+Test streaming multipart POST uploads with sendfile.
+"""
+import cgi
+import io
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+from http.server import BaseHTTPRequestHandler
+from http.server import HTTPServer
+
+from mock import patch
+
+from ...utils.multipart import CanSendFile
+from ...utils.multipart import PostMultipartFile
+from ...utils.multipart import SENDFILE_MIN_SIZE
+
+
+class MultipartHandler(BaseHTTPRequestHandler):
+    """
+    Records the fields of a multipart POST request
+    """
+    def do_POST(self):  # pylint: disable=invalid-name
+        """
+        Parse the multipart body, and respond with 201 Created
+        """
+        form = cgi.FieldStorage(
+            fp=self.rfile, headers=self.headers,
+            environ={'REQUEST_METHOD': 'POST',
+                     'CONTENT_TYPE': self.headers['Content-Type']})
+        self.server.posted = dict(
+            authorization=self.headers['Authorization'],
+            json_data=form['json_data'].value,
+            filename=form['attached_file'].filename,
+            content=form['attached_file'].value)
+        self.send_response(201)
+        self.send_header("Location", "/api/v1/dataset_file/1/")
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, format, *args):  # pylint: disable=redefined-builtin
+        """
+        Don't log requests
+        """
+
+
+class MultipartUploadsTester(unittest.TestCase):
+    """
+    Test streaming multipart POST uploads with sendfile.
+    """
+    def setUp(self):
+        self.httpd = HTTPServer(("127.0.0.1", 0), MultipartHandler)
+        self.httpd.posted = None
+        self.thread = threading.Thread(target=self.httpd.serve_forever)
+        self.thread.start()
+        self.url = "http://127.0.0.1:%s/api/v1/mydata_dataset_file/" \
+            % self.httpd.server_port
+        self.tempDir = tempfile.mkdtemp()
+        self.filePath = os.path.join(self.tempDir, "file1.bin")
+        self.content = os.urandom(3 * 1024 * 1024 + 7)
+        with open(self.filePath, 'wb') as dataFile:
+            dataFile.write(self.content)
+
+    def test_post_multipart_file(self):
+        """Test uploading a file's content with sendfile.
+        """
+        progress = []
+        with io.open(self.filePath, 'rb') as fileObject:
+            response = PostMultipartFile(
+                self.url, {"Authorization": "ApiKey testuser1:valid"},
+                {"json_data": '{"filename": "file1.bin"}'}, 'attached_file',
+                fileObject, "file1.bin",
+                lambda monitor: progress.append(
+                    (monitor.bytes_read, monitor.len)))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            response.headers['Location'], "/api/v1/dataset_file/1/")
+        posted = self.httpd.posted
+        self.assertEqual(posted['authorization'], "ApiKey testuser1:valid")
+        self.assertEqual(posted['json_data'], '{"filename": "file1.bin"}')
+        self.assertEqual(posted['filename'], "file1.bin")
+        self.assertEqual(posted['content'], self.content)
+        bytesRead, length = progress[-1]
+        self.assertEqual(bytesRead, length)
+        self.assertGreater(length, len(self.content))
+
+    def test_cancel_post_multipart_file(self):
+        """Test canceling an upload by closing the file being uploaded.
+        """
+        fileObject = io.open(self.filePath, 'rb')
+
+        def CancelUpload(monitor):
+            """
+            Close the file once the upload has started
+            """
+            if monitor.bytes_read > 0:
+                fileObject.close()
+
+        with self.assertRaises(ValueError) as context:
+            PostMultipartFile(
+                self.url, {}, {"json_data": "{}"}, 'attached_file',
+                fileObject, "file1.bin", CancelUpload)
+        self.assertIn(
+            "I/O operation on closed file", str(context.exception))
+
+    def test_can_send_file(self):
+        """Test that only large files are uploaded with sendfile.
+        """
+        self.assertFalse(CanSendFile(self.url, 1024))
+        with patch.dict(os.environ, {"no_proxy": "*"}):
+            self.assertTrue(CanSendFile(self.url, SENDFILE_MIN_SIZE))
+        with patch.dict(os.environ, {"http_proxy": "http://proxy:3128",
+                                     "no_proxy": ""}):
+            self.assertFalse(CanSendFile(self.url, SENDFILE_MIN_SIZE))
+
+    def tearDown(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+        self.thread.join()
+        shutil.rmtree(self.tempDir)
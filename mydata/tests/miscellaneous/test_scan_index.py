@@ -0,0 +1,91 @@
+"""
+Test the persistent scan index used to skip unchanged dataset folders.
+"""
+import os
+import shutil
+import tempfile
+import time
+
+from .. import MyDataTester
+from ...settings import SETTINGS
+from ...models.folder import FolderModel
+from ...models.user import UserModel
+from ...utils.scanindex import SCAN_INDEX
+
+
+class ScanIndexTester(MyDataTester):
+    """
+    Test the persistent scan index used to skip unchanged dataset folders.
+    """
+    def setUp(self):
+        super(ScanIndexTester, self).setUp()
+        SETTINGS.filters.useIncludesFile = False
+        SETTINGS.filters.useExcludesFile = False
+        self.tempDir = tempfile.mkdtemp()
+        self.location = os.path.join(self.tempDir, "testuser1")
+        self.datasetPath = os.path.join(self.location, "Dataset")
+        os.makedirs(os.path.join(self.datasetPath, "subdir"))
+        for relpath in ("file1.txt", os.path.join("subdir", "file2.txt")):
+            with open(os.path.join(self.datasetPath, relpath), 'w') \
+                    as dataFile:
+                dataFile.write(relpath)
+        self.anHourAgo = time.time() - 3600
+        self.SetDirectoryTimesToThePast()
+        self.indexPath = os.path.join(self.tempDir, "scan-index.json")
+        self.testuser1 = UserModel(username="testuser1")
+
+    def SetDirectoryTimesToThePast(self):
+        """
+        Directories modified just before being listed aren't reused from
+        the index, in case they are modified again within the filesystem's
+        timestamp resolution
+        """
+        for dirPath in (self.datasetPath,
+                        os.path.join(self.datasetPath, "subdir")):
+            os.utime(dirPath, (self.anHourAgo, self.anHourAgo))
+
+    def Scan(self, forceFullRescan=False):
+        """
+        Scan the dataset folder using the scan index.
+        """
+        SCAN_INDEX.Begin(self.indexPath, 24, forceFullRescan)
+        folderModel = FolderModel(
+            1, "Dataset", self.location, "testuser1", None, self.testuser1)
+        SCAN_INDEX.End()
+        return folderModel
+
+    def test_scan_index(self):
+        """Test rebuilding unchanged dataset folders from the scan index.
+        """
+        folderModel = self.Scan()
+        self.assertTrue(SCAN_INDEX.fullRescan)
+        self.assertEqual(SCAN_INDEX.numListed, 2)
+        self.assertTrue(os.path.exists(self.indexPath))
+
+        folderModel = self.Scan()
+        self.assertFalse(SCAN_INDEX.fullRescan)
+        self.assertEqual(SCAN_INDEX.numReused, 2)
+        self.assertEqual(SCAN_INDEX.numListed, 0)
+        self.assertEqual(folderModel.numFiles, 2)
+        self.assertEqual(folderModel.GetDataFileDirectory(1), "subdir")
+        self.assertEqual(folderModel.GetDataFileSize(0), len("file1.txt"))
+
+        # Only the directory which has changed should be listed again:
+        with open(os.path.join(self.datasetPath, "subdir", "file3.txt"),
+                  'w') as dataFile:
+            dataFile.write("file3.txt")
+        self.SetDirectoryTimesToThePast()
+        os.utime(os.path.join(self.datasetPath, "subdir"))
+        folderModel = self.Scan()
+        self.assertEqual(SCAN_INDEX.numReused, 1)
+        self.assertEqual(SCAN_INDEX.numListed, 1)
+        self.assertEqual(folderModel.numFiles, 3)
+
+        folderModel = self.Scan(forceFullRescan=True)
+        self.assertTrue(SCAN_INDEX.fullRescan)
+        self.assertEqual(SCAN_INDEX.numReused, 0)
+        self.assertEqual(folderModel.numFiles, 3)
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
+        super(ScanIndexTester, self).tearDown()
@@ -0,0 +1,152 @@
+"""
+Test pipelined SFTP writes with the "ParallelSSH" upload method.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+import unittest
+
+from mock import patch
+from ssh2.error_codes import LIBSSH2_ERROR_EAGAIN
+
+from ...utils import upload
+from ...utils.sshsessions import PooledSession
+from ...utils.upload import ReadAhead
+from ...utils.upload import SendFileSftp
+from ...utils.upload import SFTP_BUFFER_SIZE
+from ..fake_ssh_sessions import FakeSftp
+from ..fake_ssh_sessions import FakeSftpHandle
+from ..fake_ssh_sessions import FakeSocket
+from ..fake_ssh_sessions import FakeSshSession
+from ..fake_ssh_sessions import FakeUploadModel
+
+
+class PipelinedSftpHandle(FakeSftpHandle):
+    """
+    An SFTP file handle which behaves like libssh2's non-blocking writes,
+    acknowledging at most ackSize bytes per call, and returning EAGAIN
+    until the whole buffer has been acknowledged
+    """
+    ackSize = 100000
+
+    def __init__(self, path, sftpSession):
+        super(PipelinedSftpHandle, self).__init__(path, sftpSession)
+        self.maxInFlight = 0
+
+    def write(self, data):
+        """
+        Acknowledge the start of the data
+        """
+        assert not self.sftpSession.session.blocking
+        # Like ssh2-python's SFTPHandle.write:
+        assert isinstance(data, bytes)
+        self.maxInFlight = max(self.maxInFlight, len(data))
+        acknowledged = min(len(data), self.ackSize)
+        self.localFile.write(data[:acknowledged])
+        if acknowledged < len(data):
+            return LIBSSH2_ERROR_EAGAIN, acknowledged
+        return 0, acknowledged
+
+
+class PipelinedSftp(FakeSftp):
+    """
+    An SFTP channel which opens PipelinedSftpHandles
+    """
+    def __init__(self, session):
+        super(PipelinedSftp, self).__init__()
+        self.session = session
+        self.handles = []
+
+    def open(self, path, flags, mode):
+        """
+        Open a file for writing
+        """
+        handle = PipelinedSftpHandle(path, self)
+        self.handles.append(handle)
+        return handle
+
+
+class SftpUploadsTester(unittest.TestCase):
+    """
+    Test pipelined SFTP writes with the "ParallelSSH" upload method.
+    """
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.filePath = os.path.join(self.tempDir, "file.dat")
+        self.data = os.urandom(3 * 1024 * 1024 + 12345)
+        with open(self.filePath, 'wb') as dataFile:
+            dataFile.write(self.data)
+
+    def test_pipelined_sftp_writes(self):
+        """Test keeping several buffers in flight while reading ahead.
+        """
+        sshSession = FakeSshSession()
+        sshSession.sftp = PipelinedSftp(sshSession)
+        pooled = PooledSession(
+            ("127.0.0.1", 2200, "mydata", "/path/to/key"), FakeSocket(),
+            sshSession)
+        remotePath = os.path.join(self.tempDir, "remote", "file.dat")
+        progress = []
+        md5 = hashlib.md5()
+        SendFileSftp(
+            pooled, self.filePath, remotePath, FakeUploadModel(),
+            lambda current, total: progress.append(current), md5, window=4)
+        with open(remotePath, 'rb') as remoteFile:
+            self.assertEqual(remoteFile.read(), self.data)
+        self.assertEqual(md5.hexdigest(), hashlib.md5(self.data).hexdigest())
+        self.assertEqual(progress[-1], len(self.data))
+        self.assertTrue(sshSession.blocking)
+
+        handle = sshSession.sftp.handles[0]
+        self.assertGreater(handle.maxInFlight, SFTP_BUFFER_SIZE)
+        self.assertLessEqual(handle.maxInFlight, 4 * SFTP_BUFFER_SIZE)
+
+    def test_sftp_buffer_reuse(self):
+        """Test returning buffers to the ring once they are acknowledged.
+        """
+        sshSession = FakeSshSession()
+        sshSession.sftp = PipelinedSftp(sshSession)
+        pooled = PooledSession(
+            ("127.0.0.1", 2200, "mydata", "/path/to/key"), FakeSocket(),
+            sshSession)
+        remotePath = os.path.join(self.tempDir, "remote", "file.dat")
+        # Each buffer returned, with the number of bytes acknowledged when
+        # it was returned:
+        returned = []
+
+        def RecordingReadAhead(filePath, freeBuffers, filledBuffers):
+            """
+            Record the buffers returned to the ring
+            """
+            put = freeBuffers.put
+
+            def RecordingPut(buffer):
+                """
+                Record a buffer returned to the ring
+                """
+                if buffer is not None:
+                    handle = sshSession.sftp.handles[0]
+                    returned.append((id(buffer), handle.localFile.tell()))
+                put(buffer)
+
+            freeBuffers.put = RecordingPut
+            ReadAhead(filePath, freeBuffers, filledBuffers)
+
+        with patch.object(upload, "ReadAhead", RecordingReadAhead):
+            SendFileSftp(
+                pooled, self.filePath, remotePath, FakeUploadModel(),
+                lambda current, total: None, None, window=4)
+        with open(remotePath, 'rb') as remoteFile:
+            self.assertEqual(remoteFile.read(), self.data)
+
+        numBuffers = -(-len(self.data) // SFTP_BUFFER_SIZE)
+        self.assertEqual(len(returned), numBuffers)
+        self.assertEqual(len(set(bufferId for bufferId, _ in returned)), 5)
+        for index, (_, acknowledged) in enumerate(returned):
+            self.assertGreaterEqual(
+                acknowledged,
+                min((index + 1) * SFTP_BUFFER_SIZE, len(self.data)))
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
@@ -0,0 +1,169 @@
+"""
+Test uploading small files in batches, each streamed as one tar archive.
+"""
+import hashlib
+import io
+import os
+import shutil
+import tarfile
+import tempfile
+import unittest
+
+from ...utils.sshsessions import PooledSession
+from ...utils.tarbatches import BatchedFile
+from ...utils.tarbatches import SendTarStream
+from ...utils.tarbatches import SmallFileBatcher
+from ..fake_ssh_sessions import FakeSocket
+from ..fake_ssh_sessions import FakeSshSession
+from ..fake_ssh_sessions import FakeUploadModel
+
+
+class FakeChannel(object):
+    """
+    An exec channel which records the command and its standard input
+    """
+    def __init__(self):
+        self.command = None
+        self.stdin = io.BytesIO()
+        self.closed = False
+
+    def execute(self, command):
+        """
+        Record the remote command
+        """
+        self.command = command
+
+    def write(self, data):
+        """
+        Record the data written to the command's standard input, accepting
+        at most 4096 bytes at a time, like a channel with a full window
+        """
+        # Like ssh2-python's Channel.write:
+        assert isinstance(data, bytes)
+        return 0, self.stdin.write(data[:4096])
+
+    def send_eof(self):
+        """
+        Close the command's standard input
+        """
+
+    def read(self):  # pylint: disable=no-self-use
+        """
+        The command has no output
+        """
+        return 0, b""
+
+    read_stderr = read
+
+    def wait_eof(self):
+        """
+        Wait for the end of the command's output
+        """
+
+    def close(self):
+        """
+        Close the channel
+        """
+        self.closed = True
+
+    def wait_closed(self):
+        """
+        Wait for the channel to close
+        """
+
+    def get_exit_status(self):  # pylint: disable=no-self-use
+        """
+        The command succeeded
+        """
+        return 0
+
+
+class SmallFileBatchesTester(unittest.TestCase):
+    """
+    Test uploading small files in batches, each streamed as one tar archive.
+    """
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.filePaths = []
+        for i in range(4):
+            filePath = os.path.join(self.tempDir, "file%d.txt" % i)
+            with open(filePath, 'w') as dataFile:
+                dataFile.write("file%d" % i)
+            self.filePaths.append(filePath)
+
+    def test_send_tar_stream(self):
+        """Test streaming small files into "tar -x" on the staging host.
+        """
+        channel = FakeChannel()
+        sshSession = FakeSshSession()
+        sshSession.open_session = lambda: channel
+        pooled = PooledSession(
+            ("127.0.0.1", 2200, "mydata", "/path/to/key"), FakeSocket(),
+            sshSession)
+        remoteDir = "/staging/DatasetDescription-1"
+        files = [
+            BatchedFile(self.filePaths[0], remoteDir + "/file0.txt",
+                        FakeUploadModel(), None, None, md5=hashlib.md5()),
+            BatchedFile(self.filePaths[1], remoteDir + "/dir/sub/file1.txt",
+                        FakeUploadModel(), None, None)]
+        SendTarStream(pooled, remoteDir, files)
+        self.assertIn('cd "%s"' % remoteDir, channel.command)
+        self.assertIn("tar -x", channel.command)
+        self.assertTrue(channel.closed)
+        self.assertEqual(files[0].md5sum, hashlib.md5(b"file0").hexdigest())
+        self.assertIsNone(files[1].md5sum)
+
+        channel.stdin.seek(0)
+        members = []
+        contents = {}
+        with tarfile.open(fileobj=channel.stdin, mode="r|") as tar:
+            for member in tar:
+                members.append(member.name)
+                if member.isfile():
+                    self.assertEqual(member.mode, 0o660)
+                    contents[member.name] = tar.extractfile(member).read()
+                else:
+                    self.assertEqual(member.mode, 0o2770)
+        self.assertEqual(members,
+                         ["dir", "dir/sub", "file0.txt", "dir/sub/file1.txt"])
+        self.assertEqual(contents, {"file0.txt": b"file0",
+                                    "dir/sub/file1.txt": b"file1"})
+
+    def test_small_file_batcher(self):
+        """Test grouping small files into batches by remote directory.
+        """
+        batches = []
+        results = []
+        batcher = SmallFileBatcher(send=batches.append)
+        batcher.Configure(threshold=100, maxBatchBytes=10)
+        self.assertTrue(batcher.CanBatch(5))
+        self.assertFalse(batcher.CanBatch(101))
+
+        def Callback(error):
+            """
+            Record the result of sending a file's batch
+            """
+            results.append(error)
+
+        server = ("127.0.0.1", 2200)
+        auth = ("mydata", "/path/to/key")
+        for i, filePath in enumerate(self.filePaths):
+            remoteDir = "/staging/DatasetDescription-%d" % (i % 2)
+            uploadModel = FakeUploadModel()
+            if i == 3:
+                uploadModel.canceled = True
+            batcher.Add(server, auth, remoteDir, BatchedFile(
+                filePath, "%s/file%d.txt" % (remoteDir, i), uploadModel,
+                lambda current, total: None, Callback))
+        batcher.Stop()
+
+        # Files 0 and 2 fill a batch (10 bytes), file 1 is sent when the
+        # batcher is stopped, and file 3 is skipped because it was canceled:
+        self.assertEqual(len(batches), 2)
+        self.assertEqual(
+            sorted(len(batch.files) for batch in batches), [1, 2])
+        self.assertEqual(results, [None] * 4)
+        self.assertEqual(batcher.batches, {})
+
+    def tearDown(self):
+        shutil.rmtree(self.tempDir)
@@ -0,0 +1,61 @@
+"""
+Test sharing a ControlMaster connection between ssh and scp commands.
+"""
+import sys
+import unittest
+
+from mock import patch
+
+from .. import MyDataTester
+from ...utils import openssh
+from ...utils.openssh import OPENSSH
+from ...utils.openssh import StartControlMaster
+from ...utils.openssh import StopControlMasters
+from ...utils.openssh import WithDefaultOptions
+
+
+@unittest.skipIf(sys.platform.startswith("win"),
+                 "ControlMaster isn't supported by OpenSSH on Windows")
+class SshControlMasterTester(MyDataTester):
+    """
+    Test sharing a ControlMaster connection between ssh and scp commands.
+    """
+    def test_ssh_control_master(self):
+        """Test starting, using and stopping ControlMaster connections.
+        """
+        ssh = ["staging.example.com", "22", "mydata", "/path/to/MyData"]
+        commands = []
+
+        def RunOpenSshCommand(cmd, raiseOnError=True, returnSuccess=False):
+            """
+            Record the command instead of running it
+            """
+            assert not raiseOnError
+            commands.append(cmd)
+            return True if returnSuccess else (0, "")
+
+        with patch.object(openssh, "RunOpenSshCommand", RunOpenSshCommand):
+            StartControlMaster(ssh)
+            StartControlMaster(ssh)
+            self.assertEqual(len(commands), 1)
+            self.assertIn("-oControlMaster=yes", commands[0])
+            controlPath = OPENSSH.controlPaths[("staging.example.com", "22",
+                                                "mydata")]
+
+            # Both ssh and scp commands are routed through the master:
+            sshCommand = WithDefaultOptions(ssh, ["echo Ready"])
+            self.assertIn("-oControlMaster=no", sshCommand)
+            self.assertLess(sshCommand.index("-oControlMaster=no"),
+                            sshCommand.index("staging.example.com"))
+            scpCommand = WithDefaultOptions(
+                "scp", ["file.txt", "mydata@staging.example.com:/tmp"],
+                ssh=ssh)
+            self.assertIn("-oControlMaster=no", scpCommand)
+            self.assertTrue(any(controlPath in arg for arg in scpCommand))
+
+            StopControlMasters()
+            self.assertEqual(len(commands), 2)
+            self.assertIn("exit", commands[1])
+            self.assertEqual(OPENSSH.controlPaths, {})
+            sshCommand = WithDefaultOptions(ssh, ["echo Ready"])
+            self.assertNotIn("-oControlMaster=no", sshCommand)
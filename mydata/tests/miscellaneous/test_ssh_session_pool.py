@@ -0,0 +1,106 @@
+"""
+Test reusing SSH sessions for uploads with the "ParallelSSH" method.
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+from ...utils.sshsessions import PooledSession
+from ...utils.sshsessions import SSH_SESSION_POOL
+from ...utils.upload import UploadFileSsh
+from ..fake_ssh_sessions import FakeSocket
+from ..fake_ssh_sessions import FakeSshSession
+from ..fake_ssh_sessions import FakeUploadModel
+
+
+class SshSessionPoolTester(unittest.TestCase):
+    """
+    Test reusing SSH sessions for uploads with the "ParallelSSH" method.
+    """
+    def setUp(self):
+        self.tempDir = tempfile.mkdtemp()
+        self.sessions = []
+        self.connect = SSH_SESSION_POOL.connect
+        SSH_SESSION_POOL.connect = self.Connect
+        SSH_SESSION_POOL.CloseAll()
+        SSH_SESSION_POOL.idleTimeout = 60.0
+
+    def Connect(self, host, port, username, privateKeyFilePath):
+        """
+        Open a fake session
+        """
+        pooled = PooledSession(
+            (host, port, username, privateKeyFilePath), FakeSocket(),
+            FakeSshSession())
+        self.sessions.append(pooled)
+        return pooled
+
+    def Upload(self, filename):
+        """
+        Upload a file into a remote subdirectory of tempDir
+        """
+        localPath = os.path.join(self.tempDir, filename)
+        with open(localPath, 'w') as localFile:
+            localFile.write(filename)
+        remotePath = os.path.join(self.tempDir, "remote", "dir", filename)
+        UploadFileSsh(
+            ("127.0.0.1", 2200), ("mydata", "/path/to/key"), localPath,
+            remotePath, FakeUploadModel(), lambda current, total: None)
+        with open(remotePath) as remoteFile:
+            self.assertEqual(remoteFile.read(), filename)
+        return remotePath
+
+    def test_ssh_session_pool(self):
+        """Test reusing, expiring and reconnecting SSH sessions.
+        """
+        remotePath = self.Upload("file1.txt")
+        self.Upload("file2.txt")
+        self.assertEqual(len(self.sessions), 1)
+        self.assertEqual(SSH_SESSION_POOL.numReuses, 1)
+        sftpSession = self.sessions[0].session.sftp
+        self.assertEqual(sftpSession.numMkdirs, 2)
+        self.assertEqual(sftpSession.modes[remotePath], 0o660)
+        self.assertEqual(
+            sftpSession.modes[os.path.dirname(remotePath)], 0o2770)
+
+        # Unhealthy sessions are replaced:
+        self.sessions[0].session.healthy = False
+        self.Upload("file3.txt")
+        self.assertEqual(len(self.sessions), 2)
+        self.assertTrue(self.sessions[0].sock.closed)
+
+        # An upload which fails on a reused session is retried:
+        self.sessions[1].session.sftp.dropped = True
+        self.Upload("file4.txt")
+        self.assertEqual(len(self.sessions), 3)
+        self.assertTrue(self.sessions[1].sock.closed)
+
+        # Idle sessions expire:
+        SSH_SESSION_POOL.idleTimeout = 0
+        self.Upload("file5.txt")
+        self.assertEqual(len(self.sessions), 4)
+        self.assertTrue(self.sessions[2].sock.closed)
+
+        SSH_SESSION_POOL.CloseAll()
+        self.assertTrue(self.sessions[3].sock.closed)
+
+    def test_retry_on_new_session(self):
+        """Test retrying a failed upload on a new session, not an idle one.
+        """
+        key = ("127.0.0.1", 2200, "mydata", "/path/to/key")
+        first = SSH_SESSION_POOL.Acquire(*key)
+        second = SSH_SESSION_POOL.Acquire(*key)
+        SSH_SESSION_POOL.Release(first)
+        SSH_SESSION_POOL.Release(second)
+        for pooled in (first, second):
+            pooled.session.sftp.dropped = True
+        self.Upload("file1.txt")
+        self.assertEqual(len(self.sessions), 3)
+        self.assertTrue(second.sock.closed)
+        self.assertFalse(first.sock.closed)
+
+    def tearDown(self):
+        SSH_SESSION_POOL.CloseAll()
+        SSH_SESSION_POOL.connect = self.connect
+        shutil.rmtree(self.tempDir)
@@ -0,0 +1,81 @@
+"""
+Test choosing each file's transport from its size.
+"""
+import unittest
+
+from mock import patch
+
+from ...utils import router
+from ...utils.router import UploadRouter
+from ...utils.router import DescribeSizeClass
+from ...utils.router import GetSizeClass
+
+
+class UploadRouterTester(unittest.TestCase):
+    """
+    Test choosing each file's transport from its size.
+    """
+    def setUp(self):
+        self.router = UploadRouter()
+
+    def test_default_transport(self):
+        """Test that every file uses the selected upload method by default.
+        """
+        for fileSize in (0, 1024, 10 * 1024 ** 3):
+            self.assertEqual(
+                self.router.ChooseTransport("ParallelSSH", fileSize),
+                "ParallelSSH")
+
+    def test_size_bands(self):
+        """Test choosing transports from configured size bands.
+        """
+        self.router.Configure(
+            postMaxSize=64 * 1024, chunkedMinSize=1024 ** 3)
+        self.assertEqual(
+            self.router.ChooseTransport("ParallelSSH", 0), router.HTTP_POST)
+        self.assertEqual(
+            self.router.ChooseTransport("ParallelSSH", 64 * 1024),
+            router.HTTP_POST)
+        self.assertEqual(
+            self.router.ChooseTransport("ParallelSSH", 64 * 1024 + 1),
+            "ParallelSSH")
+        self.assertEqual(
+            self.router.ChooseTransport("OpenSSH", 1024 ** 3),
+            router.CHUNKED)
+        # A DataFile record created for staging can't be completed with
+        # HTTP POST:
+        self.assertEqual(
+            self.router.ChooseTransport("ParallelSSH", 1024, canPost=False),
+            "ParallelSSH")
+
+    def test_size_classes(self):
+        """Test describing the size classes throughput is recorded for.
+        """
+        self.assertEqual(GetSizeClass(0), 0)
+        self.assertEqual(GetSizeClass(64 * 1024), 0)
+        self.assertEqual(GetSizeClass(64 * 1024 + 1), 1)
+        self.assertEqual(DescribeSizeClass(1), "up to 1.0 MB")
+        self.assertEqual(DescribeSizeClass(GetSizeClass(5 * 1024 ** 3)),
+                         "over 4.0 GB")
+
+    def test_log_stats(self):
+        """Test logging the throughput of each transport.
+        """
+        self.router.Record(router.HTTP_POST, 1000, 0.5)
+        self.router.Record(router.HTTP_POST, 3000, 0.5)
+        self.router.Record("ParallelSSH", 100 * 1000 * 1000, 2.0)
+        self.router.Record("ParallelSSH", 0, 0.0)
+        with patch.object(router.logger, "info") as mockInfo:
+            self.router.LogStats()
+        messages = [call[0][0] for call in mockInfo.call_args_list]
+        self.assertEqual(len(messages), 3)
+        self.assertIn(
+            "HTTP POST uploads of files up to 64.0 KB: 2 files", messages[0])
+        self.assertIn("0.00 MB/s per upload", messages[0])
+        self.assertIn("ParallelSSH uploads of files up to 64.0 KB: 1 files",
+                      messages[1])
+        self.assertIn("throughput unknown", messages[1])
+        self.assertIn("50.00 MB/s per upload", messages[2])
+
+        self.router.Configure(postMaxSize=0, chunkedMinSize=0)
+        self.assertEqual(self.router.stats, {})
@@ -0,0 +1,163 @@
+"""
+Test creating DataFile records for staging uploads in bulk.
+"""
+import threading
+import time
+
+from mock import patch
+
+from .. import MyDataTester
+from ...settings import SETTINGS
+from ...models.datafile import DataFileCreationBatcher
+from ...models.datafile import DataFileModel
+
+
+class DataFileCreationTester(MyDataTester):
+    """
+    Test creating DataFile records for staging uploads in bulk.
+    """
+    def setUp(self):
+        super(DataFileCreationTester, self).setUp()
+        SETTINGS.general.myTardisUrl = self.fakeMyTardisUrl
+        SETTINGS.general.username = "testuser1"
+        SETTINGS.general.apiKey = "valid"
+
+    @staticmethod
+    def GetDataFileDict(filename):
+        """
+        Return the JSON data for creating a DataFile record
+        """
+        return {
+            "dataset": "/api/v1/dataset/1001/",
+            "filename": filename,
+            "directory": "",
+            "md5sum": "",
+            "size": 1024,
+            "mimetype": "text/plain"
+        }
+
+    def test_bulk_datafile_creation(self):
+        """Test sharing DataFile creation requests between upload threads.
+        """
+        batcher = DataFileCreationBatcher()
+        results = dict()
+        createDataFiles = DataFileModel.CreateDataFilesForStagingUpload
+
+        def SlowCreateDataFiles(dataFileDicts):
+            """
+            Simulate a slow server, so requests are queued
+            """
+            time.sleep(0.05)
+            return createDataFiles(dataFileDicts)
+
+        def Create(filename):
+            """
+            Create a DataFile record from an upload thread
+            """
+            results[filename] = batcher.Create(self.GetDataFileDict(filename))
+
+        filenames = ["file%d.txt" % i for i in range(10)]
+        threads = [threading.Thread(target=Create, args=(filename,))
+                   for filename in filenames]
+        with patch.object(DataFileModel, "CreateDataFilesForStagingUpload",
+                          SlowCreateDataFiles):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        self.assertEqual(batcher.numDataFiles, 10)
+        self.assertLess(batcher.numRequests, 10)
+        for filename in filenames:
+            _, tempUrl = results[filename]
+            self.assertTrue(
+                tempUrl.endswith("/DatasetDescription-1001/%s" % filename))
+        self.assertEqual(batcher.pending, {})
+        self.assertEqual(batcher.running, set())
+
+    def test_bulk_datafile_creation_unsupported(self):
+        """Test falling back to individual requests without a bulk endpoint.
+        """
+        class NotFoundResponse(object):
+            """
+            Response from a server without the bulk endpoint
+            """
+            status_code = 404
+            text = "Not Found"
+
+        batcher = DataFileCreationBatcher()
+        with patch.object(DataFileModel, "CreateDataFilesForStagingUpload",
+                          return_value=NotFoundResponse()) as createDataFiles:
+            self.assertIsNone(batcher.Create(self.GetDataFileDict("a.txt")))
+            self.assertFalse(batcher.bulkSupported)
+            self.assertIsNone(batcher.Create(self.GetDataFileDict("b.txt")))
+        self.assertEqual(createDataFiles.call_count, 1)
+        self.assertEqual(batcher.numRequests, 0)
+
+        batcher.Configure(maxBatchSize=500)
+        self.assertTrue(batcher.bulkSupported)
+        datafileId, tempUrl = batcher.Create(self.GetDataFileDict("c.txt"))
+        self.assertTrue(datafileId.isdigit())
+        self.assertTrue(tempUrl.endswith("/DatasetDescription-1001/c.txt"))
+
+    def test_bulk_datafile_creation_unexpected_response(self):
+        """Test that an unexpected bulk response fails the queued uploads.
+
+        MyTardis could have created the DataFile records, so they mustn't be
+        created individually, and the queued uploads mustn't be blocked.
+        """
+        class ListResponse(object):
+            """
+            Response whose JSON is a list, instead of a dict of "objects"
+            """
+            status_code = 201
+            text = "[]"
+
+            @staticmethod
+            def raise_for_status():
+                """
+                The request succeeded
+                """
+
+            @staticmethod
+            def json():
+                """
+                Return the unexpected JSON
+                """
+                return []
+
+        def SlowCreateDataFiles(dataFileDicts):
+            """
+            Simulate a slow server, so requests are queued
+            """
+            time.sleep(0.05)
+            return ListResponse()
+
+        batcher = DataFileCreationBatcher()
+        results = dict()
+
+        def Create(filename):
+            """
+            Create a DataFile record from an upload thread
+            """
+            try:
+                results[filename] = batcher.Create(
+                    self.GetDataFileDict(filename))
+            except TypeError as err:
+                results[filename] = err
+
+        filenames = ["file%d.txt" % i for i in range(5)]
+        threads = [threading.Thread(target=Create, args=(filename,))
+                   for filename in filenames]
+        with patch.object(DataFileModel, "CreateDataFilesForStagingUpload",
+                          SlowCreateDataFiles):
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join(10)
+                self.assertFalse(thread.is_alive())
+        self.assertEqual(sorted(results.keys()), filenames)
+        for result in results.values():
+            self.assertIsInstance(result, TypeError)
+        self.assertTrue(batcher.bulkSupported)
+        self.assertEqual(batcher.pending, {})
+        self.assertEqual(batcher.running, set())
@@ -0,0 +1,92 @@
+"""
+Test bulk DataFile lookups via a paginated listing of a dataset's DataFiles.
+"""
+from mock import patch
+from requests.exceptions import HTTPError
+
+from .. import MyDataTester
+from ...settings import SETTINGS
+from ...models.dataset import DatasetModel
+from ...models.datafile import DataFileModel
+from ...models.datafile import DataFileLookupIndex
+from ...utils.exceptions import DoesNotExist
+
+
+class DataFileLookupsTester(MyDataTester):
+    """
+    Test bulk DataFile lookups via a paginated listing of a dataset's DataFiles.
+    """
+    def setUp(self):
+        super(DataFileLookupsTester, self).setUp()
+        SETTINGS.general.myTardisUrl = self.fakeMyTardisUrl
+        SETTINGS.general.username = "testuser1"
+        SETTINGS.general.apiKey = "valid"
+        self.dataset = DatasetModel(
+            datasetJson=dict(id=1001, description="Existing Dataset"))
+
+    def test_paginated_listing(self):
+        """Test listing a dataset's DataFiles, a few records at a time.
+        """
+        dataFilesJson = list(
+            DataFileModel.GetDataFilesForDataset(self.dataset, pageSize=3))
+        self.assertEqual(len(dataFilesJson), 4)
+        self.assertEqual(
+            [dataFileJson['id'] for dataFileJson in dataFilesJson],
+            [290385, 290385, 290386, 290387])
+
+    def test_lookup_index(self):
+        """Test looking up DataFiles in a dataset's DataFile index.
+        """
+        index = DataFileLookupIndex(self.dataset)
+        dataFile = index.GetDataFile(
+            filename="existing_verified_file.txt", directory="")
+        self.assertTrue(index.populated)
+        self.assertEqual(dataFile.datafileId, 290386)
+        self.assertTrue(dataFile.replicas[0].verified)
+        self.assertEqual(dataFile.dataset, self.dataset)
+
+        dataFile = index.GetDataFile(
+            filename="existing_unverified_full_size_file.txt", directory="")
+        self.assertFalse(dataFile.replicas[0].verified)
+
+        with self.assertRaises(DoesNotExist):
+            index.GetDataFile(filename="new_file.txt", directory="")
+        with self.assertRaises(DoesNotExist):
+            index.GetDataFile(
+                filename="existing_verified_file.txt", directory="subdir")
+
+    def test_lookup_index_fallback(self):
+        """Test falling back to individual lookups if the listing fails.
+        """
+        def FailToPopulate():
+            """
+            Simulate a server which can't list a dataset's DataFiles
+            """
+            raise HTTPError("500 Server Error")
+
+        index = DataFileLookupIndex(self.dataset)
+        index.Populate = FailToPopulate
+        dataFile = index.GetDataFile(
+            filename="existing_verified_file.txt", directory="")
+        self.assertTrue(index.failed)
+        self.assertEqual(dataFile.datafileId, 290386)
+
+    def test_lookup_index_invalidate(self):
+        """Test looking up a record created after the index was populated.
+        """
+        index = DataFileLookupIndex(self.dataset)
+        with self.assertRaises(DoesNotExist):
+            index.GetDataFile(filename="new_file.txt", directory="")
+        # e.g. new_file.txt has been uploaded, then modified while watching:
+        index.Invalidate(filename="new_file.txt", directory="")
+        createdDataFile = DataFileModel(
+            dataset=self.dataset, dataFileJson=None)
+        with patch.object(DataFileModel, "GetDataFile",
+                          return_value=createdDataFile) as getDataFile:
+            self.assertIs(
+                index.GetDataFile(filename="new_file.txt", directory=""),
+                createdDataFile)
+            index.GetDataFile(
+                filename="existing_verified_file.txt", directory="")
+        getDataFile.assert_called_once_with(
+            dataset=self.dataset, filename="new_file.txt", directory="")
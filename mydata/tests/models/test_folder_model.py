@@ -2,12 +2,18 @@
 Test folder model
 """
 import os
+import shutil
 import sys
 import tempfile
+import threading
+
+from mock import MagicMock
 
 from ...settings import SETTINGS
 from ...models.folder import FolderModel
 from ...models.user import UserModel
+from ...utils.scanner import StatFile
+from ...utils.watcher import FolderWatcher
 from .. import MyDataTester
 
 
@@ -71,6 +77,23 @@ class FolderModelTester(MyDataTester):
         SETTINGS.filters.excludesFile = self.excludesFilePath
         self.assertTrue(FolderModel.MatchesIncludes("image.jpg"))
         self.assertTrue(FolderModel.MatchesExcludes("filename.bak"))
+        self.assertFalse(FolderModel.MatchesIncludes("image.png"))
+        self.assertEqual(
+            FolderModel.FilterFilenames(["image.jpg", "image.png"]),
+            ["image.jpg", "image.png"])
+
+        # Compiled patterns are cached until the patterns file changes:
+        with open(self.includesFilePath, 'a') as includesFile:
+            includesFile.write("*.png\n")
+        self.assertTrue(FolderModel.MatchesIncludes("image.png"))
+        SETTINGS.filters.useIncludesFile = True
+        SETTINGS.filters.useExcludesFile = False
+        self.assertEqual(
+            FolderModel.FilterFilenames(["image.jpg", "image.png", "a.bak"]),
+            ["image.jpg", "image.png"])
+        with open(self.includesFilePath, 'w') as includesFile:
+            includesFile.write("*.jpg\n")
+            includesFile.write("zero*\n")
 
         SETTINGS.filters.useIncludesFile = False
         SETTINGS.filters.useExcludesFile = False
@@ -90,8 +113,8 @@ class FolderModelTester(MyDataTester):
         folderModel = FolderModel(dataViewId, folder, location, userFolderName,
                                   groupFolderName, testuser1)
         self.assertEqual(
-            sorted([os.path.basename(f) for f in
-                    folderModel.dataFilePaths['files']]),
+            sorted([folderModel.GetDataFileName(i) for i in
+                    range(folderModel.numFiles)]),
             expectedFiles)
 
         SETTINGS.filters.useIncludesFile = True
@@ -99,8 +122,8 @@ class FolderModelTester(MyDataTester):
         folderModel = FolderModel(dataViewId, folder, location, userFolderName,
                                   groupFolderName, testuser1)
         self.assertEqual(
-            sorted([os.path.basename(f) for f in
-                    folderModel.dataFilePaths['files']]),
+            sorted([folderModel.GetDataFileName(i) for i in
+                    range(folderModel.numFiles)]),
             expectedFiles)
 
         SETTINGS.filters.useIncludesFile = False
@@ -116,10 +139,208 @@ class FolderModelTester(MyDataTester):
         folderModel = FolderModel(dataViewId, folder, location, userFolderName,
                                   groupFolderName, testuser1)
         self.assertEqual(
-            sorted([os.path.basename(f) for f in
-                    folderModel.dataFilePaths['files']]),
+            sorted([folderModel.GetDataFileName(i) for i in
+                    range(folderModel.numFiles)]),
             expectedFiles)
 
+    def test_folder_model_file_stats(self):
+        """Test serving file sizes and timestamps from the folder scan
+        """
+        SETTINGS.filters.useIncludesFile = False
+        SETTINGS.filters.useExcludesFile = False
+        SETTINGS.filters.ignoreNewFiles = True
+        SETTINGS.filters.ignoreNewFilesMinutes = 1
+        testuser1 = UserModel(username="testuser1")
+        location = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(location, "Dataset", "subdir"))
+            dataFilePath = os.path.join(location, "Dataset", "file1.txt")
+            with open(dataFilePath, 'w') as dataFile:
+                dataFile.write("12345")
+            with open(os.path.join(
+                    location, "Dataset", "subdir", "file2.txt"), 'w') \
+                    as dataFile:
+                dataFile.write("1234567890")
+            anHourAgo = os.stat(dataFilePath).st_mtime - 3600
+            os.utime(dataFilePath, (anHourAgo, anHourAgo))
+
+            folderModel = FolderModel(
+                1, "Dataset", location, "testuser1", None, testuser1)
+            self.assertEqual(folderModel.numFiles, 2)
+            self.assertEqual(folderModel.GetDataFileDirectory(1), "subdir")
+            self.assertEqual(folderModel.GetDataFileSize(0), 5)
+            self.assertEqual(folderModel.GetDataFileSize(1), 10)
+            self.assertEqual(
+                folderModel.GetDataFileStat(0).inode,
+                os.stat(dataFilePath).st_ino)
+            self.assertFalse(folderModel.FileIsTooNewToUpload(0))
+            self.assertTrue(folderModel.FileIsTooNewToUpload(1))
+
+            # Stats are served from the snapshot until they are refreshed:
+            with open(dataFilePath, 'a') as dataFile:
+                dataFile.write("67890")
+            self.assertEqual(folderModel.GetDataFileSize(0), 5)
+            self.assertFalse(folderModel.FileIsTooNewToUpload(0))
+            self.assertTrue(folderModel.RefreshDataFileStat(0))
+            self.assertEqual(folderModel.GetDataFileSize(0), 10)
+            self.assertTrue(folderModel.FileIsTooNewToUpload(0))
+
+            os.remove(dataFilePath)
+            self.assertIsNone(folderModel.RefreshDataFileStat(0))
+        finally:
+            shutil.rmtree(location)
+
+    def test_folder_model_data_file_table(self):
+        """Test composing paths and counting uploads from the file table
+        """
+        SETTINGS.filters.useIncludesFile = False
+        SETTINGS.filters.useExcludesFile = False
+        testuser1 = UserModel(username="testuser1")
+        location = tempfile.mkdtemp()
+        try:
+            subdir = os.path.join("subdir1", "subdir2")
+            os.makedirs(os.path.join(location, "Dataset", subdir))
+            for relpath in ("file1.txt", os.path.join(subdir, "file2.txt"),
+                            os.path.join(subdir, "file3.txt")):
+                with open(os.path.join(location, "Dataset", relpath), 'w') \
+                        as dataFile:
+                    dataFile.write(relpath)
+
+            folderModel = FolderModel(
+                1, "Dataset", location, "testuser1", None, testuser1)
+            self.assertEqual(folderModel.numFiles, 3)
+            self.assertEqual(folderModel.GetDataFileDirectory(0), "")
+            self.assertEqual(
+                folderModel.GetDataFileDirectory(2), "subdir1/subdir2")
+            self.assertEqual(folderModel.GetDataFileName(2), "file3.txt")
+            self.assertEqual(
+                folderModel.GetDataFilePath(2),
+                os.path.join(location, "Dataset", subdir, "file3.txt"))
+            self.assertEqual(folderModel.dataFiles.directories,
+                             ["", "subdir1/subdir2"])
+
+            folderModel.SetDataFileUploaded(1, True)
+            folderModel.SetDataFileUploaded(1, True)
+            folderModel.SetDataFileUploaded(2, True)
+            self.assertEqual(folderModel.status, "2 of 3 files uploaded")
+            folderModel.SetDataFileUploaded(2, False)
+            self.assertEqual(folderModel.status, "1 of 3 files uploaded")
+            folderModel.ResetCounts()
+            self.assertEqual(folderModel.dataFiles.numUploaded, 0)
+            self.assertFalse(folderModel.dataFiles.IsUploaded(1))
+        finally:
+            shutil.rmtree(location)
+
+    def test_folder_model_streaming(self):
+        """Test yielding batches of files while the folder is being scanned
+        """
+        SETTINGS.filters.useIncludesFile = False
+        SETTINGS.filters.useExcludesFile = False
+        testuser1 = UserModel(username="testuser1")
+        location = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(location, "Dataset"))
+            for i in range(5):
+                with open(os.path.join(
+                        location, "Dataset", "file%d.txt" % i), 'w') \
+                        as dataFile:
+                    dataFile.write(str(i))
+
+            folderModel = FolderModel(
+                1, "Dataset", location, "testuser1", None, testuser1,
+                streamFiles=True)
+            self.assertEqual(folderModel.numFiles, 0)
+            self.assertFalse(folderModel.finishedScanningFiles.isSet())
+            indices = []
+
+            def ConsumeBatches():
+                """
+                Collect the file indices yielded while scanning
+                """
+                for batch in folderModel.DataFileBatches(timeout=0.1):
+                    indices.extend(batch)
+
+            consumer = threading.Thread(target=ConsumeBatches)
+            consumer.start()
+            folderModel.PopulateDataFilePaths()
+            consumer.join(10)
+            self.assertFalse(consumer.is_alive())
+            self.assertEqual(indices, list(range(5)))
+            self.assertEqual(folderModel.status, "0 of 5 files uploaded")
+
+            # A folder model which isn't scanned has no batches to wait for:
+            folderModel = FolderModel(
+                2, "Dataset", location, "testuser1", None, testuser1,
+                scanFiles=False)
+            self.assertEqual(
+                [list(batch) for batch in folderModel.DataFileBatches()],
+                [[]])
+        finally:
+            shutil.rmtree(location)
+
+    def test_folder_model_watched_files(self):
+        """Test adding new and modified files reported by the watcher
+        """
+        SETTINGS.filters.useIncludesFile = False
+        SETTINGS.filters.useExcludesFile = False
+        testuser1 = UserModel(username="testuser1")
+        location = tempfile.mkdtemp()
+        try:
+            os.makedirs(os.path.join(location, "Dataset"))
+            dataFilePath = os.path.join(location, "Dataset", "file1.txt")
+            with open(dataFilePath, 'w') as dataFile:
+                dataFile.write("12345")
+            folderModel = FolderModel(
+                1, "Dataset", location, "testuser1", None, testuser1)
+            self.assertEqual(folderModel.numFiles, 1)
+            folderModel.SetDataFileUploaded(0, True)
+            folderModel.dataFileLookupIndex = MagicMock()
+
+            settledFiles = []
+            settled = threading.Event()
+
+            def OnSettledFiles(files):
+                """
+                Record files reported by the watcher
+                """
+                settledFiles.extend(files)
+                settled.set()
+
+            watcher = FolderWatcher(
+                location, OnSettledFiles, settleTime=0.2, pollInterval=0.1,
+                useInotify=False)
+            watcher.Start()
+            try:
+                # The scanned file is still being written:
+                with open(dataFilePath, 'a') as dataFile:
+                    dataFile.write("67890")
+                self.assertTrue(settled.wait(10))
+            finally:
+                watcher.Stop()
+            self.assertEqual(
+                [path for path, _ in settledFiles], [dataFilePath])
+            path, fileStat = settledFiles[0]
+            self.assertEqual(folderModel.AddDataFile(path, fileStat), 0)
+            self.assertEqual(folderModel.numFiles, 1)
+            self.assertEqual(folderModel.GetDataFileSize(0), 10)
+            self.assertEqual(folderModel.status, "0 of 1 files uploaded")
+            # Its DataFile record (created after the lookup index was
+            # populated) must be found, so it isn't created again:
+            folderModel.dataFileLookupIndex.Invalidate.assert_called_once_with(
+                "file1.txt", "")
+            # The same FileStat again doesn't need another upload:
+            self.assertIsNone(folderModel.AddDataFile(path, fileStat))
+
+            newFilePath = os.path.join(location, "Dataset", "file2.txt")
+            with open(newFilePath, 'w') as dataFile:
+                dataFile.write("new")
+            self.assertEqual(
+                folderModel.AddDataFile(newFilePath, StatFile(newFilePath)),
+                1)
+            self.assertEqual(folderModel.status, "0 of 2 files uploaded")
+        finally:
+            shutil.rmtree(location)
+
     def tearDown(self):
         if os.path.exists(self.includesFilePath):
             os.remove(self.includesFilePath)
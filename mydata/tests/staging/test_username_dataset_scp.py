@@ -287,8 +287,7 @@ class ScanUsernameDatasetScpTester(MyDataScanFoldersTester):
         loggerOutput = logger.GetValue()
         for row in range(foldersModel.GetRowCount()):
             folderModel = foldersModel.GetFolderRecord(row)
-            for dataFileIndex in range(folderModel.numFiles):
-                folderModel.dataFilePaths['files'][dataFileIndex] += "_INVALID"
+            folderModel.dataFiles.rootPath += "_INVALID"
             foldersController.StartUploadsForFolder(folderModel)
         foldersController.FinishedScanningForDatasetFolders()
         newLogs = Subtract(logger.GetValue(), loggerOutput)
@@ -315,10 +314,8 @@ class ScanUsernameDatasetScpTester(MyDataScanFoldersTester):
         loggerOutput = logger.GetValue()
         for row in range(foldersModel.GetRowCount()):
             folderModel = foldersModel.GetFolderRecord(row)
-            for dataFileIndex in range(folderModel.numFiles):
-                folderModel.dataFilePaths['files'][dataFileIndex] = \
-                    folderModel.dataFilePaths['files'][dataFileIndex] \
-                    .rstrip("_INVALID")
+            folderModel.dataFiles.rootPath = \
+                folderModel.dataFiles.rootPath[:-len("_INVALID")]
             foldersController.StartUploadsForFolder(folderModel)
         foldersController.FinishedScanningForDatasetFolders()
         newLogs = Subtract(logger.GetValue(), loggerOutput)
@@ -2,6 +2,7 @@
 Test ability to open folders view.
 """
 from ...dataviewmodels.dataview import DATAVIEW_MODELS
+from ...dataviewmodels.dataview import UI_UPDATE_BUS
 from ...models.folder import FolderModel
 from ...models.user import UserModel
 from ...views.dataview import MyDataDataView
@@ -38,6 +39,13 @@ class FoldersViewTester(MyDataSettingsTester):
         self.assertEqual(foldersModel.GetRowCount(), 1)
         self.assertEqual(foldersModel.GetUnfilteredRowCount(), 1)
         self.assertEqual(foldersModel.GetFilteredRowCount(), 0)
+        # Without the UI update bus's timer running, status updates from
+        # the main thread are flushed immediately:
+        numFlushes = UI_UPDATE_BUS.numFlushes
+        foldersModel.FolderStatusUpdated(folderModel)
+        self.assertEqual(UI_UPDATE_BUS.numFlushes, numFlushes + 1)
+        self.assertEqual(UI_UPDATE_BUS.GetMetrics()['queueDepth'], 1)
+        self.assertFalse(UI_UPDATE_BUS.changedCells)
         folder = "Birds"
         folderModel = \
             FolderModel(dataViewId, folder, location,
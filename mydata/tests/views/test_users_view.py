@@ -50,16 +50,36 @@ class UsersViewTester(unittest.TestCase):
         self.assertEqual(usersModel.GetRowCount(), 2)
         self.assertEqual(usersModel.GetUnfilteredRowCount(), 2)
         self.assertEqual(usersModel.GetFilteredRowCount(), 0)
+        self.assertEqual(usersModel.GetRowIndex(testuser2), 1)
         usersModel.Filter("testuser2")
         self.assertEqual(usersModel.GetUnfilteredRowCount(), 2)
         self.assertEqual(usersModel.GetFilteredRowCount(), 1)
-        usersModel.Filter("notfound")
-        self.assertEqual(usersModel.GetUnfilteredRowCount(), 2)
+        # Row indices are updated when rows are filtered out:
+        self.assertIsNone(usersModel.GetRowIndex(testuser1))
+        self.assertEqual(usersModel.GetRowIndex(testuser2), 0)
+        # Rows added while a search string is active are filtered as they
+        # are added:
+        dataViewId = usersModel.GetMaxDataViewId() + 1
+        testuser3 = UserModel(
+            username="testuser3",
+            fullName="Test User3",
+            email="testuser3@example.com",
+            dataViewId=dataViewId)
+        usersModel.AddRow(testuser3)
+        self.assertEqual(usersModel.GetUnfilteredRowCount(), 3)
         self.assertEqual(usersModel.GetFilteredRowCount(), 2)
+        self.assertIsNone(usersModel.GetRowIndex(testuser3))
+        usersModel.Filter("notfound")
+        self.assertEqual(usersModel.GetUnfilteredRowCount(), 3)
+        self.assertEqual(usersModel.GetFilteredRowCount(), 3)
         usersModel.Filter("")
-        self.assertEqual(usersModel.GetUnfilteredRowCount(), 2)
+        self.assertEqual(usersModel.GetUnfilteredRowCount(), 3)
         self.assertEqual(usersModel.GetFilteredRowCount(), 0)
+        self.assertEqual(usersModel.GetRowIndex(testuser1), 0)
+        self.assertEqual(usersModel.GetRowIndex(testuser2), 1)
+        self.assertEqual(usersModel.GetRowIndex(testuser3), 2)
         usersModel.DeleteAllRows()
+        self.assertIsNone(usersModel.GetRowIndex(testuser1))
         self.assertEqual(usersModel.GetUnfilteredRowCount(), 0)
         self.assertEqual(usersModel.GetFilteredRowCount(), 0)
 
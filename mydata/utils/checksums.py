@@ -0,0 +1,137 @@
+"""
+Persistent cache of MD5 checksums, used to avoid re-reading large files
+when an upload is retried, or when a datafile record wasn't created by an
+earlier upload attempt.
+
+Checksums are keyed by each file's absolute path, and are only reused if
+the file's size, modified time (in nanoseconds), inode and device numbers
+are unchanged since the checksum was calculated.  The cache holds at most
+maxEntries checksums, evicting the least recently used checksums first.
+
+The cache is saved as JSON, next to MyData.cfg.
+"""
+import json
+import os
+import threading
+import traceback
+from collections import OrderedDict
+
+from ..logs import logger
+
+CHECKSUM_CACHE_VERSION = 1
+
+
+class ChecksumCache(object):
+    """
+    Persistent LRU cache of MD5 checksums.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path = None
+        self.maxEntries = 0
+        self.entries = OrderedDict()
+        self.modified = False
+        self.numHits = 0
+        self.numMisses = 0
+
+    def Load(self, path, maxEntries):
+        """
+        Load the cache from disk, unless it has already been loaded from
+        the same path.
+
+        :param path: The location of the cache on disk
+        :param maxEntries: The maximum number of checksums to keep
+        """
+        with self.lock:
+            self.maxEntries = maxEntries
+            self.numHits = 0
+            self.numMisses = 0
+            if path == self.path:
+                self.EvictEntries()
+                return
+            self.path = path
+            self.entries = OrderedDict()
+            self.modified = False
+            if os.path.exists(path):
+                try:
+                    with open(path, "r") as cacheFile:
+                        cacheJson = json.load(cacheFile)
+                    if cacheJson.get('version') == CHECKSUM_CACHE_VERSION:
+                        # Entries are saved from least to most recently used:
+                        for filePath, values in cacheJson['entries']:
+                            self.entries[filePath] = tuple(values)
+                except:
+                    logger.warning(
+                        "Couldn't load checksum cache from %s" % path)
+                    logger.warning(traceback.format_exc())
+                    self.entries = OrderedDict()
+            self.EvictEntries()
+
+    def EvictEntries(self):
+        """
+        Evict the least recently used checksums until there are no more
+        than maxEntries.  The caller should hold the lock.
+        """
+        while len(self.entries) > max(self.maxEntries, 0):
+            self.entries.popitem(last=False)
+            self.modified = True
+
+    def Get(self, filePath, fileStat):
+        """
+        Return the cached MD5 checksum for a file, or None if the file
+        isn't cached or has changed since its checksum was calculated.
+        """
+        key = (fileStat.size, fileStat.mtimeNs, fileStat.inode,
+               fileStat.device)
+        with self.lock:
+            values = self.entries.get(filePath)
+            if not values or values[:4] != key:
+                self.numMisses += 1
+                return None
+            self.entries.move_to_end(filePath)
+            self.numHits += 1
+            return values[4]
+
+    def Put(self, filePath, fileStat, md5sum):
+        """
+        Record a file's MD5 checksum, calculated from the file's content
+        when its stat was fileStat.
+        """
+        if not md5sum or self.maxEntries <= 0:
+            return
+        with self.lock:
+            self.entries[filePath] = (
+                fileStat.size, fileStat.mtimeNs, fileStat.inode,
+                fileStat.device, md5sum)
+            self.entries.move_to_end(filePath)
+            self.modified = True
+            self.EvictEntries()
+
+    def Save(self):
+        """
+        Save the cache to disk, if it has been modified since it was loaded.
+        """
+        with self.lock:
+            if not self.path or not self.modified:
+                return
+            logger.info(
+                "Checksum cache: %s hit(s), %s miss(es), saving %s "
+                "checksum(s)." % (self.numHits, self.numMisses,
+                                  len(self.entries)))
+            cacheJson = dict(
+                version=CHECKSUM_CACHE_VERSION,
+                entries=[[filePath, list(values)]
+                         for filePath, values in self.entries.items()])
+            try:
+                tempPath = self.path + ".tmp"
+                with open(tempPath, "w") as cacheFile:
+                    json.dump(cacheJson, cacheFile)
+                os.replace(tempPath, self.path)
+                self.modified = False
+            except:
+                logger.warning(
+                    "Couldn't save checksum cache to %s" % self.path)
+                logger.warning(traceback.format_exc())
+
+
+CHECKSUM_CACHE = ChecksumCache()
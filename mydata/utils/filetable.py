@@ -0,0 +1,164 @@
+"""
+Compact storage for a dataset folder's file list.
+
+A FolderModel used to hold each file's absolute path, directory and upload
+state as separate Python objects (plus a FileStat tuple per file), which
+costs hundreds of bytes per file, i.e. hundreds of MB for folders with
+millions of files.  DataFileTable stores each distinct directory once,
+packs the filenames into one buffer, keeps upload states in a bytearray and
+stat fields in typed arrays, and composes paths and FileStats on demand.
+"""
+import os
+import threading
+from array import array
+
+from .scanner import FileStat
+
+
+class DataFileTable(object):
+    """
+    The files within one dataset folder, in scan order.
+
+    Directories are relative to rootPath, with an empty string for
+    rootPath itself.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, rootPath):
+        self.rootPath = rootPath
+        self.lock = threading.Lock()
+        # Each distinct directory is stored once, both as a native relative
+        # path, and in MyTardis format (with forward slashes):
+        self.localDirectories = []
+        self.directories = []
+        self.directoryIds = dict()
+        self.fileDirectoryIds = array('I')
+        # Filenames are stored (encoded with os.fsencode) in one buffer,
+        # with file i's name at names[nameOffsets[i]:nameOffsets[i + 1]]:
+        self.names = bytearray()
+        self.nameOffsets = array('Q', [0])
+        # Upload states, and a running count of uploaded files:
+        self.uploaded = bytearray()
+        self.numUploaded = 0
+        # The FileStat fields:
+        self.sizes = array('q')
+        self.mtimes = array('d')
+        self.mtimesNs = array('q')
+        self.ctimes = array('d')
+        self.inodes = array('Q')
+        self.devices = array('Q')
+
+    def __len__(self):
+        return len(self.uploaded)
+
+    def GetDirectoryId(self, directory):
+        """
+        Return the ID of a directory (relative to rootPath), adding it to
+        the directory table if necessary.
+        """
+        directoryId = self.directoryIds.get(directory)
+        if directoryId is None:
+            directoryId = len(self.directories)
+            self.localDirectories.append(directory)
+            self.directories.append(directory.replace("\\", "/"))
+            self.directoryIds[directory] = directoryId
+        return directoryId
+
+    def Append(self, directory, filename, fileStat):
+        """
+        Add a file, returning its index.
+        """
+        with self.lock:
+            self.fileDirectoryIds.append(self.GetDirectoryId(directory))
+            self.names += os.fsencode(filename)
+            self.nameOffsets.append(len(self.names))
+            self.sizes.append(fileStat.size)
+            self.mtimes.append(fileStat.mtime)
+            self.mtimesNs.append(fileStat.mtimeNs)
+            self.ctimes.append(fileStat.ctime)
+            self.inodes.append(fileStat.inode)
+            self.devices.append(fileStat.device)
+            # len(self) is len(self.uploaded), and readers don't hold the
+            # lock, so the file only becomes visible once all of its fields
+            # have been stored:
+            self.uploaded.append(0)
+            return len(self.uploaded) - 1
+
+    def GetDirectory(self, index):
+        """
+        Return a file's directory, relative to rootPath, in MyTardis format
+        """
+        return self.directories[self.fileDirectoryIds[index]]
+
+    def GetFilename(self, index):
+        """
+        Return a file's filename
+        """
+        return os.fsdecode(
+            bytes(self.names[self.nameOffsets[index]:
+                             self.nameOffsets[index + 1]]))
+
+    def GetPath(self, index):
+        """
+        Return a file's absolute path
+        """
+        directory = self.localDirectories[self.fileDirectoryIds[index]]
+        if directory:
+            return os.path.join(
+                self.rootPath, directory, self.GetFilename(index))
+        return os.path.join(self.rootPath, self.GetFilename(index))
+
+    def GetStat(self, index):
+        """
+        Return a file's FileStat
+        """
+        return FileStat(
+            size=self.sizes[index],
+            mtime=self.mtimes[index],
+            mtimeNs=self.mtimesNs[index],
+            ctime=self.ctimes[index],
+            inode=self.inodes[index],
+            device=self.devices[index])
+
+    def SetStat(self, index, fileStat):
+        """
+        Update a file's FileStat
+        """
+        with self.lock:
+            self.sizes[index] = fileStat.size
+            self.mtimes[index] = fileStat.mtime
+            self.mtimesNs[index] = fileStat.mtimeNs
+            self.ctimes[index] = fileStat.ctime
+            self.inodes[index] = fileStat.inode
+            self.devices[index] = fileStat.device
+
+    def IsUploaded(self, index):
+        """
+        Return True if a file has been uploaded (or verified)
+        """
+        return bool(self.uploaded[index])
+
+    def SetUploaded(self, index, uploaded):
+        """
+        Set a file's upload state, updating the running count in O(1)
+        """
+        with self.lock:
+            uploaded = int(bool(uploaded))
+            self.numUploaded += uploaded - self.uploaded[index]
+            self.uploaded[index] = uploaded
+
+    def ResetUploaded(self):
+        """
+        Mark all files as not uploaded
+        """
+        with self.lock:
+            self.uploaded = bytearray(len(self.uploaded))
+            self.numUploaded = 0
+
+    def GetIndices(self):
+        """
+        Return a dictionary mapping each file's absolute path to its index,
+        e.g. for detecting duplicates when adding files.
+        """
+        return dict(
+            (self.GetPath(index), index)
+            for index in range(len(self)))
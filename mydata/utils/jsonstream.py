@@ -0,0 +1,129 @@
+"""
+Incremental parsing of MyTardis API list responses.
+
+A Tastypie list response looks like this:
+
+    {"meta": {"limit": 20, "next": null, ...}, "objects": [{...}, {...}]}
+
+JsonListStream yields the elements of "objects" one at a time as the
+response body is received, so a long list never needs to be held in
+memory as one decoded blob.
+"""
+import codecs
+import json
+
+WHITESPACE = " \t\r\n"
+NUMBER_CHARS = "0123456789.eE+-"
+
+
+class JsonListStream(object):
+    """
+    Iterate over the "objects" list of a Tastypie list response,
+    given an iterable of the response body's bytes, e.g.
+    response.iter_content(chunk_size=65536).
+
+    Top-level values other than "objects" (e.g. "meta") are decoded in
+    full and made available as attributes after iteration.
+    """
+    def __init__(self, chunks):
+        self.chunks = iter(chunks)
+        self.decoder = json.JSONDecoder()
+        self.textDecoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.exhausted = False
+        self.meta = None
+
+    def __iter__(self):
+        self.Expect("{")
+        if self.Peek() == "}":
+            return
+        while True:
+            key = self.Decode()
+            self.Expect(":")
+            if key == "objects":
+                self.Expect("[")
+                if self.Peek() == "]":
+                    self.pos += 1
+                else:
+                    while True:
+                        yield self.Decode()
+                        if self.Expect(",]") == "]":
+                            break
+            else:
+                value = self.Decode()
+                if key == "meta":
+                    self.meta = value
+            if self.Expect(",}") == "}":
+                return
+
+    def Fill(self):
+        """
+        Append the next chunk of the response body to the buffer,
+        discarding what has already been parsed.
+
+        Returns False if there is nothing left to read.
+        """
+        if self.exhausted:
+            return False
+        try:
+            chunk = next(self.chunks)
+            text = self.textDecoder.decode(chunk)
+        except StopIteration:
+            self.exhausted = True
+            text = self.textDecoder.decode(b"", final=True)
+        self.buffer = self.buffer[self.pos:] + text
+        self.pos = 0
+        return not self.exhausted or text != ""
+
+    def Peek(self):
+        """
+        Skip whitespace and return the next character without consuming it,
+        or None at the end of the response body.
+        """
+        while True:
+            while self.pos < len(self.buffer) and \
+                    self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.Fill():
+                return None
+
+    def Expect(self, allowedChars):
+        """
+        Consume and return the next non-whitespace character,
+        which must be one of allowedChars.
+
+        :raises ValueError:
+        """
+        char = self.Peek()
+        if char is None or char not in allowedChars:
+            raise ValueError(
+                "Expected one of %s in JSON list response, but found %s"
+                % (list(allowedChars), repr(char)))
+        self.pos += 1
+        return char
+
+    def Decode(self):
+        """
+        Decode the next complete JSON value, reading more of the
+        response body as required.
+
+        :raises json.JSONDecodeError:
+        """
+        self.Peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                if self.Fill():
+                    continue
+                raise
+            if not isinstance(value, (dict, list, str)) and \
+                    (end == len(self.buffer) or
+                     self.buffer[end] in NUMBER_CHARS) and self.Fill():
+                # A number at the end of the buffer could be truncated:
+                continue
+            self.pos = end
+            return value
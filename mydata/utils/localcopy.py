@@ -0,0 +1,186 @@
+"""
+Copying files into a staging area which is mounted on this machine (e.g.
+via NFS or SMB), for the LOCAL_COPY upload method.
+
+Files are copied by the kernel where possible, rather than being read into
+MyData's process and encrypted for SSH: first by cloning the file (a
+reflink, if the source and destination are on the same filesystem and it
+supports cloning), then with os.copy_file_range (which NFS 4.2 and SMB3 can
+offload to the server), then with os.sendfile.  If none of these are
+available, or if the file's MD5 sum is being calculated while copying, the
+file is read into a reusable buffer and written from a memoryview.
+
+Directories and files are given the same permissions as directories and
+files uploaded to staging with SSH.
+"""
+import errno
+import os
+import posixpath
+import sys
+from datetime import datetime
+
+from ..logs import logger
+from .upload import REMOTE_DIR_MODE
+from .upload import REMOTE_FILE_MODE
+
+if sys.platform.startswith("linux"):
+    import fcntl
+
+COPY_CHUNK_SIZE = 8 * 1024 * 1024
+
+# From linux/fs.h:
+FICLONE = 0x40049409
+
+# Errors meaning that a copy method isn't supported for this pair of files:
+UNSUPPORTED_ERRNOS = (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EBADF,
+                      errno.EOPNOTSUPP, errno.ENOTTY, errno.EPERM)
+
+
+def GetLocalStagingPath(localStagingDir, location, remoteFilePath):
+    """
+    Return the path on this machine of a file in the staging area, given
+    its path on the staging host (remoteFilePath), the storage box's
+    location on the staging host, and the directory where that location
+    is mounted on this machine (localStagingDir)
+    """
+    relPath = posixpath.relpath(remoteFilePath, location.rstrip('/') or '/')
+    relPathComponents = relPath.split('/')
+    if relPath == posixpath.curdir or relPathComponents[0] == posixpath.pardir:
+        raise ValueError("%s isn't in the staging location, %s"
+                         % (remoteFilePath, location))
+    return os.path.join(localStagingDir, *relPathComponents)
+
+
+def SetMode(path, mode):
+    """
+    Set a copied file or directory's permissions, if the filesystem
+    allows it (e.g. SMB shares may not)
+    """
+    try:
+        os.chmod(path, mode)
+    except OSError as err:
+        logger.debug("Couldn't set the permissions of %s: %s" % (path, err))
+
+
+def MakeStagingDirs(localDir):
+    """
+    Create localDir and any missing parent directories, with the same
+    permissions as staging directories created with SSH
+    """
+    missingDirs = []
+    path = localDir
+    while not os.path.isdir(path):
+        missingDirs.append(path)
+        parent = os.path.dirname(path)
+        if parent == path:
+            break
+        path = parent
+    for path in reversed(missingDirs):
+        try:
+            os.mkdir(path, REMOTE_DIR_MODE)
+        except FileExistsError:
+            # Created by another upload thread:
+            continue
+        SetMode(path, REMOTE_DIR_MODE)
+
+
+def CloneFile(src, dst):
+    """
+    Try to clone src into dst (a reflink), returning True if successful
+    """
+    if not sys.platform.startswith("linux"):
+        return False
+    try:
+        fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        return True
+    except OSError as err:
+        if err.errno not in UNSUPPORTED_ERRNOS:
+            raise
+        return False
+
+
+def CopyInKernel(src, dst, size, uploadModel, progressCallback):
+    """
+    Copy src into dst with os.copy_file_range or os.sendfile, returning
+    the number of bytes copied, or None if neither method is supported
+    for this pair of files
+    """
+    methods = []
+    if hasattr(os, "copy_file_range"):
+        methods.append(
+            lambda count, offset: os.copy_file_range(
+                src.fileno(), dst.fileno(), count, offset, offset))
+    if sys.platform.startswith("linux"):
+        methods.append(
+            lambda count, offset: os.sendfile(
+                dst.fileno(), src.fileno(), offset, count))
+    for method in methods:
+        offset = 0
+        try:
+            while offset < size and not uploadModel.canceled:
+                numBytes = method(min(COPY_CHUNK_SIZE, size - offset), offset)
+                if not numBytes:
+                    break
+                offset += numBytes
+                uploadModel.SetLatestTime(datetime.now())
+                progressCallback(current=offset, total=size)
+            return offset
+        except OSError as err:
+            if offset > 0 or err.errno not in UNSUPPORTED_ERRNOS:
+                raise
+    return None
+
+
+def CopyWithBuffer(src, dst, size, uploadModel, progressCallback, md5=None):
+    """
+    Copy src into dst via a reusable buffer, updating md5 (a hashlib
+    object) if specified, and returning the number of bytes copied
+    """
+    buf = bytearray(min(COPY_CHUNK_SIZE, max(size, 1)))
+    view = memoryview(buf)
+    offset = 0
+    while not uploadModel.canceled:
+        numBytes = src.readinto(view)
+        if not numBytes:
+            break
+        dst.write(view[:numBytes])
+        if md5 is not None:
+            md5.update(view[:numBytes])
+        offset += numBytes
+        uploadModel.SetLatestTime(datetime.now())
+        progressCallback(current=offset, total=size)
+    return offset
+
+
+def CopyFileToStaging(filePath, localPath, uploadModel, progressCallback,
+                      md5=None, checksumCallback=None):
+    """
+    Copy a file into the locally mounted staging area.
+
+    If md5 (a hashlib object) is specified, it is updated with the file's
+    content as it is copied, and checksumCallback is called with the
+    file's MD5 sum once the file has been copied.
+    """
+    # pylint: disable=too-many-arguments
+    MakeStagingDirs(os.path.dirname(localPath))
+    with open(filePath, 'rb') as src, open(localPath, 'wb') as dst:
+        size = os.fstat(src.fileno()).st_size
+        numBytes = None
+        if md5 is None:
+            if CloneFile(src, dst):
+                numBytes = size
+                progressCallback(current=size, total=size)
+            else:
+                numBytes = CopyInKernel(
+                    src, dst, size, uploadModel, progressCallback)
+        if numBytes is None:
+            numBytes = CopyWithBuffer(
+                src, dst, size, uploadModel, progressCallback, md5)
+    if uploadModel.canceled:
+        return
+    if numBytes != size:
+        raise IOError("Copied %s of %s bytes from %s to %s"
+                      % (numBytes, size, filePath, localPath))
+    SetMode(localPath, REMOTE_FILE_MODE)
+    if checksumCallback:
+        checksumCallback(md5.hexdigest())
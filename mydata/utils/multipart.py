@@ -0,0 +1,201 @@
+"""
+Multipart POST uploads which stream the file's content without copying it
+through Python byte strings.
+
+requests_toolbelt's MultipartEncoder reads each block of the file into a
+new byte string, which is then copied again by http.client and the socket
+module, so CPU time can limit the upload rate on fast networks.  Here, the
+multipart preamble and trailer are written directly to the connection's
+socket, and the file's content is sent with socket.sendfile, which uses
+os.sendfile where available.  sendfile can't be used with TLS, so for
+HTTPS, the file is read into a reusable buffer, and sent from a memoryview
+of the buffer.
+
+Each upload opens its own connection, bypassing the requests session's
+connection pool, proxies and redirect handling, so only files of at least
+SENDFILE_MIN_SIZE bytes are uploaded this way (see CanSendFile), where the
+cost of the new connection is small compared to copying the file's content.
+Smaller files, and uploads via a proxy, use the pooled session instead.
+
+Progress callbacks receive an UploadMonitor, with the same bytes_read and
+len attributes as requests_toolbelt's MultipartEncoderMonitor.  Closing the
+file (e.g. to cancel the upload) raises ValueError("I/O operation on
+closed file"), as it does when the file is closed while a
+MultipartEncoder is reading it.
+"""
+import http.client
+import os
+import socket
+import ssl
+import uuid
+from urllib.parse import urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+from urllib3.fields import RequestField
+
+from .session import COUNTS
+
+SENDFILE_CHUNK_SIZE = 8 * 1024 * 1024
+TLS_BUFFER_SIZE = 1024 * 1024
+SENDFILE_MIN_SIZE = 16 * 1024 * 1024
+
+
+class UploadMonitor(object):
+    """
+    Progress of a multipart upload, passed to progress callbacks
+    """
+    def __init__(self, length, callback):
+        self.len = length
+        self.bytes_read = 0  # pylint: disable=invalid-name
+        self.callback = callback
+
+    def Update(self, numBytes):
+        """
+        Count bytes sent, and report progress
+        """
+        self.bytes_read += numBytes
+        if self.callback:
+            self.callback(self)
+
+
+def RenderFieldHeaders(name, filename=None, contentType=None):
+    """
+    Return the headers for one part of a multipart/form-data body
+    """
+    field = RequestField(name=name, data=b"", filename=filename)
+    field.make_multipart(content_type=contentType)
+    return field.render_headers().encode("utf-8")
+
+
+def CanSendFile(url, size):
+    """
+    Return True if a file of size bytes should be POSTed to url with
+    PostMultipartFile, rather than with the pooled requests session
+    """
+    return size >= SENDFILE_MIN_SIZE and \
+        not requests.utils.get_environ_proxies(url)
+
+
+def GetCaBundle():
+    """
+    Return the path of the CA certificates used by the requests module
+    """
+    return os.environ.get('REQUESTS_CA_BUNDLE') or requests.certs.where()
+
+
+def Connect(url, timeout):
+    """
+    Open an HTTP(S) connection to the server in url
+
+    :param timeout: a (connect, read) tuple, like requests' timeouts
+    """
+    connectTimeout, readTimeout = timeout
+    parts = urlsplit(url)
+    if parts.scheme == "https":
+        context = ssl.create_default_context(cafile=GetCaBundle())
+        connection = http.client.HTTPSConnection(
+            parts.hostname, parts.port, timeout=connectTimeout,
+            context=context)
+    else:
+        connection = http.client.HTTPConnection(
+            parts.hostname, parts.port, timeout=connectTimeout)
+    connection.connect()
+    connection.sock.settimeout(readTimeout)
+    COUNTS.IncrementNewConnections()
+    return connection
+
+
+def SendFile(sock, fileObject, size, monitor):
+    """
+    Send size bytes of fileObject (from its beginning) to sock
+    """
+    offset = 0
+    try:
+        if isinstance(sock, ssl.SSLSocket):
+            buf = bytearray(min(TLS_BUFFER_SIZE, max(size, 1)))
+            view = memoryview(buf)
+            fileObject.seek(0)
+            while offset < size:
+                numBytes = fileObject.readinto(view[:size - offset])
+                if not numBytes:
+                    break
+                sock.sendall(view[:numBytes])
+                offset += numBytes
+                monitor.Update(numBytes)
+        else:
+            while offset < size:
+                count = min(SENDFILE_CHUNK_SIZE, size - offset)
+                numBytes = sock.sendfile(fileObject, offset, count)
+                if not numBytes:
+                    break
+                offset += numBytes
+                monitor.Update(numBytes)
+    except OSError:
+        if fileObject.closed:
+            raise ValueError("I/O operation on closed file")
+        raise
+    if offset < size:
+        raise ValueError("%s was truncated while it was being uploaded."
+                         % fileObject.name)
+
+
+def PostMultipartFile(url, headers, fields, fileField, fileObject,
+                      filename, progressCallback=None, timeout=(10, None)):
+    """
+    POST a multipart/form-data body containing fields (a dict of strings)
+    and the content of fileObject (opened in binary mode), returning a
+    requests.Response.
+
+    :raises requests.exceptions.ConnectionError:
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    boundary = uuid.uuid4().hex
+    delimiter = b"--" + boundary.encode() + b"\r\n"
+    preamble = b""
+    for name, value in fields.items():
+        preamble += delimiter + RenderFieldHeaders(name) + \
+            value.encode("utf-8") + b"\r\n"
+    preamble += delimiter + RenderFieldHeaders(
+        fileField, filename, "application/octet-stream")
+    trailer = b"\r\n--" + boundary.encode() + b"--\r\n"
+    size = os.fstat(fileObject.fileno()).st_size
+    monitor = UploadMonitor(
+        len(preamble) + size + len(trailer), progressCallback)
+
+    parts = urlsplit(url)
+    path = parts.path + ("?" + parts.query if parts.query else "")
+    try:
+        connection = Connect(url, timeout)
+        try:
+            COUNTS.IncrementRequests()
+            connection.putrequest("POST", path, skip_accept_encoding=True)
+            headers = CaseInsensitiveDict(headers)
+            headers['Content-Type'] = \
+                "multipart/form-data; boundary=%s" % boundary
+            headers['Content-Length'] = str(monitor.len)
+            for name, value in headers.items():
+                connection.putheader(name, value)
+            connection.endheaders()
+            connection.sock.sendall(preamble)
+            monitor.Update(len(preamble))
+            SendFile(connection.sock, fileObject, size, monitor)
+            connection.sock.sendall(trailer)
+            monitor.Update(len(trailer))
+            httpResponse = connection.getresponse()
+            response = requests.models.Response()
+            response.status_code = httpResponse.status
+            response.reason = httpResponse.reason
+            response.headers = CaseInsensitiveDict(httpResponse.getheaders())
+            # pylint: disable=protected-access
+            response._content = httpResponse.read()
+            response.url = url
+            response.encoding = requests.utils.get_encoding_from_headers(
+                response.headers)
+            return response
+        finally:
+            connection.close()
+    except (socket.error, http.client.HTTPException) as err:
+        if fileObject.closed:
+            raise ValueError("I/O operation on closed file")
+        raise requests.exceptions.ConnectionError(err)
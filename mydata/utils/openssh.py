@@ -13,6 +13,7 @@ import threading
 import time
 import struct
 import hashlib
+import tempfile
 import psutil
 
 from Crypto.PublicKey import RSA
@@ -43,6 +44,14 @@ if sys.platform.startswith("linux"):
 # interval of SLEEP_FACTOR * maxThreads.
 SLEEP_FACTOR = 0.1
 
+# Number of seconds a ControlMaster connection stays open after its last
+# multiplexed session, in case MyData exits without stopping it:
+CONTROL_PERSIST = 600
+
+# Remote commands which act on several paths at once (mkdir and chmod) are
+# split to keep each command line well within the limit for cmd.exe:
+MAX_REMOTE_COMMAND_LENGTH = 4000
+
 
 class OpenSSH(object):
     """
@@ -51,10 +60,25 @@ class OpenSSH(object):
     running remote commands over SSH via subprocesses.
     """
     def __init__(self):
-        self.cache = {}
+        # Remote directories which have been created, and the locks used
+        # to avoid creating the same directory concurrently:
+        self.remoteDirs = set()
+        self.remoteDirLocks = {}
+        # ControlMaster socket paths, keyed by (host, port, username):
+        self.controlPaths = {}
+        self.controlDir = None
         if "HOME" not in os.environ:
             os.environ["HOME"] = os.path.expanduser('~')
 
+    def ClearRemoteDirs(self):
+        """
+        Forget which remote directories have been created, e.g. before
+        starting a new set of uploads, in case they have been moved
+        """
+        with LOCKS.createRemoteDir:
+            self.remoteDirs = set()
+            self.remoteDirLocks = {}
+
     @staticmethod
     def DoubleQuote(string):
         """
@@ -83,11 +107,19 @@ def NormalizeLocalPath(filePath):
     return OpenSSH.DoubleQuote(filePath)
 
 
-def WithDefaultOptions(opts, args):
+def WithDefaultOptions(opts, args, ssh=None, controlOptions=None):
     """
     Returns command with default SSH options
+
+    If a ControlMaster connection has been started for the host (given by
+    opts for ssh commands, or by ssh for scp commands), the command is
+    routed through it, unless controlOptions are specified.
     """
     isSSH = isinstance(opts, list)
+    if isSSH:
+        ssh = opts
+    if controlOptions is None:
+        controlOptions = ControlMasterOptions(ssh) if ssh else []
 
     cmdWithArgs = [
         GetOpenSshBinary("ssh") if isSSH else GetOpenSshBinary(opts),
@@ -96,7 +128,7 @@ def WithDefaultOptions(opts, args):
         "-oStrictHostKeyChecking=no",
         "-oConnectTimeout=%s" % int(SETTINGS.miscellaneous.connectionTimeout),
         "-c", SETTINGS.miscellaneous.cipher
-    ]
+    ] + controlOptions
 
     if isSSH:
         cmdWithArgs += [
@@ -113,6 +145,90 @@ def WithDefaultOptions(opts, args):
     return cmdWithArgs
 
 
+def ControlMasterKey(ssh):
+    """
+    Key for looking up the ControlMaster connection for
+    ssh = [host, port, username, keyfile]
+    """
+    return (ssh[0], str(ssh[1]), ssh[2])
+
+
+def ControlMasterOptions(ssh):
+    """
+    Options for routing an ssh or scp command through the ControlMaster
+    connection for ssh = [host, port, username, keyfile], if one has been
+    started.  If the master has exited, ssh falls back to opening a new
+    connection.
+    """
+    controlPath = OPENSSH.controlPaths.get(ControlMasterKey(ssh))
+    if not controlPath:
+        return []
+    return ["-oControlMaster=no",
+            "-oControlPath=%s" % NormalizeLocalPath(controlPath)]
+
+
+def StartControlMaster(ssh):
+    """
+    Start a ControlMaster connection to a staging host, unless one is
+    already running, so that subsequent ssh and scp commands can share its
+    authenticated connection, instead of each one performing its own key
+    exchange and authentication.
+
+    Connection multiplexing isn't supported by the Windows builds of
+    OpenSSH bundled with MyData.
+    """
+    if sys.platform.startswith("win") or \
+            not SETTINGS.miscellaneous.useSshControlMaster:
+        return
+    key = ControlMasterKey(ssh)
+    with LOCKS.startControlMaster:
+        if key in OPENSSH.controlPaths:
+            return
+        if OPENSSH.controlDir is None:
+            OPENSSH.controlDir = tempfile.mkdtemp(prefix="mydata-ssh-")
+        # Unix domain socket paths are limited to around 100 characters:
+        controlPath = os.path.join(
+            OPENSSH.controlDir,
+            hashlib.md5(repr(key).encode("utf-8")).hexdigest()[:16])
+        started = RunOpenSshCommand(
+            WithDefaultOptions(
+                ssh, ["true"],
+                controlOptions=[
+                    "-oControlMaster=yes",
+                    "-oControlPath=%s" % NormalizeLocalPath(controlPath),
+                    "-oControlPersist=%s" % CONTROL_PERSIST]),
+            raiseOnError=False, returnSuccess=True)
+        if started:
+            OPENSSH.controlPaths[key] = controlPath
+        else:
+            logger.warning(
+                "Couldn't start an SSH ControlMaster connection to %s, so "
+                "each SSH command will open its own connection." % ssh[0])
+            # Don't retry for every file:
+            OPENSSH.controlPaths[key] = None
+
+
+def StopControlMasters():
+    """
+    Ask each ControlMaster connection to exit, e.g. when uploads have
+    finished or been canceled
+    """
+    with LOCKS.startControlMaster:
+        controlPaths = OPENSSH.controlPaths
+        OPENSSH.controlPaths = {}
+    for key, controlPath in controlPaths.items():
+        if not controlPath:
+            continue
+        host, port, username = key
+        RunOpenSshCommand([
+            GetOpenSshBinary("ssh"),
+            "-oControlPath=%s" % NormalizeLocalPath(controlPath),
+            "-O", "exit",
+            "-p", port,
+            "-l", username,
+            host], raiseOnError=False)
+
+
 def GetOpenSshBinary(cmd, method=None):
     """
     Locate the SSH binaries on various systems.
@@ -457,27 +573,38 @@ def SshServerIsReady(ssh):
 
 def UploadFile(filePath, fileSize, username, privateKeyFilePath,
                host, port, remoteFilePath, progressCallback,
-               uploadModel):
+               uploadModel, md5=None, checksumCallback=None,
+               getRelatedRemoteDirs=None, uploadMethod=None):
     """
     Upload a file to staging using SCP.
 
     Ignore bytes uploaded previously, because MyData is no longer
     chunking files, so with SCP, we will always upload the whole
     file.
+
+    With the "Chunked" and "ParallelSSH" upload methods, the file's MD5 sum
+    can be calculated while uploading, by specifying md5 (a hashlib object)
+    and checksumCallback, which is called with the MD5 sum once the file's
+    content has been sent.
+
+    With the "OpenSSH" upload method, if the file's remote directory
+    hasn't been created yet, it is created in the same command as the
+    directories returned by getRelatedRemoteDirs (e.g. the remote
+    directories for the rest of the dataset's files).
+
+    uploadMethod overrides the upload method selected in the settings,
+    e.g. when the file's size determines its upload method.
     """
+    # pylint: disable=too-many-arguments
     ssh = [host, port, username, NormalizeLocalPath(privateKeyFilePath)]
-    uploadMethod = SETTINGS.advanced.uploadMethod
+    if uploadMethod is None:
+        uploadMethod = SETTINGS.advanced.uploadMethod
 
-    remoteDir = os.path.dirname(remoteFilePath)
-    remoteDir = remoteDir.replace('`', r'\\`').replace('$', r'\\$')
+    remoteDir = EscapeRemoteDir(os.path.dirname(remoteFilePath))
 
-    if uploadMethod != "Chunked":
-        cacheKey = hashlib.md5(remoteDir.encode("utf-8")).hexdigest()
-        if cacheKey not in OPENSSH.cache:
-            with LOCKS.createRemoteDir:
-                if uploadMethod != "ParallelSSH":
-                    CreateRemoteDir(ssh, remoteDir)
-                OPENSSH.cache[cacheKey] = True
+    if uploadMethod not in ("Chunked", "ParallelSSH"):
+        StartControlMaster(ssh)
+        CreateRemoteDirs(ssh, remoteDir, getRelatedRemoteDirs)
 
     if ShouldCancelUpload(uploadModel):
         logger.debug("UploadFile: Aborting upload for %s" % filePath)
@@ -490,12 +617,12 @@ def UploadFile(filePath, fileSize, username, privateKeyFilePath,
         try:
             UploadFileChunked(
                 SETTINGS.general.myTardisUrl,
-                SETTINGS.general.username,
-                SETTINGS.general.apiKey,
                 filePath,
                 uploadModel,
                 progressCallback,
-                SETTINGS.advanced.maxUploadRetries)
+                SETTINGS.advanced.maxUploadRetries,
+                md5=md5, checksumCallback=checksumCallback,
+                numThreads=SETTINGS.miscellaneous.maxChunkUploadThreads)
         except Exception as err:
             raise UploadFailed(err)
 
@@ -508,7 +635,9 @@ def UploadFile(filePath, fileSize, username, privateKeyFilePath,
                 filePath,
                 remoteFilePath,
                 uploadModel,
-                progressCallback)
+                progressCallback,
+                md5=md5, checksumCallback=checksumCallback,
+                window=SETTINGS.miscellaneous.sftpWriteWindow)
         except Exception as err:
             raise UploadFailed(err)
 
@@ -524,7 +653,7 @@ def UploadFile(filePath, fileSize, username, privateKeyFilePath,
                 "-i", NormalizeLocalPath(privateKeyFilePath),
                 NormalizeLocalPath(filePath),
                 "%s@%s:%s" % (username, host, remoteDir)
-            ])
+            ], ssh=ssh)
 
         if not sys.platform.startswith("linux"):
             ScpUpload(uploadModel, scpCommandList)
@@ -532,7 +661,7 @@ def UploadFile(filePath, fileSize, username, privateKeyFilePath,
             ScpUploadWithErrandBoy(uploadModel, scpCommandList)
 
     if uploadMethod not in ["Chunked", "ParallelSSH"]:
-        SetRemoteFilePermissions(ssh, remoteFilePath)
+        PERMISSIONS_BATCHER.SetPermissions(ssh, remoteFilePath)
 
     uploadModel.SetLatestTime(datetime.now())
     progressCallback(current=fileSize, total=fileSize)
@@ -609,26 +738,188 @@ def WaitForProcessToComplete(process):
         time.sleep(SLEEP_FACTOR * SETTINGS.advanced.maxUploadThreads)
 
 
-def CreateRemoteDir(ssh, remoteDir):
+def EscapeRemoteDir(remoteDir):
     """
-    Create a remote directory via SSH
+    Escape backticks and dollar signs in a remote directory path
     """
-    RunOpenSshCommand(
-        WithDefaultOptions(
-            ssh, [
-                "mkdir -m 2770 -p %s" % OPENSSH.DoubleQuoteRemotePath(remoteDir)
-            ]))
+    return remoteDir.replace('`', r'\\`').replace('$', r'\\$')
+
+
+def SplitRemoteCommandArgs(args):
+    """
+    Split quoted paths into groups which fit within
+    MAX_REMOTE_COMMAND_LENGTH, so that each group can be passed to one
+    remote command
+    """
+    group = []
+    length = 0
+    for arg in args:
+        if group and length + len(arg) + 1 > MAX_REMOTE_COMMAND_LENGTH:
+            yield group
+            group = []
+            length = 0
+        group.append(arg)
+        length += len(arg) + 1
+    if group:
+        yield group
+
+
+def CreateRemoteDir(ssh, remoteDirs):
+    """
+    Create remote directories via SSH
+    """
+    for group in SplitRemoteCommandArgs(
+            [OpenSSH.DoubleQuoteRemotePath(remoteDir)
+             for remoteDir in remoteDirs]):
+        RunOpenSshCommand(
+            WithDefaultOptions(
+                ssh, [
+                    "mkdir -m 2770 -p %s" % " ".join(group)
+                ]))
+
 
+def CreateRemoteDirs(ssh, remoteDir, getRelatedRemoteDirs=None):
+    """
+    Create a remote directory via SSH, unless it has already been created,
+    along with any related directories (returned by getRelatedRemoteDirs)
+    which haven't been created yet, in as few remote commands as possible.
 
-def SetRemoteFilePermissions(ssh, remoteFilePath):
+    Uploads only wait for each other if they need the same directory.
+    """
+    if remoteDir in OPENSSH.remoteDirs:
+        return
+    with LOCKS.createRemoteDir:
+        lock = OPENSSH.remoteDirLocks.setdefault(remoteDir, threading.Lock())
+    with lock:
+        if remoteDir in OPENSSH.remoteDirs:
+            return
+        remoteDirs = set([remoteDir])
+        if getRelatedRemoteDirs:
+            remoteDirs.update(
+                EscapeRemoteDir(relatedRemoteDir)
+                for relatedRemoteDir in getRelatedRemoteDirs())
+        remoteDirs -= OPENSSH.remoteDirs
+        CreateRemoteDir(ssh, sorted(remoteDirs))
+        with LOCKS.createRemoteDir:
+            OPENSSH.remoteDirs.update(remoteDirs)
+
+
+def SetRemoteFilePermissions(ssh, remoteFilePaths):
     """
     Set file permissions via SSH
     """
-    RunOpenSshCommand(
-        WithDefaultOptions(
-            ssh, [
-                "chmod 660 %s" % OpenSSH.DoubleQuoteRemotePath(remoteFilePath)
-            ]))
+    for group in SplitRemoteCommandArgs(
+            [OpenSSH.DoubleQuoteRemotePath(remoteFilePath)
+             for remoteFilePath in remoteFilePaths]):
+        RunOpenSshCommand(
+            WithDefaultOptions(
+                ssh, [
+                    "chmod 660 %s" % " ".join(group)
+                ]))
+
+
+class PermissionsRequest(object):
+    """
+    A request to set an uploaded file's permissions
+    """
+    def __init__(self, remoteFilePath):
+        self.remoteFilePath = remoteFilePath
+        self.done = threading.Event()
+        self.lead = False
+        self.error = None
+
+
+class PermissionsBatcher(object):
+    """
+    Sets the permissions of uploaded files with as few chmod commands as
+    possible.
+
+    The first upload thread to request a chmod runs it immediately.  Files
+    from other upload threads which finish while a chmod is running are
+    queued, and the next thread in the queue runs one chmod for all of
+    them, so concurrent uploads share chmod commands, but no upload waits
+    for more than one chmod command ahead of its own.  Each file's
+    permissions are set before UploadFile returns, so they are set before
+    MyTardis is asked to verify the file.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.pending = dict()
+        self.running = set()
+        self.numFiles = 0
+        self.numCommands = 0
+
+    def SetPermissions(self, ssh, remoteFilePath):
+        """
+        Set an uploaded file's permissions, possibly sharing a chmod
+        command with other upload threads
+        """
+        key = tuple(ssh)
+        request = PermissionsRequest(remoteFilePath)
+        with self.lock:
+            self.pending.setdefault(key, []).append(request)
+            lead = key not in self.running
+            if lead:
+                self.running.add(key)
+        if not lead:
+            request.done.wait()
+            if not request.lead:
+                if request.error:
+                    raise request.error
+                return
+        with self.lock:
+            batch = self.pending.pop(key)
+        numCommands = 1
+        try:
+            try:
+                SetRemoteFilePermissions(
+                    ssh, [queued.remoteFilePath for queued in batch])
+            except SshException as err:
+                batch[0].error = err
+                if len(batch) > 1:
+                    # Find out which files' permissions couldn't be set:
+                    for queued in batch:
+                        queued.error = None
+                        try:
+                            SetRemoteFilePermissions(
+                                ssh, [queued.remoteFilePath])
+                        except SshException as queuedError:
+                            queued.error = queuedError
+                        numCommands += 1
+        except Exception as err:
+            # e.g. a failure of the errand boy transport, which applies to
+            # the whole batch:
+            for queued in batch:
+                queued.error = err
+            raise
+        finally:
+            # The lead must be handed over and the queued requests woken
+            # whatever happened, otherwise they would wait forever:
+            with self.lock:
+                self.numFiles += len(batch)
+                self.numCommands += numCommands
+                if self.pending.get(key):
+                    self.pending[key][0].lead = True
+                    self.pending[key][0].done.set()
+                else:
+                    self.running.discard(key)
+            for queued in batch:
+                if queued is not request:
+                    queued.done.set()
+        if request.error:
+            raise request.error
+
+    def LogCounts(self):
+        """
+        Log the number of chmod commands used, and reset the counts
+        """
+        with self.lock:
+            if self.numFiles:
+                logger.debug(
+                    "Set permissions for %s uploaded file(s) with %s "
+                    "chmod command(s)." % (self.numFiles, self.numCommands))
+            self.numFiles = 0
+            self.numCommands = 0
 
 
 def CleanUpScpAndSshProcesses():
@@ -638,7 +929,11 @@ def CleanUpScpAndSshProcesses():
     check that the absolute path of the SSH executable to be terminated
     matches MyData's SSH path.  On other platforms, we can use proc.cmdline()
     to ensure that the SSH process we're killing uses MyData's private key.
+
+    ControlMaster connections are asked to exit first, so that they can
+    remove their control sockets.
     """
+    StopControlMasters()
     if not SETTINGS.uploaderModel:
         return
     try:
@@ -663,3 +958,5 @@ def CleanUpScpAndSshProcesses():
 
 # Singleton instance of OpenSSH class:
 OPENSSH = OpenSSH()
+
+PERMISSIONS_BATCHER = PermissionsBatcher()
@@ -0,0 +1,208 @@
+"""
+Client-side pacing for uploads using the chunks API.
+
+A PacingController decides how many chunks of a file can be in flight at
+once (the window), and how large each chunk should be.  It measures the
+round-trip time of each chunk upload, and the goodput (acknowledged bytes
+per second) over each epoch of window-many acknowledgements:
+
+- The window doubles while goodput keeps improving (slow start), then
+  grows by one chunk while goodput improves, and shrinks by one chunk
+  when goodput drops, so it settles near the smallest window which
+  saturates the link.
+- Chunks are sized so that each one takes about TARGET_CHUNK_TIME seconds
+  to upload, within the bounds allowed by the server.  Larger chunks
+  amortise the per-request overhead, smaller chunks make retries cheaper.
+- Errors halve the window and the chunk size, and retries are delayed
+  with a jittered exponential back-off, starting from INITIAL_RETRY_DELAY
+  and capped at MAX_RETRY_DELAY.
+
+Each controller logs its window, chunk size and goodput at the end of each
+epoch, and AGGREGATE_THROUGHPUT logs the goodput across all chunked uploads
+every LOG_INTERVAL seconds, so that tuning can be checked in MyData's log.
+"""
+import random
+import threading
+import time
+
+from ..logs import logger
+
+TARGET_CHUNK_TIME = 2.0
+MIN_CHUNK_SIZE = 1024 * 1024
+INITIAL_RETRY_DELAY = 0.25
+MAX_RETRY_DELAY = 5.0
+LOG_INTERVAL = 10.0
+
+# Goodput must change by more than this fraction to count as a change:
+GOODPUT_TOLERANCE = 0.05
+
+
+class AggregateThroughput(object):
+    """
+    Goodput across all chunked uploads
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bytesAcknowledged = 0
+        self.lastLogTime = None
+        self.lastLogBytes = 0
+
+    def Add(self, numBytes):
+        """
+        Record acknowledged bytes, logging the aggregate goodput if it
+        hasn't been logged for LOG_INTERVAL seconds.
+        """
+        now = time.time()
+        with self.lock:
+            if self.lastLogTime is None:
+                self.lastLogTime = now
+            self.bytesAcknowledged += numBytes
+            elapsed = now - self.lastLogTime
+            if elapsed >= LOG_INTERVAL:
+                logger.debug(
+                    "Chunked uploads: %.2f MB/s aggregate, %s bytes "
+                    "acknowledged in total" % (
+                        (self.bytesAcknowledged - self.lastLogBytes) /
+                        elapsed / 1000000.0,
+                        self.bytesAcknowledged))
+                self.lastLogTime = now
+                self.lastLogBytes = self.bytesAcknowledged
+
+
+AGGREGATE_THROUGHPUT = AggregateThroughput()
+
+
+class PacingController(object):
+    """
+    Adapts the window and chunk size for one file's chunked upload.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, name, maxChunkSize, minChunkSize=None, maxWindow=1):
+        """
+        :param name: The name of the file being uploaded, for logging
+        :param maxChunkSize: The largest chunk size allowed by the server,
+                             which is also the initial chunk size
+        :param minChunkSize: The smallest chunk size allowed by the server
+        :param maxWindow: The maximum number of chunks in flight
+        """
+        self.name = name
+        self.maxChunkSize = maxChunkSize
+        if minChunkSize is None:
+            minChunkSize = MIN_CHUNK_SIZE
+        self.minChunkSize = min(minChunkSize, maxChunkSize)
+        self.chunkSize = maxChunkSize
+        self.maxWindow = max(1, maxWindow)
+        self.window = 1
+        self.slowStart = True
+        self.inFlight = 0
+        self.condition = threading.Condition()
+        self.consecutiveErrors = 0
+        self.bestGoodput = 0
+        self.startTime = time.time()
+        self.bytesAcknowledged = 0
+        self.epochStartTime = self.startTime
+        self.epochBytes = 0
+        self.epochAcks = 0
+        self.rtt = None
+
+    def AcquireSlot(self):
+        """
+        Wait until another chunk can be sent within the window
+        """
+        with self.condition:
+            while self.inFlight >= self.window:
+                self.condition.wait()
+            self.inFlight += 1
+
+    def ReleaseSlot(self):
+        """
+        Called when a chunk is no longer in flight
+        """
+        with self.condition:
+            self.inFlight -= 1
+            self.condition.notify_all()
+
+    def OnChunkAcknowledged(self, numBytes, rtt):
+        """
+        Record a chunk's round-trip time, and adapt the window and chunk
+        size at the end of each epoch.
+        """
+        AGGREGATE_THROUGHPUT.Add(numBytes)
+        with self.condition:
+            self.consecutiveErrors = 0
+            self.rtt = rtt if self.rtt is None else 0.8 * self.rtt + 0.2 * rtt
+            self.bytesAcknowledged += numBytes
+            self.epochBytes += numBytes
+            self.epochAcks += 1
+            if self.epochAcks < self.window:
+                return
+            now = time.time()
+            goodput = self.epochBytes / max(now - self.epochStartTime, 1e-6)
+            self.AdaptWindow(goodput)
+            self.AdaptChunkSize(goodput)
+            logger.debug(
+                "Pacing %s: %.2f MB/s, RTT %.3f s, window %s, chunk size %s"
+                % (self.name, goodput / 1000000.0, self.rtt, self.window,
+                   self.chunkSize))
+            self.epochStartTime = now
+            self.epochBytes = 0
+            self.epochAcks = 0
+            self.condition.notify_all()
+
+    def AdaptWindow(self, goodput):
+        """
+        Grow the window while goodput improves, and shrink it when goodput
+        drops.  The caller should hold the condition's lock.
+        """
+        if goodput > self.bestGoodput * (1 + GOODPUT_TOLERANCE):
+            self.bestGoodput = goodput
+            if self.slowStart:
+                self.window = min(self.window * 2, self.maxWindow)
+            else:
+                self.window = min(self.window + 1, self.maxWindow)
+        else:
+            self.slowStart = False
+            if goodput < self.bestGoodput * (1 - GOODPUT_TOLERANCE):
+                self.window = max(self.window - 1, 1)
+                # Allow the goodput at the smaller window to be measured:
+                self.bestGoodput = goodput
+
+    def AdaptChunkSize(self, goodput):
+        """
+        Move the chunk size halfway towards the size which would take
+        TARGET_CHUNK_TIME seconds to upload at the current goodput per
+        chunk in flight.  The caller should hold the condition's lock.
+        """
+        targetChunkSize = int(goodput / self.window * TARGET_CHUNK_TIME)
+        chunkSize = (self.chunkSize + targetChunkSize) // 2
+        self.chunkSize = max(self.minChunkSize,
+                             min(chunkSize, self.maxChunkSize))
+
+    def OnChunkFailed(self):
+        """
+        Halve the window and chunk size, and return the number of seconds
+        to wait before retrying
+        """
+        with self.condition:
+            self.consecutiveErrors += 1
+            self.slowStart = False
+            self.window = max(self.window // 2, 1)
+            self.chunkSize = max(self.chunkSize // 2, self.minChunkSize)
+            self.bestGoodput = 0
+            self.epochStartTime = time.time()
+            self.epochBytes = 0
+            self.epochAcks = 0
+            delay = min(
+                INITIAL_RETRY_DELAY * 2 ** (self.consecutiveErrors - 1),
+                MAX_RETRY_DELAY)
+        return delay * random.uniform(0.5, 1.0)
+
+    def LogSummary(self):
+        """
+        Log the file's average goodput
+        """
+        elapsed = max(time.time() - self.startTime, 1e-6)
+        logger.debug(
+            "Pacing %s: %s bytes acknowledged in %.1f s (%.2f MB/s)"
+            % (self.name, self.bytesAcknowledged, elapsed,
+               self.bytesAcknowledged / elapsed / 1000000.0))
@@ -0,0 +1,105 @@
+"""
+Matching filenames against the glob patterns in an includes or excludes file.
+
+The patterns in each file are compiled once into a single regular
+expression, which is cached until the file is modified.
+
+Lines starting with '#' or ';' are comments, and blank lines are ignored.
+Other lines are expected to be globs, e.g. *.txt
+"""
+import os
+import re
+import threading
+from fnmatch import translate
+
+COMMENT_PREFIXES = ("#", ";")
+
+
+def ReadPatterns(patternsFilePath):
+    """
+    Read the glob patterns from an includes or excludes file.
+
+    :raises UnicodeDecodeError: if the file isn't a UTF-8 text file
+    """
+    patterns = []
+    with open(patternsFilePath, 'r', encoding='utf-8') as patternsFile:
+        for line in patternsFile.readlines():
+            pattern = line.strip()
+            if pattern == "" or pattern.startswith(COMMENT_PREFIXES):
+                continue
+            patterns.append(pattern)
+    return patterns
+
+
+class PatternMatcher(object):
+    """
+    Matches filenames against a list of glob patterns, using one combined
+    regular expression.  Like fnmatch.fnmatch, matching is case-insensitive
+    on case-insensitive platforms (Windows).
+    """
+    def __init__(self, patterns):
+        self.patterns = patterns
+        if patterns:
+            self.regex = re.compile("|".join(
+                "(?:%s)" % translate(os.path.normcase(pattern))
+                for pattern in patterns))
+        else:
+            self.regex = None
+
+    def Matches(self, filename):
+        """
+        Return True if filename matches at least one pattern.
+        """
+        if not self.regex:
+            return False
+        return self.regex.match(os.path.normcase(filename)) is not None
+
+    def Match(self, filenames):
+        """
+        Return the set of filenames (e.g. from one directory listing) which
+        match at least one pattern.
+        """
+        if not self.regex:
+            return set()
+        match = self.regex.match
+        normcase = os.path.normcase
+        return set(
+            filename for filename in filenames if match(normcase(filename)))
+
+
+class PatternMatcherCache(object):
+    """
+    Thread-safe cache of compiled matchers, keyed on the patterns file's
+    path, and invalidated when the file's modified time or size changes.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.matchers = dict()
+
+    def GetMatcher(self, patternsFilePath):
+        """
+        Return a PatternMatcher for an includes or excludes file.
+
+        :raises OSError: if the file can't be read
+        :raises UnicodeDecodeError: if the file isn't a UTF-8 text file
+        """
+        fileInfo = os.stat(patternsFilePath)
+        key = (fileInfo.st_mtime_ns, fileInfo.st_size)
+        with self.lock:
+            cached = self.matchers.get(patternsFilePath)
+            if cached and cached[0] == key:
+                return cached[1]
+        matcher = PatternMatcher(ReadPatterns(patternsFilePath))
+        with self.lock:
+            self.matchers[patternsFilePath] = (key, matcher)
+        return matcher
+
+    def Clear(self):
+        """
+        Discard all cached matchers.
+        """
+        with self.lock:
+            self.matchers.clear()
+
+
+PATTERN_MATCHERS = PatternMatcherCache()
@@ -0,0 +1,130 @@
+"""
+Choosing the transport for each file uploaded when uploads to staging have
+been approved, from the file's size, and recording the throughput of each
+transport, so that the size bands can be tuned from real uploads.
+
+By default, every file is uploaded with the upload method selected in the
+settings (e.g. "ParallelSSH").  Setting post_upload_max_size sends tiny
+files with HTTP POST instead, because setting up an SSH transfer (and
+creating a DataFile record for it) dominates their upload time.  Setting
+chunked_upload_min_size sends very large files with the "Chunked" upload
+method, which uploads up to max_chunk_upload_threads chunks in parallel.
+
+The throughput of each transport is recorded for each size class (from up
+to 64 KB to over 4 GB), and logged when uploads finish.
+"""
+import threading
+
+from ..logs import logger
+from . import HumanReadableSizeString
+
+HTTP_POST = "HTTP POST"
+LOCAL_COPY = "Local copy"
+CHUNKED = "Chunked"
+# Small files sent to staging as tar streams, see tarbatches.py:
+TAR_BATCH = "ParallelSSH (tar batches)"
+
+# The upper bounds of the size classes which throughput is recorded for:
+SIZE_CLASSES = [64 * 1024 * 16 ** i for i in range(5)]
+
+
+def GetSizeClass(fileSize):
+    """
+    Return the index of the size class which fileSize belongs to
+    """
+    for index, maxSize in enumerate(SIZE_CLASSES):
+        if fileSize <= maxSize:
+            return index
+    return len(SIZE_CLASSES)
+
+
+def DescribeSizeClass(index):
+    """
+    Return a description of a size class, e.g. "up to 1.0 MB"
+    """
+    if index < len(SIZE_CLASSES):
+        return "up to %s" % HumanReadableSizeString(SIZE_CLASSES[index])
+    return "over %s" % HumanReadableSizeString(SIZE_CLASSES[-1])
+
+
+class TransportStats(object):
+    """
+    Uploads by one transport of files in one size class
+    """
+    def __init__(self):
+        self.numFiles = 0
+        self.numBytes = 0
+        self.seconds = 0.0
+
+    @property
+    def throughput(self):
+        """
+        Mean throughput per upload in MB/s, or None if no time has been
+        recorded
+        """
+        if self.seconds <= 0:
+            return None
+        return self.numBytes / self.seconds / 1000000.0
+
+
+class UploadRouter(object):
+    """
+    Chooses each file's transport, and records each transport's throughput
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.postMaxSize = 0
+        self.chunkedMinSize = 0
+        self.stats = dict()
+
+    def Configure(self, postMaxSize, chunkedMinSize):
+        """
+        Set the size bands, and forget throughput from previous uploads
+        """
+        with self.lock:
+            self.postMaxSize = postMaxSize
+            self.chunkedMinSize = chunkedMinSize
+            self.stats = dict()
+
+    def ChooseTransport(self, stagingTransport, fileSize, canPost=True):
+        """
+        Return the transport for uploading a file of fileSize bytes to
+        staging, where stagingTransport is the upload method selected in
+        the settings.  canPost should be False if the file's DataFile
+        record has already been created for an upload to staging.
+        """
+        if canPost and self.postMaxSize > 0 and \
+                fileSize <= self.postMaxSize:
+            return HTTP_POST
+        if 0 < self.chunkedMinSize <= fileSize:
+            return CHUNKED
+        return stagingTransport
+
+    def Record(self, transport, fileSize, seconds):
+        """
+        Record a successful upload of fileSize bytes which took seconds
+        """
+        key = (transport, GetSizeClass(fileSize))
+        with self.lock:
+            stats = self.stats.setdefault(key, TransportStats())
+            stats.numFiles += 1
+            stats.numBytes += fileSize
+            stats.seconds += seconds
+
+    def LogStats(self):
+        """
+        Log the throughput of each transport for each size class
+        """
+        with self.lock:
+            items = sorted(self.stats.items())
+        for (transport, sizeClass), stats in items:
+            throughput = stats.throughput
+            logger.info(
+                "%s uploads of files %s: %d files, %s in %.1f seconds, %s" % (
+                    transport, DescribeSizeClass(sizeClass), stats.numFiles,
+                    HumanReadableSizeString(stats.numBytes), stats.seconds,
+                    "%.2f MB/s per upload" % throughput
+                    if throughput is not None else "throughput unknown"))
+
+
+UPLOAD_ROUTER = UploadRouter()
@@ -0,0 +1,180 @@
+"""
+Persistent index of dataset folder listings, used to avoid re-listing
+directories which haven't changed since the last scan.
+
+For each directory scanned, the index records the directory's modified time,
+inode and device numbers, its subdirectory names and its filenames (with
+each file's FileStat, if the file has been stat'ed).  Adding, removing or
+renaming a directory entry updates the directory's modified time, so a
+directory whose metadata is unchanged can be rebuilt from the index with a
+single stat call.
+
+Modifying a file in place doesn't update its directory's modified time, so
+sizes and timestamps served from the index can be stale.  Uploads refresh
+each file's stat before uploading (FolderModel.RefreshDataFileStat), and a
+full rescan is performed periodically (and can be forced with the
+--full-rescan command-line option) for safety.
+
+The index is saved as JSON, next to MyData.cfg.
+"""
+import json
+import os
+import threading
+import time
+import traceback
+
+from ..logs import logger
+from .scanner import FileStat
+
+SCAN_INDEX_VERSION = 1
+
+# A directory modified within this many seconds of being listed could be
+# modified again without its modified time changing (depending on the
+# filesystem's timestamp resolution), so its listing won't be reused:
+RACY_INTERVAL = 2.0
+
+
+class ScanIndex(object):
+    """
+    Persistent index of dataset folder listings.
+
+    Begin is called at the beginning of a folder scan, and End at the end.
+    Only the directories visited during the scan are saved, so directories
+    which have been deleted (or are no longer being scanned) are pruned.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.path = None
+        self.active = False
+        self.fullRescan = False
+        self.scanStartTime = None
+        self.lastFullRescan = None
+        self.previous = dict()
+        self.directories = dict()
+        self.numReused = 0
+        self.numListed = 0
+
+    def Begin(self, path, fullRescanInterval, forceFullRescan=False):
+        """
+        Load the index from disk, and determine whether a full rescan is due.
+
+        :param path: The location of the index on disk
+        :param fullRescanInterval: The interval in hours between full
+                                   rescans, or 0 for no periodic rescans
+        :param forceFullRescan: Re-list all directories in this scan
+        """
+        with self.lock:
+            self.path = path
+            self.scanStartTime = time.time()
+            self.previous = dict()
+            self.directories = dict()
+            self.lastFullRescan = None
+            self.numReused = 0
+            self.numListed = 0
+            if os.path.exists(path):
+                try:
+                    with open(path, "r") as indexFile:
+                        indexJson = json.load(indexFile)
+                    if indexJson.get('version') == SCAN_INDEX_VERSION:
+                        self.previous = indexJson['directories']
+                        self.lastFullRescan = indexJson['last_full_rescan']
+                except:
+                    logger.warning("Couldn't load scan index from %s" % path)
+                    logger.warning(traceback.format_exc())
+            self.fullRescan = forceFullRescan or \
+                self.lastFullRescan is None or \
+                (fullRescanInterval > 0 and
+                 self.scanStartTime - self.lastFullRescan >
+                 fullRescanInterval * 3600)
+            if self.fullRescan:
+                logger.info("Scan index: performing a full rescan.")
+                self.previous = dict()
+            self.active = True
+
+    def GetListing(self, dirPath):
+        """
+        Return (fileStats, subdirs, dirStat) for a directory.
+
+        If the directory is unchanged since the last scan, fileStats is a
+        dictionary mapping each filename to its FileStat (or None if it
+        hasn't been stat'ed), and subdirs is a list of subdirectory names.
+        Otherwise fileStats and subdirs are None, and the directory should
+        be listed and then recorded with SetListing.
+
+        dirStat is None if the directory can't be accessed.
+        """
+        try:
+            dirStat = os.stat(dirPath)
+        except OSError:
+            return None, None, None
+        with self.lock:
+            entry = self.previous.get(dirPath)
+            if not entry or entry['mtime_ns'] != dirStat.st_mtime_ns or \
+                    entry['inode'] != dirStat.st_ino or \
+                    entry['device'] != dirStat.st_dev or \
+                    entry['mtime_ns'] / 1e9 >= entry['listed'] - RACY_INTERVAL:
+                return None, None, dirStat
+            fileStats = dict()
+            for filename, values in entry['files'].items():
+                fileStats[filename] = FileStat(*values) if values else None
+            self.directories[dirPath] = (entry, fileStats)
+            self.numReused += 1
+            return fileStats, entry['subdirs'], dirStat
+
+    def SetListing(self, dirPath, dirStat, fileStats, subdirs, listed):
+        """
+        Record a directory's listing.  The fileStats dictionary can continue
+        to be updated (e.g. as files are stat'ed) until the index is saved.
+
+        dirStat should be the directory's stat result from before it was
+        listed, and listed should be the time just after it was listed.
+        """
+        entry = dict(
+            mtime_ns=dirStat.st_mtime_ns,
+            inode=dirStat.st_ino,
+            device=dirStat.st_dev,
+            listed=listed,
+            subdirs=subdirs)
+        with self.lock:
+            self.directories[dirPath] = (entry, fileStats)
+            self.numListed += 1
+
+    def End(self, save=True):
+        """
+        Save the index to disk (unless the scan was incomplete).
+        """
+        with self.lock:
+            if not self.active:
+                return
+            self.active = False
+            logger.info(
+                "Scan index: reused %s directory listing(s), listed %s "
+                "directory(ies)." % (self.numReused, self.numListed))
+            if not save:
+                return
+            directories = dict()
+            for dirPath, (entry, fileStats) in self.directories.items():
+                entry = dict(entry)
+                entry['files'] = dict(
+                    (filename, list(fileStat) if fileStat else None)
+                    for filename, fileStat in fileStats.items())
+                directories[dirPath] = entry
+            if self.fullRescan:
+                self.lastFullRescan = self.scanStartTime
+            indexJson = dict(
+                version=SCAN_INDEX_VERSION,
+                last_full_rescan=self.lastFullRescan,
+                directories=directories)
+            self.previous = dict()
+            self.directories = dict()
+            try:
+                tempPath = self.path + ".tmp"
+                with open(tempPath, "w") as indexFile:
+                    json.dump(indexJson, indexFile)
+                os.replace(tempPath, self.path)
+            except:
+                logger.warning("Couldn't save scan index to %s" % self.path)
+                logger.warning(traceback.format_exc())
+
+
+SCAN_INDEX = ScanIndex()
@@ -0,0 +1,151 @@
+"""
+Single-pass folder scanning with os.scandir.
+
+os.walk followed by an os.stat call per file (and further os.stat calls
+each time a file's size or timestamps are needed) means several network
+round trips per file on SMB/NFS-mounted instrument shares.  os.scandir
+can often provide file types (and on Windows, stat results) from the
+directory listing itself, so ScanFolder records each file's size,
+timestamps and inode once during the walk.
+"""
+import os
+import time
+from collections import namedtuple
+
+from ..logs import logger
+
+
+class FileStat(namedtuple(
+        'FileStat', 'size mtime mtimeNs ctime inode device')):
+    """
+    The subset of a file's stat result which MyData uses.
+
+    On Windows, DirEntry.stat() doesn't provide inode and device numbers,
+    so they will be 0 for files scanned by ScanFolder.
+    """
+    __slots__ = ()
+
+    @staticmethod
+    def FromStatResult(statResult):
+        """
+        Create a FileStat from an os.stat_result
+        """
+        return FileStat(
+            size=statResult.st_size,
+            mtime=statResult.st_mtime,
+            mtimeNs=statResult.st_mtime_ns,
+            ctime=statResult.st_ctime,
+            inode=statResult.st_ino,
+            device=statResult.st_dev)
+
+
+def StatFile(path):
+    """
+    Return a FileStat for path, or None if it can't be accessed, e.g. because
+    it has been moved, renamed or deleted.
+    """
+    try:
+        return FileStat.FromStatResult(os.stat(path))
+    except OSError:
+        return None
+
+
+def ListFolder(folderPath, scanIndex=None):
+    """
+    List folderPath, returning (entries, fileStats, subdirs), or None if it
+    can't be listed.
+
+    entries maps filenames to os.DirEntry objects, and fileStats maps
+    filenames to FileStats, or to None for files which haven't been stat'ed
+    yet.  subdirs is a sorted list of subdirectory names, excluding symbolic
+    links.  If scanIndex (a ScanIndex) is specified and folderPath hasn't
+    changed since it was last listed, the listing is rebuilt from the index
+    and entries is empty.
+    """
+    entries = dict()
+    fileStats = subdirs = dirStat = None
+    if scanIndex:
+        fileStats, subdirs, dirStat = scanIndex.GetListing(folderPath)
+    if fileStats is not None:
+        return entries, fileStats, subdirs
+    try:
+        with os.scandir(folderPath) as iterator:
+            dirEntries = list(iterator)
+    except OSError as err:
+        logger.warning("Couldn't scan %s: %s" % (folderPath, err))
+        return None
+    listed = time.time()
+    subdirs = []
+    for entry in dirEntries:
+        try:
+            if entry.is_dir():
+                if not entry.is_symlink():
+                    subdirs.append(entry.name)
+                continue
+        except OSError as err:
+            logger.warning("Couldn't scan %s: %s" % (entry.path, err))
+            continue
+        entries[entry.name] = entry
+    subdirs.sort()
+    fileStats = dict.fromkeys(entries)
+    if scanIndex and dirStat:
+        scanIndex.SetListing(folderPath, dirStat, fileStats, subdirs, listed)
+    return entries, fileStats, subdirs
+
+
+def StatListedFile(folderPath, filename, entries):
+    """
+    Return a FileStat for a file listed by ListFolder, or None if it can't
+    be stat'ed
+    """
+    try:
+        if filename in entries:
+            statResult = entries[filename].stat()
+        else:
+            statResult = os.stat(os.path.join(folderPath, filename))
+        return FileStat.FromStatResult(statResult)
+    except OSError as err:
+        logger.warning(
+            "Couldn't stat %s: %s" % (os.path.join(folderPath, filename), err))
+        return None
+
+
+def ScanFolder(folderPath, recursive=True, filenamesFilter=None,
+               scanIndex=None):
+    """
+    Walk folderPath, yielding (dirPath, filename, fileStat) tuples.
+
+    Files are yielded in sorted order within each directory, and each
+    directory's files are yielded before its subdirectories are scanned,
+    like os.walk (top-down).  As with os.walk, symbolic links to files are
+    followed, but symbolic links to directories are not, and unreadable
+    directories are skipped.
+
+    If filenamesFilter is specified, it is called once per directory with
+    the list of filenames in that directory, and should return the
+    filenames to keep.  Files which are filtered out are not stat'ed.
+
+    If scanIndex (a ScanIndex) is specified, directories which haven't
+    changed since they were last scanned are rebuilt from the index instead
+    of being listed again.
+    """
+    listing = ListFolder(folderPath, scanIndex)
+    if listing is None:
+        return
+    entries, fileStats, subdirs = listing
+    filenames = sorted(fileStats.keys())
+    if filenamesFilter and filenames:
+        filenames = filenamesFilter(filenames)
+    for filename in filenames:
+        fileStat = fileStats[filename]
+        if fileStat is None:
+            fileStat = StatListedFile(folderPath, filename, entries)
+            if fileStat is None:
+                continue
+            fileStats[filename] = fileStat
+        yield folderPath, filename, fileStat
+    if recursive:
+        for subdir in subdirs:
+            for scanned in ScanFolder(os.path.join(folderPath, subdir), True,
+                                      filenamesFilter, scanIndex):
+                yield scanned
@@ -0,0 +1,275 @@
+"""
+Shared HTTP session for MyTardis API requests.
+
+Using the module-level requests.get, requests.post etc. means that
+every request opens a new TCP (and TLS) connection.  SESSION keeps a
+pool of keep-alive connections which can be shared by all of MyData's
+verification and upload worker threads.
+
+Usage:
+
+    from ..utils.session import SESSION
+    response = SESSION.Get(url)
+    response = SESSION.Post(url, data=data)
+
+HTTP POST uploads use SESSION.PostUpload instead, which sends each upload
+worker thread's requests via the thread's own session, so concurrent
+uploads don't share any session state.
+"""
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.connectionpool import HTTPConnectionPool
+from urllib3.connectionpool import HTTPSConnectionPool
+
+from ..logs import logger
+
+
+class ConnectionCounts(object):
+    """
+    Thread-safe counts of the requests sent and the connections opened,
+    so we can report how many requests reused a pooled connection.
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.numRequests = 0
+        self.numNewConnections = 0
+
+    def Reset(self):
+        """
+        Reset counts, e.g. at the beginning of a scan-and-upload task.
+        """
+        with self.lock:
+            self.numRequests = 0
+            self.numNewConnections = 0
+
+    def IncrementRequests(self):
+        """
+        Count a request sent via the shared session.
+        """
+        with self.lock:
+            self.numRequests += 1
+
+    def IncrementNewConnections(self):
+        """
+        Count a new connection opened by one of the connection pools.
+        """
+        with self.lock:
+            self.numNewConnections += 1
+
+    @property
+    def numReusedConnections(self):
+        """
+        The number of requests which didn't need to open a new connection.
+        """
+        return max(0, self.numRequests - self.numNewConnections)
+
+
+COUNTS = ConnectionCounts()
+
+
+class CountingHTTPConnectionPool(HTTPConnectionPool):
+    """
+    HTTP connection pool which counts the new connections it opens.
+    """
+    def _new_conn(self):
+        COUNTS.IncrementNewConnections()
+        return super(CountingHTTPConnectionPool, self)._new_conn()
+
+
+class CountingHTTPSConnectionPool(HTTPSConnectionPool):
+    """
+    HTTPS connection pool which counts the new connections it opens.
+    """
+    def _new_conn(self):
+        COUNTS.IncrementNewConnections()
+        return super(CountingHTTPSConnectionPool, self)._new_conn()
+
+
+class CountingHTTPAdapter(HTTPAdapter):
+    """
+    Transport adapter whose connection pools count new connections.
+    """
+    def init_poolmanager(self, *args, **kwargs):
+        # pylint: disable=arguments-differ
+        super(CountingHTTPAdapter, self).init_poolmanager(*args, **kwargs)
+        self.poolmanager.pool_classes_by_scheme = dict(
+            http=CountingHTTPConnectionPool,
+            https=CountingHTTPSConnectionPool)
+
+    def send(self, request, **kwargs):
+        # pylint: disable=arguments-differ
+        COUNTS.IncrementRequests()
+        return super(CountingHTTPAdapter, self).send(request, **kwargs)
+
+
+class ApiSession(object):
+    """
+    A requests.Session shared by all threads, with its connection pool
+    sized for MyData's verification and upload worker threads, default
+    headers providing authorization for the MyTardis API, and a default
+    timeout.
+
+    Headers and timeouts can still be overridden for individual requests,
+    e.g. SESSION.Post(url, data=data, headers={"Content-Type": ...})
+    """
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.session = None
+        self.poolSize = None
+        self.credentials = None
+        self.local = threading.local()
+        self.threadSessions = []
+
+    def Configure(self):
+        """
+        Create the session if necessary, and resize its connection pool if
+        the number of worker threads has changed.  This is called at the
+        beginning of each scan-and-upload task, but can be called at any
+        time, because requests in progress keep using their existing pool.
+        """
+        from ..settings import SETTINGS
+        poolSize = SETTINGS.miscellaneous.maxVerificationThreads + \
+            SETTINGS.advanced.maxUploadThreads
+        with self.lock:
+            if self.session is None:
+                self.session = requests.Session()
+            if poolSize != self.poolSize:
+                adapter = CountingHTTPAdapter(
+                    pool_connections=poolSize, pool_maxsize=poolSize)
+                self.session.mount("http://", adapter)
+                self.session.mount("https://", adapter)
+                self.poolSize = poolSize
+                logger.debug("HTTP connection pool size: %s" % poolSize)
+            return self.session
+
+    def GetSession(self):
+        """
+        Return the shared requests.Session, with up-to-date default headers.
+        """
+        from ..settings import SETTINGS
+        session = self.session or self.Configure()
+        credentials = (SETTINGS.general.username, SETTINGS.general.apiKey)
+        if credentials != self.credentials:
+            with self.lock:
+                session.headers.update(SETTINGS.defaultHeaders)
+                self.credentials = credentials
+        return session
+
+    def GetThreadSession(self):
+        """
+        Return the current thread's own requests.Session, with up-to-date
+        default headers, creating it if necessary.
+        """
+        from ..settings import SETTINGS
+        session = getattr(self.local, 'session', None)
+        if session is None:
+            session = requests.Session()
+            adapter = CountingHTTPAdapter(pool_connections=1, pool_maxsize=1)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self.local.session = session
+            self.local.credentials = None
+            with self.lock:
+                self.threadSessions.append(session)
+        credentials = (SETTINGS.general.username, SETTINGS.general.apiKey)
+        if credentials != self.local.credentials:
+            session.headers.update(SETTINGS.defaultHeaders)
+            self.local.credentials = credentials
+        return session
+
+    def CloseThreadSessions(self):
+        """
+        Close the sessions created by GetThreadSession, e.g. once the
+        upload worker threads have finished.  Threads which send requests
+        after this will get new sessions.
+        """
+        with self.lock:
+            threadSessions = self.threadSessions
+            self.threadSessions = []
+            self.local = threading.local()
+        for session in threadSessions:
+            session.close()
+
+    def Request(self, method, url, **kwargs):
+        """
+        Send a request using the shared session.
+
+        If no timeout is specified, only the connection attempt is subject
+        to the connection_timeout setting.  Responses can take a while,
+        e.g. for listing pages of up to 1000 records or creating DataFile
+        records in bulk, so they are not subject to a read timeout.
+        """
+        from ..settings import SETTINGS
+        if 'timeout' not in kwargs:
+            kwargs['timeout'] = (
+                SETTINGS.miscellaneous.connectionTimeout, None)
+        return self.GetSession().request(method, url, **kwargs)
+
+    def Get(self, url, **kwargs):
+        """
+        Send a GET request using the shared session.
+        """
+        return self.Request("GET", url, **kwargs)
+
+    def Post(self, url, **kwargs):
+        """
+        Send a POST request using the shared session.
+        """
+        return self.Request("POST", url, **kwargs)
+
+    def Put(self, url, **kwargs):
+        """
+        Send a PUT request using the shared session.
+        """
+        return self.Request("PUT", url, **kwargs)
+
+    def Patch(self, url, **kwargs):
+        """
+        Send a PATCH request using the shared session.
+        """
+        return self.Request("PATCH", url, **kwargs)
+
+    def PostUpload(self, url, **kwargs):
+        """
+        Send a POST request which uploads file content, using the current
+        thread's own session.
+
+        If no timeout is specified, GetUploadTimeout() is used.
+        """
+        if 'timeout' not in kwargs:
+            kwargs['timeout'] = self.GetUploadTimeout()
+        return self.GetThreadSession().post(url, **kwargs)
+
+    @staticmethod
+    def GetUploadTimeout():
+        """
+        Timeout for requests which upload file content.  The server may
+        take a while to respond after receiving a large upload, so only
+        the connection attempt is subject to the connection_timeout setting.
+        """
+        from ..settings import SETTINGS
+        return (SETTINGS.miscellaneous.connectionTimeout, None)
+
+    @staticmethod
+    def ResetConnectionCounts():
+        """
+        Reset connection counts, e.g. at the beginning of a
+        scan-and-upload task.
+        """
+        COUNTS.Reset()
+
+    @staticmethod
+    def LogConnectionCounts():
+        """
+        Log how many requests reused a pooled connection.
+        """
+        logger.info(
+            "MyTardis API requests: %s, new connections: %s, "
+            "reused connections: %s"
+            % (COUNTS.numRequests, COUNTS.numNewConnections,
+               COUNTS.numReusedConnections))
+
+
+SESSION = ApiSession()
@@ -0,0 +1,182 @@
+"""
+Pool of authenticated libssh2 sessions, used by the "ParallelSSH" upload
+method.
+
+Opening a session requires a TCP connection, an SSH handshake and public
+key authentication, which can take much longer than uploading a small
+file.  Sessions are returned to the pool after each upload, keyed by
+(host, port, username, private key path), so each upload worker reuses
+the same session (and its SFTP channel) for file after file.
+
+A pooled session which has been idle for longer than idleTimeout seconds,
+or which fails a keepalive health check, is closed rather than reused.  An
+upload which fails on a reused session (e.g. because the server dropped an
+idle connection) is retried once on a new session.
+"""
+import socket
+import threading
+import time
+
+from ssh2 import session
+
+from ..logs import logger
+
+# Interval for SSH keepalive messages, which are also used to check
+# the health of idle sessions before reusing them:
+KEEPALIVE_INTERVAL = 30
+
+
+class PooledSession(object):
+    """
+    An authenticated SSH session, with its socket and SFTP channel
+    """
+    def __init__(self, key, sock, sshSession):
+        self.key = key
+        self.sock = sock
+        self.session = sshSession
+        self.sftp = None
+        self.numUses = 0
+        self.lastUsed = time.time()
+
+    def GetSftp(self):
+        """
+        Return the session's SFTP channel, opening it if necessary
+        """
+        if self.sftp is None:
+            self.sftp = self.session.sftp_init()
+        return self.sftp
+
+    def IsHealthy(self):
+        """
+        Send a keepalive message to check that the connection is still up
+        """
+        try:
+            self.session.keepalive_send()
+            return True
+        except Exception:
+            return False
+
+    def Close(self):
+        """
+        Disconnect the session and close its socket
+        """
+        self.sftp = None
+        try:
+            self.session.disconnect()
+        except Exception:
+            pass
+        finally:
+            self.sock.close()
+
+
+def Connect(host, port, username, privateKeyFilePath):
+    """
+    Open a connection and return an authenticated PooledSession
+    """
+    # libssh2 requires a blocking socket, so the timeout only
+    # applies to the connection attempt:
+    sock = socket.create_connection((host, port), timeout=30)
+    sock.settimeout(None)
+    try:
+        sshSession = session.Session()
+        sshSession.handshake(sock)
+        try:
+            sshSession.userauth_publickey_fromfile(
+                username, privateKeyFilePath)
+        except Exception:
+            raise Exception("Can't open SSH key file.")
+        sshSession.keepalive_config(False, KEEPALIVE_INTERVAL)
+    except Exception:
+        sock.close()
+        raise
+    return PooledSession(
+        (host, port, username, privateKeyFilePath), sock, sshSession)
+
+
+class SshSessionPool(object):
+    """
+    Pool of authenticated SSH sessions.
+
+    Acquire returns an idle session (or a new one), which is only used by
+    the calling thread until it is returned with Release.
+    """
+    def __init__(self, connect=Connect):
+        self.connect = connect
+        self.lock = threading.Lock()
+        self.idleTimeout = 60.0
+        self.idle = dict()
+        self.remoteDirs = dict()
+        self.numConnects = 0
+        self.numReuses = 0
+
+    def Acquire(self, host, port, username, privateKeyFilePath, new=False):
+        """
+        Return a healthy session for (host, port, username, privateKey).
+        If new is True, a new session is connected instead of reusing an
+        idle one, e.g. to retry an upload which failed on a reused session.
+        """
+        key = (host, int(port), username, privateKeyFilePath)
+        while not new:
+            with self.lock:
+                sessions = self.idle.get(key)
+                pooled = sessions.pop() if sessions else None
+            if pooled is None:
+                break
+            if time.time() - pooled.lastUsed > self.idleTimeout:
+                logger.debug("Closing idle SSH session for %s@%s:%s"
+                             % (username, host, port))
+                pooled.Close()
+            elif not pooled.IsHealthy():
+                logger.debug("Closing unhealthy SSH session for %s@%s:%s"
+                             % (username, host, port))
+                pooled.Close()
+            else:
+                with self.lock:
+                    self.numReuses += 1
+                pooled.numUses += 1
+                return pooled
+        pooled = self.connect(*key)
+        with self.lock:
+            self.numConnects += 1
+        pooled.numUses += 1
+        return pooled
+
+    def Release(self, pooled, healthy=True):
+        """
+        Return a session to the pool, or close it if it isn't healthy
+        """
+        if not healthy:
+            pooled.Close()
+            return
+        pooled.lastUsed = time.time()
+        with self.lock:
+            self.idle.setdefault(pooled.key, []).append(pooled)
+
+    def GetRemoteDirs(self, pooled):
+        """
+        Return the set of remote directories known to exist on the
+        session's server, so they don't need to be created again
+        """
+        with self.lock:
+            return self.remoteDirs.setdefault(pooled.key[:3], set())
+
+    def CloseAll(self):
+        """
+        Close all idle sessions, e.g. when uploads have finished
+        """
+        with self.lock:
+            idle = self.idle
+            self.idle = dict()
+            self.remoteDirs = dict()
+            if self.numConnects:
+                logger.debug(
+                    "SSH session pool: %s new session(s), %s reused "
+                    "session(s)." % (self.numConnects, self.numReuses))
+            self.numConnects = 0
+            self.numReuses = 0
+        for sessions in idle.values():
+            for pooled in sessions:
+                pooled.Close()
+
+
+SSH_SESSION_POOL = SshSessionPool()
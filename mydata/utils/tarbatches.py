@@ -0,0 +1,340 @@
+"""
+Batching of small files for the "ParallelSSH" upload method.
+
+Uploading a small file over SFTP costs several round trips (open, fsetstat,
+write and close), which can take much longer than sending its content.
+When small-file batching is enabled, files no larger than the threshold are
+grouped by remote dataset directory, and each group is streamed as one tar
+archive into "tar -x" on the staging host, over an exec channel on a pooled
+SSH session.  The archive's members carry the staging permissions, so no
+chmod is needed.
+
+A batch is sent once it holds maxBatchBytes, or once no files have been
+added to it for BATCH_LINGER seconds.  Each file's callback is called once
+its batch has been sent (or has failed), so each file is still completed
+and verified individually.
+"""
+from collections import OrderedDict
+from datetime import datetime
+import os
+import posixpath
+import tarfile
+import threading
+import time
+import traceback
+
+from ..logs import logger
+from .openssh import OpenSSH
+from .sshsessions import SSH_SESSION_POOL
+from .upload import REMOTE_DIR_MODE
+from .upload import REMOTE_FILE_MODE
+from .upload import SFTP_BUFFER_SIZE
+
+BATCH_LINGER = 1.0
+
+
+class BatchedFile(object):
+    """
+    A small file waiting to be sent in a batch.
+
+    If md5 (a hashlib object) is specified, a copy of it is updated with
+    the file's content as it is sent, and the resulting MD5 sum is stored
+    in md5sum.  The callback is called with None once the batch has been
+    sent, or with the exception which prevented it from being sent.
+    """
+    def __init__(self, filePath, remoteFilePath, uploadModel,
+                 progressCallback, callback, md5=None):
+        # pylint: disable=too-many-arguments
+        self.filePath = filePath
+        self.remoteFilePath = remoteFilePath
+        self.uploadModel = uploadModel
+        self.progressCallback = progressCallback
+        self.callback = callback
+        self.md5 = md5
+        self.md5sum = None
+        self.size = os.path.getsize(filePath)
+
+
+class SmallFileBatch(object):
+    """
+    Small files to be extracted into the same remote directory
+    """
+    def __init__(self, key, files=None):
+        self.key = key
+        self.files = files or []
+        self.numBytes = sum(batchedFile.size for batchedFile in self.files)
+        self.lastAdded = time.time()
+
+
+class HashingReader(object):
+    """
+    File-like object which updates an MD5 sum with the data read from it
+    """
+    def __init__(self, fileObject, md5):
+        self.fileObject = fileObject
+        self.md5 = md5
+
+    def read(self, size=-1):  # pylint: disable=invalid-name
+        """
+        Read data, updating the MD5 sum
+        """
+        data = self.fileObject.read(size)
+        if self.md5 is not None:
+            self.md5.update(data)
+        return data
+
+
+class ChannelWriter(object):
+    """
+    File-like object which writes to an SSH channel's standard input
+    """
+    def __init__(self, channel):
+        self.channel = channel
+
+    def write(self, data):  # pylint: disable=invalid-name
+        """
+        Write all of the data to the channel
+        """
+        # ssh2-python's Channel.write only accepts bytes, so the unwritten
+        # data is only copied after a partial write, which is rare in
+        # blocking mode:
+        data = bytes(data)
+        offset = 0
+        while offset < len(data):
+            _, bytesWritten = self.channel.write(
+                data[offset:] if offset else data)
+            offset += bytesWritten
+
+
+def ReadChannel(read):
+    """
+    Read the output of an SSH channel until the end of the stream
+    """
+    output = []
+    while True:
+        size, data = read()
+        if size <= 0:
+            break
+        output.append(data)
+    return b"".join(output).decode("utf-8", "replace")
+
+
+def GetMemberDirs(memberNames):
+    """
+    Return the sorted directories which tar members need to be created in,
+    including their parent directories
+    """
+    memberDirs = set()
+    for memberName in memberNames:
+        memberDir = posixpath.dirname(memberName)
+        while memberDir:
+            memberDirs.add(memberDir)
+            memberDir = posixpath.dirname(memberDir)
+    return sorted(memberDirs)
+
+
+def AddFileMember(tar, memberName, batchedFile):
+    """
+    Add a batched file to a tar stream, calculating its MD5 sum if required
+    """
+    md5 = batchedFile.md5.copy() if batchedFile.md5 is not None else None
+    with open(batchedFile.filePath, "rb") as fileObject:
+        tarInfo = tarfile.TarInfo(memberName)
+        tarInfo.size = os.fstat(fileObject.fileno()).st_size
+        tarInfo.mode = REMOTE_FILE_MODE
+        tarInfo.mtime = time.time()
+        tar.addfile(tarInfo, HashingReader(fileObject, md5))
+    if md5 is not None:
+        batchedFile.md5sum = md5.hexdigest()
+
+
+def SendTarStream(pooled, remoteDir, files):
+    """
+    Stream files into "tar -x" in remoteDir on the staging host
+    """
+    sshSession = pooled.session
+    channel = sshSession.open_session()
+    quotedDir = OpenSSH.DoubleQuoteRemotePath(remoteDir)
+    channel.execute("mkdir -m 2770 -p %s && cd %s && tar -x -m -p -f -"
+                    % (quotedDir, quotedDir))
+    memberNames = [posixpath.relpath(batchedFile.remoteFilePath, remoteDir)
+                   for batchedFile in files]
+    try:
+        with tarfile.open(fileobj=ChannelWriter(channel), mode="w|",
+                          bufsize=SFTP_BUFFER_SIZE) as tar:
+            for memberDir in GetMemberDirs(memberNames):
+                tarInfo = tarfile.TarInfo(memberDir)
+                tarInfo.type = tarfile.DIRTYPE
+                tarInfo.mode = REMOTE_DIR_MODE
+                tarInfo.mtime = time.time()
+                tar.addfile(tarInfo)
+            for memberName, batchedFile in zip(memberNames, files):
+                AddFileMember(tar, memberName, batchedFile)
+        channel.send_eof()
+        ReadChannel(channel.read)
+        errors = ReadChannel(channel.read_stderr)
+        channel.wait_eof()
+    finally:
+        channel.close()
+        channel.wait_closed()
+    exitStatus = channel.get_exit_status()
+    if exitStatus != 0:
+        raise Exception(
+            "Extracting %s file(s) into %s failed with exit status %s. %s"
+            % (len(files), remoteDir, exitStatus, errors))
+
+
+def SendBatch(batch):
+    """
+    Send a batch of small files over a pooled SSH session.  If sending
+    fails on a reused session, it is retried once on a new session.
+    """
+    host, port, username, privateKeyFilePath, remoteDir = batch.key
+    new = False
+    while True:
+        pooled = SSH_SESSION_POOL.Acquire(
+            host, port, username, privateKeyFilePath, new=new)
+        try:
+            SendTarStream(pooled, remoteDir, batch.files)
+        except Exception as err:
+            SSH_SESSION_POOL.Release(pooled, healthy=False)
+            if pooled.numUses > 1:
+                logger.warning(
+                    "Sending a batch of small files failed on a reused SSH "
+                    "session, retrying on a new session: %s" % str(err))
+                new = True
+                continue
+            raise
+        SSH_SESSION_POOL.Release(pooled)
+        break
+
+
+class SmallFileBatcher(object):
+    """
+    Groups small files into batches, which are sent by a background thread
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, send=SendBatch):
+        self.send = send
+        self.threshold = 0
+        self.maxBatchBytes = 64 * 1024 * 1024
+        self.condition = threading.Condition()
+        self.batches = OrderedDict()
+        self.ready = []
+        self.thread = None
+        self.stopping = False
+        self.numFiles = 0
+        self.numBatches = 0
+
+    def Configure(self, threshold, maxBatchBytes):
+        """
+        Set the largest file size which can be batched (0 disables
+        batching), and the maximum number of bytes in each batch
+        """
+        self.threshold = threshold
+        self.maxBatchBytes = maxBatchBytes
+
+    def CanBatch(self, fileSize):
+        """
+        Returns True if a file of this size should be batched
+        """
+        return 0 < self.threshold and fileSize <= self.threshold
+
+    def Add(self, server, auth, remoteDir, batchedFile):
+        """
+        Add a file to the batch for its remote directory, which is a
+        parent directory of batchedFile.remoteFilePath
+        """
+        key = (server[0], int(server[1]), auth[0], auth[1], remoteDir)
+        with self.condition:
+            batch = self.batches.get(key)
+            if batch is None:
+                batch = SmallFileBatch(key)
+                self.batches[key] = batch
+            batch.files.append(batchedFile)
+            batch.numBytes += batchedFile.size
+            batch.lastAdded = time.time()
+            if batch.numBytes >= self.maxBatchBytes:
+                self.ready.append(self.batches.pop(key))
+            if self.thread is None:
+                self.stopping = False
+                self.thread = threading.Thread(
+                    name="SmallFileBatchThread", target=self.Run)
+                self.thread.start()
+            self.condition.notify()
+
+    def GetNextBatch(self):
+        """
+        Wait for a batch which is full, or which hasn't had any files added
+        for BATCH_LINGER seconds.  Returns None once stopped.
+        """
+        with self.condition:
+            while True:
+                if not self.ready:
+                    now = time.time()
+                    for key, batch in list(self.batches.items()):
+                        if self.stopping or \
+                                now - batch.lastAdded >= BATCH_LINGER:
+                            self.ready.append(self.batches.pop(key))
+                if self.ready:
+                    return self.ready.pop(0)
+                if self.stopping:
+                    self.thread = None
+                    return None
+                self.condition.wait(BATCH_LINGER)
+
+    def Run(self):
+        """
+        Send batches until stopped
+        """
+        while True:
+            batch = self.GetNextBatch()
+            if batch is None:
+                return
+            files = [batchedFile for batchedFile in batch.files
+                     if not batchedFile.uploadModel.canceled]
+            error = None
+            if files:
+                try:
+                    self.send(SmallFileBatch(batch.key, files))
+                    with self.condition:
+                        self.numFiles += len(files)
+                        self.numBatches += 1
+                except Exception as err:
+                    logger.error(
+                        "Failed to send a batch of %s small file(s): %s"
+                        % (len(files), str(err)))
+                    error = err
+            for batchedFile in files:
+                if error is None:
+                    batchedFile.uploadModel.SetLatestTime(datetime.now())
+                    batchedFile.progressCallback(
+                        current=batchedFile.size, total=batchedFile.size)
+            # Canceled files' callbacks are called too, so that their
+            # uploads can be finalized:
+            for batchedFile in batch.files:
+                try:
+                    batchedFile.callback(error)
+                except Exception:
+                    logger.error(traceback.format_exc())
+
+    def Stop(self):
+        """
+        Send any remaining batches, and wait for them to be sent
+        """
+        with self.condition:
+            thread = self.thread
+            self.stopping = True
+            self.condition.notify()
+        if thread:
+            thread.join()
+        with self.condition:
+            if self.numBatches:
+                logger.debug(
+                    "Sent %s small file(s) in %s batch(es)."
+                    % (self.numFiles, self.numBatches))
+            self.numFiles = 0
+            self.numBatches = 0
+
+
+SMALL_FILE_BATCHER = SmallFileBatcher()
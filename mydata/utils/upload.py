@@ -1,20 +1,29 @@
 """
 Upload data using ParallelSSH library
 """
-import math
 import os
-import socket
+import posixpath
+import select
+import threading
+from collections import deque
 from datetime import datetime
-from time import sleep
+from time import sleep, time
 import hashlib
 import json
-import requests
+from queue import Empty, Queue
 import xxhash
 
-from ssh2 import session, sftp
+from ssh2 import sftp
+from ssh2.error_codes import LIBSSH2_ERROR_EAGAIN
+from ssh2.session import LIBSSH2_SESSION_BLOCK_INBOUND
+from ssh2.session import LIBSSH2_SESSION_BLOCK_OUTBOUND
+from ssh2.sftp_handle import SFTPAttributes
 
 from ..logs import logger
 from ..models.datafile import DataFileModel
+from .pacing import PacingController
+from .session import SESSION
+from .sshsessions import SSH_SESSION_POOL
 
 
 def GetDataChecksum(algorithm, data):
@@ -48,54 +57,37 @@ def HandleResponse(rsp):
     return data
 
 
-def CompleteUpload(server, username, apiKey, dfoId):
+def CompleteUpload(server, dfoId):
     """
     Start data file assembly from chunks
     """
-    headers = {
-        "Authorization": "ApiKey %s:%s" % (username, apiKey),
-        "Content-Type": "application/json"
-    }
-    return HandleResponse(requests.get(
+    return HandleResponse(SESSION.Get(
         "%s/api/v1/mydata_upload/%s/complete/" % (server, dfoId),
-        headers=headers))
+        timeout=SESSION.GetUploadTimeout()))
 
 
-def UploadChunk(server, username, apiKey, dfoId,
-                algorithm, contentRange, data):
+def UploadChunk(server, dfoId, algorithm, contentRange, data):
     """
     Upload single data file chunk
     """
     headers = {
-        "Authorization": "ApiKey %s:%s" % (username, apiKey),
         "Checksum": GetDataChecksum(algorithm, data),
         "Content-Range": contentRange,
         "Content-Type": "application/octet-stream"
     }
-    return HandleResponse(requests.post(
+    return HandleResponse(SESSION.Post(
         "%s/api/v1/mydata_upload/%s/upload/" % (server, dfoId),
         data=data,
-        headers=headers))
+        headers=headers,
+        timeout=SESSION.GetUploadTimeout()))
 
 
-def GetChunks(server, username, apiKey, dfoId):
+def GetChunks(server, dfoId):
     """
     Get status of chunk upload, start or continue
     """
-    headers = {
-        "Authorization": "ApiKey %s:%s" % (username, apiKey),
-        "Content-Type": "application/json"
-    }
-    return HandleResponse(requests.get(
-        "%s/api/v1/mydata_upload/%s/" % (server, dfoId),
-        headers=headers))
-
-
-def DefaultSleepIdle():
-    """
-    Time to sleep after API call failed
-    """
-    return 5
+    return HandleResponse(SESSION.Get(
+        "%s/api/v1/mydata_upload/%s/" % (server, dfoId)))
 
 
 def GetDataFileObjectId(uploadModel):
@@ -112,7 +104,7 @@ def GetDataFileObjectId(uploadModel):
     return None
 
 
-def UploadAttempt(server, username, apiKey, dfoId,
+def UploadAttempt(server, dfoId,
                   checksumAlgorithm, contentRange, binaryData,
                   currentRetry, maxUploadRetries):
     """
@@ -120,8 +112,7 @@ def UploadAttempt(server, username, apiKey, dfoId,
     """
     try:
         upload = UploadChunk(
-            server, username, apiKey, dfoId,
-            checksumAlgorithm, contentRange, binaryData)
+            server, dfoId, checksumAlgorithm, contentRange, binaryData)
     except Exception as err:
         if currentRetry <= maxUploadRetries:
             logger.error("Can't upload chunk: {}".format(str(err)))
@@ -130,55 +121,187 @@ def UploadAttempt(server, username, apiKey, dfoId,
     return upload["success"]
 
 
-def UploadFileChunked(server, username, apiKey,
-                      filePath, uploadModel, progressCallback,
-                      maxUploadRetries):
+def UploadChunkWithRetries(server, dfoId, checksumAlgorithm, contentRange,
+                           binaryData, uploadModel, maxUploadRetries, pacing):
+    """
+    Upload a chunk, retrying after the delay given by the pacing controller
+    if the upload fails.  Returns False if the upload is canceled before the
+    chunk is acknowledged.
+    """
+    currentRetry = 0
+    while not uploadModel.canceled:
+        currentRetry += 1
+        startTime = time()
+        if UploadAttempt(server, dfoId, checksumAlgorithm, contentRange,
+                         binaryData, currentRetry, maxUploadRetries):
+            pacing.OnChunkAcknowledged(len(binaryData), time() - startTime)
+            return True
+        sleep(pacing.OnChunkFailed())
+    return False
+
+
+def ReadChunk(fileObject, buffer, offset):
+    """
+    Read a chunk at offset into a reusable buffer, returning the number of
+    bytes read.  Where os.preadv is available, the file object's position
+    isn't used.
+    """
+    view = memoryview(buffer)
+    bytesRead = 0
+    while bytesRead < len(view):
+        if hasattr(os, "preadv"):
+            count = os.preadv(
+                fileObject.fileno(), [view[bytesRead:]], offset + bytesRead)
+        else:
+            fileObject.seek(offset + bytesRead)
+            count = fileObject.readinto(view[bytesRead:])
+        if not count:
+            break
+        bytesRead += count
+    return bytesRead
+
+
+def UploadFileChunked(server, filePath, uploadModel, progressCallback,
+                      maxUploadRetries, md5=None, checksumCallback=None,
+                      numThreads=1):
     """
     Upload file using chunks API
+
+    Chunks are read in order into a pool of reusable buffers, and uploaded
+    by up to numThreads threads.  A PacingController adapts the number of
+    chunks in flight and the chunk size (up to the size reported by the
+    server) to the measured goodput.  Chunks can be acknowledged out of
+    order, so the upload is only completed once every byte above the offset
+    reported by the server has been acknowledged.
+
+    If md5 (a hashlib object) is specified, it is updated with each chunk as
+    it is read for uploading (including data uploaded by a previous
+    attempt, which is read but not re-sent), and checksumCallback is called
+    with the file's MD5 sum before the upload is completed.
     """
+    # pylint: disable=too-many-locals,too-many-statements
 
     if uploadModel.dfoId is None:
         uploadModel.dfoId = GetDataFileObjectId(uploadModel)
         if uploadModel.dfoId is None:
             return False
 
-    status = GetChunks(server, username, apiKey, uploadModel.dfoId)
-
-    if not status["completed"]:
-        fileSize = os.stat(filePath).st_size
-        totalUploaded = status["offset"]
-        file = open(filePath, "rb")
-        for thisChunk in range(math.ceil(fileSize/status["size"])):
-            thisOffset = thisChunk*status["size"]
-            if thisOffset >= totalUploaded:
-                file.seek(thisOffset)
-                binaryData = file.read(status["size"])
-                progress = {
-                    "backoffSleep": DefaultSleepIdle(),
-                    "currentRetry": 0
-                }
-                while progress["backoffSleep"] > 0 and not uploadModel.canceled:
-                    progress["currentRetry"] += 1
-                    progress["success"] = UploadAttempt(
-                        server, username, apiKey, uploadModel.dfoId,
-                        status["checksum"],
-                        "%s-%s/%s" % (thisOffset, thisOffset + len(binaryData), fileSize),
-                        binaryData,
-                        progress["currentRetry"], maxUploadRetries)
-                    if progress["success"]:
-                        progress["backoffSleep"] = 0
-                        totalUploaded += len(binaryData)
-                    else:
-                        sleep(progress["backoffSleep"])
-                        progress["backoffSleep"] *= 2
-                    uploadModel.SetLatestTime(datetime.now())
-                    progressCallback(current=totalUploaded, total=fileSize)
-                if uploadModel.canceled:
-                    break
-        file.close()
+    status = GetChunks(server, uploadModel.dfoId)
+
+    if status["completed"]:
+        if md5 is not None:
+            with open(filePath, "rb") as file:
+                for data in ReadFileChunks(file, 32*1024*1024):
+                    md5.update(data)
+    else:
+        fileSize = uploadModel.fileSize
+        serverOffset = min(status["offset"], fileSize)
+        maxChunkSize = status["size"]
+        pacing = PacingController(
+            os.path.basename(filePath), maxChunkSize,
+            minChunkSize=status.get("min_size"))
+        pacing.maxWindow = max(1, min(
+            numThreads, -(-(fileSize - serverOffset) // pacing.minChunkSize)))
+        lock = threading.Lock()
+        progress = dict(
+            totalUploaded=serverOffset,
+            bytesAcknowledged=0,
+            errors=[])
+        freeBuffers = Queue()
+        for _ in range(pacing.maxWindow + 1):
+            freeBuffers.put(bytearray(maxChunkSize))
+        chunksQueue = Queue()
+
+        def UploadWorker():
+            """
+            Upload chunks from chunksQueue, returning their buffers to
+            freeBuffers once they have been sent.
+            """
+            while True:
+                task = chunksQueue.get()
+                if task is None:
+                    return
+                offset, buffer, length = task
+                try:
+                    if progress["errors"] or uploadModel.canceled:
+                        continue
+                    acknowledged = UploadChunkWithRetries(
+                        server, uploadModel.dfoId, status["checksum"],
+                        "%s-%s/%s" % (offset, offset + length, fileSize),
+                        memoryview(buffer)[:length],
+                        uploadModel, maxUploadRetries, pacing)
+                    if acknowledged:
+                        with lock:
+                            progress["bytesAcknowledged"] += length
+                            progress["totalUploaded"] += length
+                            uploadModel.SetLatestTime(datetime.now())
+                            progressCallback(
+                                current=progress["totalUploaded"],
+                                total=fileSize)
+                except Exception as err:
+                    with lock:
+                        progress["errors"].append(err)
+                finally:
+                    pacing.ReleaseSlot()
+                    freeBuffers.put(buffer)
+
+        threads = []
+        for i in range(pacing.maxWindow):
+            thread = threading.Thread(
+                name="ChunkUploadThread-%d" % (i + 1), target=UploadWorker)
+            threads.append(thread)
+            thread.start()
+        try:
+            with open(filePath, "rb") as file:
+                offset = serverOffset
+                if md5 is not None:
+                    # Read the data uploaded by a previous attempt for hashing:
+                    buffer = freeBuffers.get()
+                    for offset in range(0, serverOffset, maxChunkSize):
+                        length = ReadChunk(
+                            file, memoryview(buffer)[
+                                :min(maxChunkSize, serverOffset - offset)],
+                            offset)
+                        md5.update(memoryview(buffer)[:length])
+                    freeBuffers.put(buffer)
+                    offset = serverOffset
+                while offset < fileSize:
+                    pacing.AcquireSlot()
+                    buffer = freeBuffers.get()
+                    if progress["errors"] or uploadModel.canceled:
+                        freeBuffers.put(buffer)
+                        pacing.ReleaseSlot()
+                        break
+                    length = min(pacing.chunkSize, fileSize - offset)
+                    length = ReadChunk(
+                        file, memoryview(buffer)[:length], offset)
+                    if md5 is not None:
+                        md5.update(memoryview(buffer)[:length])
+                    if length == 0:
+                        freeBuffers.put(buffer)
+                        pacing.ReleaseSlot()
+                        break
+                    chunksQueue.put((offset, buffer, length))
+                    offset += length
+        finally:
+            for _ in threads:
+                chunksQueue.put(None)
+            for thread in threads:
+                thread.join()
+        if progress["errors"]:
+            raise progress["errors"][0]
+        if not uploadModel.canceled:
+            pacing.LogSummary()
+            if progress["bytesAcknowledged"] != fileSize - serverOffset:
+                raise Exception(
+                    "Only %s of %s bytes were acknowledged."
+                    % (progress["bytesAcknowledged"],
+                       fileSize - serverOffset))
 
     if not uploadModel.canceled:
-        CompleteUpload(server, username, apiKey, uploadModel.dfoId)
+        if checksumCallback:
+            checksumCallback(md5.hexdigest())
+        CompleteUpload(server, uploadModel.dfoId)
 
     return True
 
@@ -194,88 +317,259 @@ def ReadFileChunks(fileObject, chunkSize):
         yield data
 
 
-def GetFileMode():
-    """
-    Remote file attributes
-    """
-    return sftp.LIBSSH2_SFTP_S_IRUSR | \
-           sftp.LIBSSH2_SFTP_S_IWUSR | \
-           sftp.LIBSSH2_SFTP_S_IRGRP | \
-           sftp.LIBSSH2_SFTP_S_IROTH
+# Size of the buffers read ahead from disk for SFTP uploads.  Each buffer
+# is sent as several SFTP write requests:
+SFTP_BUFFER_SIZE = 256 * 1024
 
+# Permissions for uploaded files and the directories created for them,
+# so that MyTardis (running as a member of the group) can move them:
+REMOTE_FILE_MODE = 0o660
+REMOTE_DIR_MODE = 0o2770
 
-def ExecuteCommandOverSsh(sshSession, command):
+
+def SetRemoteMode(sftpSession, remotePath, mode, handle=None):
     """
-    Execute command over existing SSH session
+    Set the permissions of a remote file or directory over SFTP.
+    Unlike the mode given when creating a file or directory, this isn't
+    restricted by the server's umask.
     """
-    channel = sshSession.open_session()
-    channel.execute(command)
-    message = []
-    while True:
-        size, data = channel.read()
-        if len(data) != 0:
-            message.append(data)
-        if size == 0:
-            break
-    channel.close()
-    channel.wait_closed()
-    if len(message) != 0:
-        raise Exception(" ".join(message))
+    attrs = SFTPAttributes()
+    attrs.flags = sftp.LIBSSH2_SFTP_ATTR_PERMISSIONS
+    attrs.permissions = mode
+    if handle:
+        handle.fsetstat(attrs)
+    else:
+        sftpSession.setstat(remotePath, attrs)
 
 
-def GetSshSession(server, auth):
+def MakeRemoteDirs(pooled, remoteDir):
     """
-    Open connection and return SSH session
+    Create a remote directory (and its parents) over SFTP, unless it is
+    already known to exist
+    """
+    remoteDirs = SSH_SESSION_POOL.GetRemoteDirs(pooled)
+    if not remoteDir or remoteDir in remoteDirs:
+        return
+    sftpSession = pooled.GetSftp()
+    try:
+        sftpSession.stat(remoteDir)
+    except Exception:
+        parentDir = posixpath.dirname(remoteDir)
+        if parentDir != remoteDir:
+            MakeRemoteDirs(pooled, parentDir)
+        try:
+            sftpSession.mkdir(remoteDir, REMOTE_DIR_MODE)
+            SetRemoteMode(sftpSession, remoteDir, REMOTE_DIR_MODE)
+        except Exception as err:
+            # Another upload worker could have created it:
+            try:
+                sftpSession.stat(remoteDir)
+            except Exception:
+                raise Exception(
+                    "Can't create remote folder %s. %s" % (remoteDir, err))
+    remoteDirs.add(remoteDir)
+
+
+def ReadAhead(filePath, freeBuffers, filledBuffers):
     """
-    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    sock.connect(server)
+    Read a file into buffers taken from freeBuffers, putting (buffer, length)
+    tuples into filledBuffers, followed by None at the end of the file, or by
+    the exception raised while reading it.  Putting None into freeBuffers
+    stops reading early.
+    """
+    try:
+        with open(filePath, "rb") as localFile:
+            offset = 0
+            while True:
+                buffer = freeBuffers.get()
+                if buffer is None:
+                    break
+                length = ReadChunk(localFile, buffer, offset)
+                if length == 0:
+                    break
+                filledBuffers.put((buffer, length))
+                offset += length
+        filledBuffers.put(None)
+    except Exception as err:
+        filledBuffers.put(err)
 
-    sshSession = session.Session()
-    sshSession.handshake(sock)
 
-    try:
-        sshSession.userauth_publickey_fromfile(auth[0], auth[1])
-    except:
-        raise Exception("Can't open SSH key file.")
+def WaitForSocket(pooled, timeout):
+    """
+    Wait until a non-blocking session's socket is ready for reading and/or
+    writing, as required by the libssh2 call which returned EAGAIN
+    """
+    directions = pooled.session.block_directions()
+    if not directions:
+        return
+    readers = [pooled.sock] \
+        if directions & LIBSSH2_SESSION_BLOCK_INBOUND else []
+    writers = [pooled.sock] \
+        if directions & LIBSSH2_SESSION_BLOCK_OUTBOUND else []
+    select.select(readers, writers, [], timeout)
 
-    return sshSession
 
+def ReadPending(filledBuffers, pending, window, md5):
+    """
+    Append the buffers filled by ReadAhead to the pending
+    [buffer, offset, length] entries, until window buffers are pending,
+    updating md5 (a hashlib object, or None) with their data.  Only waits
+    for a buffer to be filled if none are pending.
 
-def UploadFileSsh(server, auth, filePath, remoteFilePath,
-                  uploadModel, progressCallback):
+    Returns the number of buffers appended, and whether the end of the file
+    has been reached.
     """
-    Upload file using SSH, update progress status, cancel upload if requested
+    numRead = 0
+    while len(pending) < window:
+        try:
+            item = filledBuffers.get(block=not pending)
+        except Empty:
+            break
+        if item is None:
+            return numRead, True
+        if isinstance(item, Exception):
+            raise item
+        buffer, length = item
+        if md5 is not None:
+            md5.update(memoryview(buffer)[:length])
+        pending.append([buffer, 0, length])
+        numRead += 1
+    return numRead, False
+
+
+def AcknowledgeBuffers(pending, bytesWritten, freeBuffers):
     """
-    sess = GetSshSession(server, auth)
-
+    Advance past bytesWritten acknowledged bytes of the pending
+    [buffer, offset, length] entries, returning each buffer to freeBuffers
+    once all of its data has been acknowledged
+    """
+    while bytesWritten:
+        entry = pending[0]
+        acknowledged = min(bytesWritten, entry[2] - entry[1])
+        entry[1] += acknowledged
+        bytesWritten -= acknowledged
+        if entry[1] == entry[2]:
+            pending.popleft()
+            freeBuffers.put(entry[0])
+
+
+def SendFileSftp(pooled, filePath, remoteFilePath, uploadModel,
+                 progressCallback, md5, window=1):
+    """
+    Send a file over a pooled session's SFTP channel
+
+    The file is read ahead from disk into a ring of window + 1 reusable
+    buffers (of SFTP_BUFFER_SIZE bytes) by another thread.  The session is
+    put in non-blocking mode while the file is sent, so that up to window
+    buffers of data can be in flight as SFTP write requests, rather than
+    waiting for each buffer to be acknowledged before sending the next one.
+    Each buffer is only returned to the ring once all of its data has been
+    acknowledged.
+    """
+    # pylint: disable=too-many-arguments,too-many-locals
+    MakeRemoteDirs(pooled, posixpath.dirname(remoteFilePath))
+    sftpSession = pooled.GetSftp()
+    fileSize = os.stat(filePath).st_size
+    remoteFile = sftpSession.open(
+        remoteFilePath,
+        sftp.LIBSSH2_FXF_WRITE | sftp.LIBSSH2_FXF_CREAT |
+        sftp.LIBSSH2_FXF_TRUNC,
+        REMOTE_FILE_MODE)
+    window = max(1, window)
+    freeBuffers = Queue()
+    for _ in range(window + 1):
+        freeBuffers.put(bytearray(SFTP_BUFFER_SIZE))
+    filledBuffers = Queue()
+    reader = threading.Thread(
+        name="SftpReadAheadThread", target=ReadAhead,
+        args=(filePath, freeBuffers, filledBuffers))
+    reader.start()
     try:
-        ExecuteCommandOverSsh(sess, "mkdir -m 2770 -p %s" % os.path.dirname(remoteFilePath))
-    except Exception as err:
-        raise Exception("Can't create remote folder. %s" % str(err))
-
-    fileInfo = os.stat(filePath)
-    channel = sess.scp_send64(remoteFilePath, GetFileMode(),
-                              fileInfo.st_size, fileInfo.st_mtime, fileInfo.st_atime)
-
-    totalUploaded = 0
-    with open(filePath, "rb") as localFile:
-        for data in ReadFileChunks(localFile, 32*1024*1024):
-            _, bytesWritten = channel.write(data)
-            totalUploaded += bytesWritten
-            uploadModel.SetLatestTime(datetime.now())
-            progressCallback(current=totalUploaded, total=fileInfo.st_size)
-            if uploadModel.canceled:
+        SetRemoteMode(sftpSession, remoteFilePath, REMOTE_FILE_MODE,
+                      handle=remoteFile)
+        pooled.session.set_blocking(False)
+        # The buffers which have been read, but not yet acknowledged by the
+        # server, as [buffer, offset, length] entries.  Each write call must
+        # begin with the first unacknowledged byte, and sends any data which
+        # hasn't been sent yet.  ssh2-python's write only accepts bytes, so
+        # the unacknowledged data is joined into one bytes object, which is
+        # only rebuilt after data has been acknowledged or read:
+        pending = deque()
+        data = None
+        endOfFile = False
+        totalUploaded = 0
+        lastReported = 0
+        while not uploadModel.canceled:
+            if not endOfFile and len(pending) < window:
+                numRead, endOfFile = ReadPending(
+                    filledBuffers, pending, window, md5)
+                if numRead:
+                    data = None
+            if not pending:
                 break
+            if data is None:
+                data = b"".join(
+                    memoryview(buffer)[offset:length]
+                    for buffer, offset, length in pending)
+            returnCode, bytesWritten = remoteFile.write(data)
+            if bytesWritten:
+                AcknowledgeBuffers(pending, bytesWritten, freeBuffers)
+                data = None
+                totalUploaded += bytesWritten
+                if totalUploaded - lastReported >= SFTP_BUFFER_SIZE or \
+                        totalUploaded == fileSize:
+                    lastReported = totalUploaded
+                    uploadModel.SetLatestTime(datetime.now())
+                    progressCallback(current=totalUploaded, total=fileSize)
+            if returnCode == LIBSSH2_ERROR_EAGAIN and \
+                    (endOfFile or filledBuffers.empty() or
+                     len(pending) >= window):
+                WaitForSocket(pooled, 1.0)
+    finally:
+        freeBuffers.put(None)
+        reader.join()
+        pooled.session.set_blocking(True)
+        remoteFile.close()
 
-    channel.send_eof()
-    channel.wait_eof()
 
-    channel.close()
-    channel.wait_closed()
+def UploadFileSsh(server, auth, filePath, remoteFilePath,
+                  uploadModel, progressCallback, md5=None,
+                  checksumCallback=None, window=1):
+    """
+    Upload file using SSH, update progress status, cancel upload if requested
 
-    try:
-        ExecuteCommandOverSsh(sess, "chmod 660 %s" % remoteFilePath)
-    except Exception as err:
-        raise Exception("Can't set remote file permissions. %s" % str(err))
+    The file is sent over SFTP on a pooled session, which also creates the
+    remote directory (if necessary) and sets the file's permissions, so no
+    remote commands need to be run.  If the upload fails on a reused
+    session, it is retried once on a new session.
+
+    Up to window buffers (of SFTP_BUFFER_SIZE bytes) can be in flight at
+    once, see SendFileSftp.
 
-    sess.disconnect()
+    If md5 (a hashlib object) is specified, it is updated with each buffer
+    as it is sent, and checksumCallback is called with the file's MD5 sum
+    once the whole file has been sent.
+    """
+    initialMd5 = md5.copy() if md5 is not None else None
+    new = False
+    while True:
+        pooled = SSH_SESSION_POOL.Acquire(
+            server[0], server[1], auth[0], auth[1], new=new)
+        try:
+            SendFileSftp(pooled, filePath, remoteFilePath, uploadModel,
+                         progressCallback, md5, window=window)
+        except Exception as err:
+            SSH_SESSION_POOL.Release(pooled, healthy=False)
+            if pooled.numUses > 1 and not uploadModel.canceled:
+                logger.warning(
+                    "Upload failed on a reused SSH session, retrying on a "
+                    "new session: %s" % str(err))
+                md5 = initialMd5.copy() if md5 is not None else None
+                new = True
+                continue
+            raise
+        SSH_SESSION_POOL.Release(pooled)
+        break
+
+    if checksumCallback and not uploadModel.canceled:
+        checksumCallback(md5.hexdigest())
@@ -0,0 +1,284 @@
+"""
+Watching the data directory for new files, for the "Watch" schedule type.
+
+On Linux, FolderWatcher uses inotify (via ctypes) to be notified when files
+are closed after writing, or moved into the data directory.  Elsewhere, or
+if inotify is unavailable (or disabled, e.g. for network shares, where
+changes made by other hosts don't generate inotify events), the data
+directory is polled periodically instead.
+
+A file is only reported once it has settled, i.e. once its size and
+modified time haven't changed for the watch_settle_time interval.
+"""
+import ctypes
+import ctypes.util
+import os
+import select
+import struct
+import sys
+import threading
+import time
+import traceback
+
+from ..logs import logger
+from .scanner import ScanFolder
+from .scanner import StatFile
+
+# inotify event masks, from <sys/inotify.h>:
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+WATCH_MASK = IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE
+EVENT_HEADER = struct.Struct("iIII")
+
+
+class Inotify(object):
+    """
+    Minimal ctypes wrapper for Linux's inotify API.
+    """
+    def __init__(self):
+        libcName = ctypes.util.find_library("c") or "libc.so.6"
+        self.libc = ctypes.CDLL(libcName, use_errno=True)
+        self.inotifyFd = self.libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.inotifyFd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self.paths = dict()
+
+    def AddWatch(self, dirPath):
+        """
+        Watch a directory (not recursively).
+        """
+        watchDescriptor = self.libc.inotify_add_watch(
+            self.inotifyFd, os.fsencode(dirPath), WATCH_MASK)
+        if watchDescriptor < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), dirPath)
+        self.paths[watchDescriptor] = dirPath
+
+    def ReadEvents(self, timeout):
+        """
+        Wait up to timeout seconds for events, returning a list of
+        (mask, path) tuples.
+        """
+        readable, _, _ = select.select([self.inotifyFd], [], [], timeout)
+        if not readable:
+            return []
+        try:
+            data = os.read(self.inotifyFd, 65536)
+        except BlockingIOError:
+            return []
+        events = []
+        offset = 0
+        while offset < len(data):
+            watchDescriptor, mask, _, nameLength = \
+                EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + nameLength].rstrip(b"\0")
+            offset += nameLength
+            if mask & IN_IGNORED:
+                self.paths.pop(watchDescriptor, None)
+                continue
+            dirPath = self.paths.get(watchDescriptor)
+            if mask & IN_Q_OVERFLOW or dirPath is None:
+                events.append((mask, None))
+                continue
+            events.append((mask, os.path.join(dirPath, os.fsdecode(name))))
+        return events
+
+    def Close(self):
+        """
+        Close the inotify file descriptor.
+        """
+        os.close(self.inotifyFd)
+
+
+class FolderWatcher(object):
+    """
+    Watches a directory tree in a background thread, calling
+    onSettledFiles with a list of (path, fileStat) tuples for files
+    which have been created or modified (and then have settled) since the
+    watcher was started.
+
+    Files which already existed when the watcher was started aren't
+    reported unless they are modified.
+    """
+    # pylint: disable=too-many-instance-attributes
+    def __init__(self, rootPath, onSettledFiles, settleTime=10.0,
+                 pollInterval=30.0, useInotify=True):
+        self.rootPath = rootPath
+        self.onSettledFiles = onSettledFiles
+        self.settleTime = settleTime
+        self.pollInterval = pollInterval
+        self.useInotify = useInotify and sys.platform.startswith("linux")
+        self.inotify = None
+        # Files which have changed, but haven't settled yet, mapped to
+        # [time of last change, closed after writing, last FileStat]:
+        self.candidates = dict()
+        self.knownFiles = dict()
+        self.stopped = threading.Event()
+        self.thread = None
+
+    @property
+    def method(self):
+        """
+        "inotify" or "polling"
+        """
+        return "inotify" if self.inotify else "polling"
+
+    def Start(self):
+        """
+        Start watching, in a background thread.
+        """
+        if self.useInotify:
+            try:
+                self.inotify = Inotify()
+                self.WatchDirectory(self.rootPath, newDirectory=False)
+            except (OSError, AttributeError) as err:
+                logger.warning(
+                    "Couldn't watch %s with inotify (%s), so it will be "
+                    "polled instead." % (self.rootPath, err))
+                if self.inotify:
+                    self.inotify.Close()
+                self.inotify = None
+        if not self.inotify:
+            self.knownFiles = self.Poll()
+        logger.info("Watching %s for new files (%s)."
+                    % (self.rootPath, self.method))
+        self.thread = threading.Thread(
+            target=self.Run, name="FolderWatcherThread")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def Stop(self):
+        """
+        Stop watching, and wait for the background thread to finish.
+        """
+        self.stopped.set()
+        if self.thread and self.thread != threading.current_thread():
+            self.thread.join()
+        logger.info("Stopped watching %s for new files." % self.rootPath)
+
+    def Run(self):
+        """
+        The background thread's main loop.
+        """
+        try:
+            while not self.stopped.isSet():
+                if self.inotify:
+                    timeout = min(1.0, self.settleTime)
+                    for mask, path in self.inotify.ReadEvents(timeout):
+                        self.HandleEvent(mask, path)
+                else:
+                    self.stopped.wait(
+                        min(self.pollInterval, self.settleTime))
+                    if self.stopped.isSet():
+                        break
+                    self.HandlePoll(self.Poll())
+                settled = self.GetSettledFiles()
+                if settled and not self.stopped.isSet():
+                    self.onSettledFiles(settled)
+        except:
+            logger.error(traceback.format_exc())
+        finally:
+            if self.inotify:
+                self.inotify.Close()
+                self.inotify = None
+
+    def WatchDirectory(self, dirPath, newDirectory=True):
+        """
+        Add inotify watches for a directory and its subdirectories.
+
+        Files already present in a new directory (e.g. one moved into
+        the data directory, or created before its watch was added)
+        are treated as changed files.
+        """
+        for dirEntry in os.walk(dirPath):
+            self.inotify.AddWatch(dirEntry[0])
+            if newDirectory:
+                for filename in dirEntry[2]:
+                    self.FileChanged(
+                        os.path.join(dirEntry[0], filename), closed=True)
+
+    def HandleEvent(self, mask, path):
+        """
+        Handle one inotify event.
+        """
+        if path is None:
+            logger.warning("inotify event queue overflowed, so checking "
+                           "all files in %s." % self.rootPath)
+            self.WatchDirectory(self.rootPath)
+            return
+        if mask & IN_ISDIR:
+            if mask & (IN_CREATE | IN_MOVED_TO):
+                try:
+                    self.WatchDirectory(path)
+                except OSError as err:
+                    logger.warning("Couldn't watch %s: %s" % (path, err))
+            return
+        self.FileChanged(path, closed=bool(mask & (IN_CLOSE_WRITE |
+                                                   IN_MOVED_TO)))
+
+    def FileChanged(self, path, closed):
+        """
+        Record activity for a file which hasn't settled yet.
+        """
+        candidate = self.candidates.get(path)
+        if candidate:
+            candidate[0] = time.time()
+            candidate[1] = candidate[1] or closed
+        else:
+            self.candidates[path] = [time.time(), closed, None]
+
+    def Poll(self):
+        """
+        Return a dictionary mapping each file's path to its FileStat.
+        """
+        files = dict()
+        for dirPath, filename, fileStat in ScanFolder(self.rootPath):
+            files[os.path.join(dirPath, filename)] = fileStat
+        return files
+
+    def HandlePoll(self, files):
+        """
+        Compare a new poll with the previous one.
+        """
+        for path, fileStat in files.items():
+            known = self.knownFiles.get(path)
+            if not known or known.size != fileStat.size or \
+                    known.mtimeNs != fileStat.mtimeNs:
+                self.FileChanged(path, closed=True)
+        self.knownFiles = files
+
+    def GetSettledFiles(self):
+        """
+        Return (path, fileStat) tuples for files whose size and modified
+        time haven't changed for the settle time, removing them from the
+        candidates.
+        """
+        settled = []
+        now = time.time()
+        for path in list(self.candidates.keys()):
+            lastChanged, closed, lastStat = self.candidates[path]
+            if not closed or now - lastChanged < self.settleTime:
+                continue
+            fileStat = StatFile(path)
+            if fileStat is None:
+                # Deleted (or renamed) before it settled:
+                del self.candidates[path]
+            elif (lastStat and fileStat.size == lastStat.size and
+                  fileStat.mtimeNs == lastStat.mtimeNs) or \
+                    now - fileStat.mtime >= self.settleTime:
+                del self.candidates[path]
+                settled.append((path, fileStat))
+            else:
+                # Check again after another settle interval:
+                self.candidates[path] = [now, closed, fileStat]
+        return settled
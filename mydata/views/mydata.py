@@ -286,7 +286,7 @@ class MyDataFrame(wx.Frame):
         which will ask the user to confirm they want to exit MyData, and
         quit if requested.
 
-        If the schedule type is "Once", "Daily", "Weekly" or "Timer",
+        If the schedule type is "Once", "Daily", "Weekly", "Timer" or "Watch",
         closing the window will just minimize MyData to its system tray icon.
         """
         event.StopPropagation()
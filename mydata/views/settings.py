@@ -255,7 +255,7 @@ class SettingsDialog(wx.Dialog):
                                                       "Schedule type"))
 
         choices = ["On Startup", "On Settings Saved", "Manually",
-                   "Once", "Daily", "Weekly", "Timer"]
+                   "Once", "Daily", "Weekly", "Timer", "Watch"]
         self.scheduleTypeComboBox = wx.ComboBox(self.scheduleTypePanel,
                                                 choices=choices,
                                                 style=wx.CB_READONLY)